@@ -37,10 +37,38 @@ def create_app():
         'pool_size': int(os.getenv('SQLALCHEMY_POOL_SIZE', '5')),
         'max_overflow': int(os.getenv('SQLALCHEMY_MAX_OVERFLOW', '10')),
     }
+    # Pool checkout wait/overflow metrics (no-op without prometheus_client)
+    from app.utils import metrics
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'].update(metrics.engine_options())
+
+    # Cache: Redis when configured, otherwise per-process memory.
+    # app/utils/caching.py layers a local L1 and tag invalidation on top.
+    cache_redis_url = os.getenv('CACHE_REDIS_URL') or os.getenv('REDIS_URL')
+    app.config['CACHE_TYPE'] = os.getenv('CACHE_TYPE') or ('RedisCache' if cache_redis_url else 'SimpleCache')
+    app.config['CACHE_REDIS_URL'] = cache_redis_url
+    app.config['CACHE_KEY_PREFIX'] = os.getenv('CACHE_KEY_PREFIX', 'paycrypt:')
+    app.config['CACHE_DEFAULT_TIMEOUT'] = int(os.getenv('CACHE_DEFAULT_TIMEOUT', '300'))
 
     # Init extensions
     db.init_app(app)
+    metrics.init_app(app)
+    from app.utils import tracing
+    tracing.init_app(app)
+    from app.utils import query_stats
+    query_stats.init_app(app)
+    from app.utils.slow_queries import slow_query_sampler
+    slow_query_sampler.init_app(app)
+    from app.utils.entity_graph import entity_graph
+    entity_graph.init_app(app)
     login_manager.init_app(app)
+    cache.init_app(app)
+    from app.utils import caching  # noqa: F401  (registers commit-time tag invalidation)
+    from app.utils.cache_bus import cache_bus
+    cache_bus.init_app(app)
+    from app.utils.memory_diagnostics import memory_diagnostics
+    memory_diagnostics.init_app(app)
+    from app.utils import settings_snapshot  # noqa: F401  (registers settings version bumps)
+    from app.utils import entitlements  # noqa: F401  (invalidates compiled entitlements on package changes)
     
     # For development - disable CSRF for API testing
     app.config['WTF_CSRF_ENABLED'] = False
@@ -56,27 +84,10 @@ def create_app():
     migrate = Migrate(app, db)
 
 
-    # Flask-Login user loader for both Client and User
-    from app.models import Client, User
-    @login_manager.user_loader
-    def load_user(user_id):
-        # Check if user_id contains type prefix
-        if isinstance(user_id, str):
-            if user_id.startswith('user_'):
-                # Load as User
-                actual_id = int(user_id.replace('user_', ''))
-                return User.query.get(actual_id)
-            elif user_id.startswith('client_'):
-                # Load as Client
-                actual_id = int(user_id.replace('client_', ''))
-                return Client.query.get(actual_id)
-        
-        # Fallback: try to load as User first (for admin)
-        user = User.query.get(int(user_id))
-        if user:
-            return user
-        # If not found as User, try as Client
-        return Client.query.get(int(user_id))
+    # Flask-Login user loader for both Client and User (typed ids, eager
+    # relationships, short-TTL identity cache)
+    from app.utils.identity import load_user
+    login_manager.user_loader(load_user)
 
     # Custom unauthorized handler for Flask-Login
     from flask import redirect, request, url_for
@@ -152,5 +163,10 @@ def create_app():
     
     app.config.setdefault('CHECKOUT_HOST', os.getenv('CHECKOUT_HOST', '').rstrip('/') or None)
 
+    # Background jobs (audit partitions, usage compaction, commission snapshots)
+    # run in their own process: flask run-scheduler
+    from app.utils import scheduled_tasks
+    scheduled_tasks.init_app(app)
+
     return app
 # Placeholder for __init__.py
@@ -2,6 +2,11 @@
 
 class FeatureAccessMixin:
     def has_feature(self, feature_name):
+        # Mapped clients use the compiled per-package entitlements
+        if getattr(self, 'id', None) is not None and hasattr(self, 'package_id'):
+            from app.utils.entitlements import entitlements_for_package
+            return entitlements_for_package(self.package_id).has(feature_name)
+
         # Check for flat_rate client type and enterprise package
         package = getattr(self, 'package', None)
         # Accept both direct attribute and relationship
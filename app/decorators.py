@@ -43,6 +43,19 @@ def client_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def feature_required(feature_key):
+    """Require the current client's package to include ``feature_key``"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            from app.utils.entitlements import entitlements_for
+            if not current_user.is_authenticated or not entitlements_for(current_user).has(feature_key):
+                flash("This feature is not included in your package.", "warning")
+                return redirect(url_for('client.client_dashboard'))
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
 def commission_client_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
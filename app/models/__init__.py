@@ -9,11 +9,12 @@ BaseModel = db.Model
 from app.models.enums import PaymentStatus, AuditActionType, CommissionSnapshottingType, ClientEntityType, SettingType, SettingKey
 
 # Import models that don't have foreign key dependencies first
-from app.models.api_usage import ApiUsage
+from app.models.api_usage import ApiUsage, ApiUsageHourly, UsageRollupState, ApiKeyUsageBaseline
 from app.models.document import Document
 from app.models.notification import NotificationPreference, NotificationType, NotificationEvent
-from app.models.report import Report, ReportType, ReportStatus
-from app.models.audit import AuditTrail
+from app.models.report import Report, ReportType, ReportStatus, ReportFormat
+from app.models.audit import AuditTrail, SecurityEvent, ApiUsageEvent
+from app.models.entity_link import EntityLink, EntityRiskFlag
 
 # For backward compatibility
 AuditLog = AuditTrail
@@ -73,7 +74,8 @@ from app.models.support_ticket import SupportTicket
 from app.models.feature import Feature
 from app.models.client_package import ClientPackage, PackageFeature, ClientSubscription, ClientType
 from app.models.package_payment import PackageActivationPayment, FlatRateSubscriptionPayment, SubscriptionBillingCycle, SubscriptionStatus
-from app.models.setting import Setting
+from app.models.setting import Setting, SettingsVersion
+from app.models.slow_query import SlowQuery
 
 # Import wallet provider models
 from app.models.wallet_provider import WalletProvider, WalletProviderCurrency, WalletBalance, WalletProviderTransaction
@@ -99,12 +101,13 @@ __all__ = [
     'Withdrawal', 'WithdrawalRequest', 'WithdrawalStatus',
     'Document', 
     'NotificationPreference', 'NotificationType', 'NotificationEvent',
-    'Report', 'ReportType', 'ReportStatus',
-    'AuditTrail', 'AuditLog', 
+    'Report', 'ReportType', 'ReportStatus', 'ReportFormat',
+    'AuditTrail', 'AuditLog', 'SecurityEvent', 'ApiUsageEvent', 
     'Transaction',
-    'ApiUsage', 
+    'ApiUsage', 'ApiUsageHourly', 'UsageRollupState',
     'CommissionSnapshot', 'CommissionSnapshottingType',
-    'Setting',
+    'Setting', 'SettingsVersion',
+    'SlowQuery',
     'Currency', 'ClientBalance', 'ClientCommission', 'CurrencyRate',
     
     # Enums
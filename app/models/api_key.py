@@ -5,6 +5,8 @@ Enhanced for Commission-Based vs Flat-Rate Client Models
 from datetime import datetime, timedelta
 from app.extensions import db
 from .base import BaseModel
+import hashlib
+import hmac
 import secrets
 import string
 from enum import Enum
@@ -71,9 +73,8 @@ class ClientApiKey(BaseModel):
     
     # Key details
     name = db.Column(db.String(100), nullable=False)  # User-friendly name
-    key = db.Column(db.String(64), unique=True, nullable=False)  # The actual API key
     key_prefix = db.Column(db.String(12), nullable=False)  # First 8 chars for display
-    key_hash = db.Column(db.String(128), nullable=False)  # Hashed version for security
+    key_hash = db.Column(db.String(128), unique=True, index=True, nullable=False)  # SHA-256 hex digest, used for lookup
     
     # Enhanced permissions with client type awareness
     permissions = db.Column(db.JSON, default=list)
@@ -111,22 +112,56 @@ class ClientApiKey(BaseModel):
         # Generate 32 random bytes, encode as hex = 64 character string
         return secrets.token_hex(32)
     
+    # Full key of a freshly created instance, shown once; only key_prefix/key_hash are stored
+    plaintext_key = None
+    
     @staticmethod
     def generate_key_prefix(key):
         """Generate display prefix from key"""
         return key[:8] + '...'
     
+    @property
+    def display_prefix(self):
+        """First characters of the key, without the trailing ellipsis"""
+        return (self.key_prefix or '').rstrip('.')
+    
     @staticmethod
     def hash_key(key):
-        """Hash the API key for secure storage"""
-        from werkzeug.security import generate_password_hash
-        return generate_password_hash(key)
+        """
+        Digest the API key for storage and lookup.
+        
+        API keys are 256-bit random tokens, so a fast SHA-256 digest is enough;
+        a slow password hash would make every authenticated request pay for it
+        and cannot be looked up by index.
+        """
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
     
-    @staticmethod
-    def verify_key(key, key_hash):
-        """Verify an API key against stored hash"""
-        from werkzeug.security import check_password_hash
-        return check_password_hash(key_hash, key)
+    @classmethod
+    def verify_key(cls, key, key_hash):
+        """Verify an API key against a stored digest in constant time"""
+        if not key or not key_hash:
+            return False
+        return hmac.compare_digest(cls.hash_key(key), key_hash)
+    
+    @classmethod
+    def find_by_key(cls, key, active_only=True):
+        """
+        Look up an API key by its presented value.
+        
+        Uses a single indexed equality lookup on ``key_hash``.
+        
+        Returns:
+            ClientApiKey or None
+        """
+        if not key:
+            return None
+        query = cls.query.filter_by(key_hash=cls.hash_key(key))
+        if active_only:
+            query = query.filter_by(is_active=True)
+        key_record = query.first()
+        if key_record is None or not cls.verify_key(key, key_record.key_hash):
+            return None
+        return key_record
     
     @classmethod
     def create_key(cls, client_id, name, permissions=None, rate_limit=60, expires_days=None, created_by_admin_id=None):
@@ -142,7 +177,6 @@ class ClientApiKey(BaseModel):
         api_key = cls(
             client_id=client_id,
             name=name,
-            key=key,  # We store the key temporarily for returning to admin
             key_prefix=key_prefix,
             key_hash=key_hash,
             permissions=permissions or [],
@@ -150,6 +184,7 @@ class ClientApiKey(BaseModel):
             expires_at=expires_at,
             created_by_admin_id=created_by_admin_id
         )
+        api_key.plaintext_key = key
         
         db.session.add(api_key)
         db.session.commit()
@@ -172,7 +207,6 @@ class ClientApiKey(BaseModel):
         api_key = cls(
             client_id=client_id,
             name=name,
-            key=key,  # We store the key temporarily for returning to admin
             key_prefix=key_prefix,
             key_hash=key_hash,
             permissions=permissions or [],
@@ -180,6 +214,7 @@ class ClientApiKey(BaseModel):
             expires_at=expires_at,
             created_by_admin_id=created_by_admin_id
         )
+        api_key.plaintext_key = key
         
         db.session.add(api_key)
         db.session.commit()
@@ -201,7 +236,6 @@ class ClientApiKey(BaseModel):
         api_key = cls(
             client_id=client.id,
             name=name,
-            key=key,  # Store the full key temporarily for returning to user
             key_prefix=key_prefix,
             key_hash=key_hash,
             permissions=permissions or [],
@@ -210,6 +244,7 @@ class ClientApiKey(BaseModel):
             secret_key=secret_key,
             webhook_secret=webhook_secret
         )
+        api_key.plaintext_key = key
         
         return api_key
     
@@ -244,7 +279,6 @@ class ClientApiKey(BaseModel):
         api_key = cls(
             client_id=client.id,
             name=name,
-            key=key,  # Store the full key temporarily for returning to user
             key_prefix=key_prefix,
             key_hash=key_hash,
             permissions=filtered_permissions,
@@ -254,6 +288,7 @@ class ClientApiKey(BaseModel):
             webhook_secret=webhook_secret,
             secret_key=secret_key
         )
+        api_key.plaintext_key = key
         
         return api_key
     
@@ -311,10 +346,15 @@ class ClientApiKey(BaseModel):
             return 1000  # Flat-rate clients: max 1000 req/min
     
     def is_ip_allowed(self, ip_address):
-        """Check if IP address is allowed (for flat-rate clients with IP restrictions)"""
+        """Check if IP address is allowed (for flat-rate clients with IP restrictions)
+        
+        ``allowed_ips`` may hold single addresses and CIDR networks (IPv4 or
+        IPv6); the list is compiled once into a cached prefix matcher.
+        """
         if not self.allowed_ips:
             return True  # No restrictions
-        return ip_address in self.allowed_ips
+        from app.utils.ip_matcher import compile_ip_list
+        return compile_ip_list(self.allowed_ips).match(ip_address)
     
     def generate_webhook_signature(self, payload):
         """Generate HMAC signature for webhook verification (flat-rate clients)"""
@@ -350,6 +390,9 @@ class ClientApiKey(BaseModel):
 class ApiKeyUsageLog(BaseModel):
     """Log API key usage for monitoring and security"""
     __tablename__ = 'api_key_usage_logs'
+    __table_args__ = (
+        db.Index('ix_api_key_usage_logs_created_at', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     api_key_id = db.Column(db.Integer, db.ForeignKey('client_api_keys.id'), nullable=False)
@@ -3,6 +3,9 @@ from ..extensions import db
 
 class ApiUsage(db.Model):
     __tablename__ = 'api_usage'
+    __table_args__ = (
+        db.Index('ix_api_usage_timestamp', 'timestamp'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     client_id = db.Column(db.Integer, db.ForeignKey('clients.id'), nullable=False)
@@ -22,17 +25,88 @@ class ApiUsage(db.Model):
     @classmethod
     def get_usage_count(cls, client_id, month, year):
         """Get API usage count for a specific client, month, and year"""
-        from sqlalchemy import extract, func
-        return cls.query.filter(
+        from sqlalchemy import func
+        start = datetime(year, month, 1)
+        end = datetime(year + month // 12, month % 12 + 1, 1)
+
+        # Compacted hours come from the rollups, the rest from raw rows not yet compacted
+        rolled_up = db.session.query(func.sum(ApiUsageHourly.request_count)).filter(
+            ApiUsageHourly.source == cls.__tablename__,
+            ApiUsageHourly.client_id == client_id,
+            ApiUsageHourly.bucket_start >= start,
+            ApiUsageHourly.bucket_start < end
+        ).scalar() or 0
+
+        compacted_until = UsageRollupState.compacted_until_for(cls.__tablename__)
+        raw = cls.query.filter(
             cls.client_id == client_id,
-            extract('month', cls.timestamp) == month,
-            extract('year', cls.timestamp) == year
+            cls.timestamp >= (max(start, compacted_until) if compacted_until else start),
+            cls.timestamp < end
         ).count()
+        return int(rolled_up) + raw
 
     @classmethod
     def get_last_call(cls, client_id):
         """Get the last API call timestamp for a specific client"""
-        last_usage = cls.query.filter_by(client_id=client_id)\
-            .order_by(cls.timestamp.desc())\
-            .first()
-        return last_usage.timestamp if last_usage else None
+        from sqlalchemy import func
+        last_call = db.session.query(func.max(cls.timestamp)).filter(cls.client_id == client_id).scalar()
+        if last_call is None:
+            # Compacted raw rows are pruned; the rollups know the hour of the last call
+            last_call = db.session.query(func.max(ApiUsageHourly.bucket_start)).filter(
+                ApiUsageHourly.source == cls.__tablename__,
+                ApiUsageHourly.client_id == client_id
+            ).scalar()
+        return last_call
+
+
+class ApiUsageHourly(db.Model):
+    """Hourly per-key/per-endpoint rollup of raw API usage rows (see app/utils/usage_rollup.py)"""
+    __tablename__ = 'api_usage_hourly'
+    __table_args__ = (
+        db.Index('ix_api_usage_hourly_client_bucket', 'client_id', 'bucket_start'),
+        db.Index('ix_api_usage_hourly_key_bucket', 'api_key_id', 'bucket_start'),
+        db.Index('ix_api_usage_hourly_bucket_source', 'bucket_start', 'source'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    source = db.Column(db.String(32), nullable=False)  # Raw table the rows came from
+    client_id = db.Column(db.Integer, nullable=True)
+    api_key_id = db.Column(db.Integer, nullable=True)
+    api_key_hash = db.Column(db.String(16), nullable=True)
+    endpoint = db.Column(db.String(255), nullable=False)
+    method = db.Column(db.String(10), nullable=False)
+
+    request_count = db.Column(db.Integer, nullable=False, default=0)
+    error_count = db.Column(db.Integer, nullable=False, default=0)  # status >= 400
+    throttled_count = db.Column(db.Integer, nullable=False, default=0)  # status 429
+    bytes_in = db.Column(db.BigInteger, nullable=False, default=0)
+    bytes_out = db.Column(db.BigInteger, nullable=False, default=0)
+    latency_sketch = db.Column(db.JSON)  # LatencySketch.to_dict()
+    p50_ms = db.Column(db.Float)
+    p95_ms = db.Column(db.Float)
+
+    def __repr__(self):
+        return f'<ApiUsageHourly {self.bucket_start} {self.method} {self.endpoint} x{self.request_count}>'
+
+
+class UsageRollupState(db.Model):
+    """Raw rows stamped before ``compacted_until`` are folded into the rollups, per source table"""
+    __tablename__ = 'usage_rollup_state'
+
+    source = db.Column(db.String(32), primary_key=True)
+    compacted_until = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @classmethod
+    def compacted_until_for(cls, source):
+        return db.session.query(cls.compacted_until).filter(cls.source == source).scalar()
+
+
+class ApiKeyUsageBaseline(db.Model):
+    """Checkpointed streaming usage baseline per API key (see app/utils/usage_anomaly.py)"""
+    __tablename__ = 'api_key_usage_baselines'
+
+    api_key_id = db.Column(db.Integer, primary_key=True)
+    state = db.Column(db.JSON, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
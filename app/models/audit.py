@@ -1,6 +1,13 @@
 from ..extensions import db
-from datetime import datetime
+from datetime import datetime, date
+from decimal import Decimal
 from enum import Enum
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+# session.info key holding audit rows queued during the current transaction
+PENDING_AUDIT_KEY = 'pending_audit_rows'
+REDACTED = '***'
 
 class AuditActionType(Enum):
     CREATE = 'create'
@@ -121,3 +128,183 @@ class AuditTrail(db.Model):
                         'new': self.new_value.get(key)
                     })
         return changes
+
+
+def _json_safe(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _json_safe(v) for k, v in value.items()}
+    return value
+
+
+def changed_attributes(target, ignore=(), redact=()):
+    """
+    Collect column changes on ``target`` from SQLAlchemy attribute history.
+
+    Args:
+        target: Mapped instance being flushed
+        ignore: Column attribute names not worth auditing
+        redact: Column attribute names whose values must not be stored
+
+    Returns:
+        tuple: (old_values, new_values) dicts, empty when nothing relevant changed
+    """
+    state = inspect(target)
+    old_values, new_values = {}, {}
+    for attr in state.mapper.column_attrs:
+        key = attr.key
+        if key in ignore:
+            continue
+        history = state.attrs[key].history
+        if not history.has_changes():
+            continue
+        old = history.deleted[0] if history.deleted else None
+        new = history.added[0] if history.added else None
+        if old == new:
+            continue
+        if key in redact:
+            old, new = REDACTED, REDACTED
+        old_values[key] = _json_safe(old)
+        new_values[key] = _json_safe(new)
+    return old_values, new_values
+
+
+def track_previous_values(model, ignore=()):
+    """
+    Make ``changed_attributes`` see real old values for ``model``.
+
+    Column sets normally don't load the previous value of an expired
+    attribute; active history loads it so the audit diff has both sides.
+    """
+    def _noop(target, value, oldvalue, initiator):
+        return value
+
+    # mapper.columns is keyed by attribute name and doesn't force mapper configuration
+    for key in inspect(model).columns.keys():
+        if key not in ignore:
+            event.listen(getattr(model, key), 'set', _noop, active_history=True, retval=True)
+
+
+def queue_audit_row(session, user_id, action_type, entity_type, entity_id,
+                    old_value=None, new_value=None):
+    """
+    Queue an AuditTrail row to be written when ``session`` commits.
+
+    Safe to call from mapper events (no Session.add during flush); all rows
+    queued in a transaction are written with one executemany insert.
+    """
+    if session is None or user_id is None:
+        return
+    from flask import has_request_context, request
+
+    ip_address = user_agent = None
+    if has_request_context():
+        ip_address = request.remote_addr
+        user_agent = (request.headers.get('User-Agent') or '')[:255] or None
+
+    session.info.setdefault(PENDING_AUDIT_KEY, []).append({
+        'user_id': user_id,
+        'action_type': action_type,
+        'entity_type': entity_type,
+        'entity_id': entity_id,
+        'old_value': old_value,
+        'new_value': new_value,
+        'ip_address': ip_address,
+        'user_agent': user_agent,
+        'created_at': datetime.utcnow()
+    })
+
+
+@event.listens_for(Session, 'before_commit')
+def _write_pending_audit_rows(session):
+    # Flush first so mapper events for the final changes queue their rows too
+    session.flush()
+    rows = session.info.pop(PENDING_AUDIT_KEY, None)
+    if rows:
+        session.connection().execute(AuditTrail.__table__.insert(), rows)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_pending_audit_rows(session, previous_transaction):
+    if not session.in_transaction():
+        session.info.pop(PENDING_AUDIT_KEY, None)
+
+
+class SecurityEvent(db.Model):
+    """
+    Security events (failed signatures, rate limit hits, fraud flags, ...).
+
+    On PostgreSQL the table is range-partitioned by month on ``created_at``
+    (see app/utils/audit_partitions.py), so ``id`` is only unique together
+    with ``created_at`` there.
+    """
+    __tablename__ = 'security_events'
+    __table_args__ = (
+        db.Index('ix_security_events_severity_created_at', 'severity', 'created_at'),
+        db.Index('ix_security_events_event_type_created_at', 'event_type', 'created_at'),
+        db.Index('ix_security_events_actor_created_at', 'actor_type', 'actor_id', 'created_at'),
+    )
+
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    event_type = db.Column(db.String(64), nullable=False)
+    severity = db.Column(db.String(16), nullable=False, default='medium')
+    actor_type = db.Column(db.String(20))  # user, client, api_key, system
+    actor_id = db.Column(db.Integer)
+    ip_address = db.Column(db.String(45))
+    user_agent = db.Column(db.String(255))
+    endpoint = db.Column(db.String(100))
+    method = db.Column(db.String(10))
+    details = db.Column(db.JSON)
+
+    # Aggregated rows summarise identical events from one source in a time window
+    event_count = db.Column(db.Integer, nullable=False, default=1)
+    first_seen_at = db.Column(db.DateTime)
+    last_seen_at = db.Column(db.DateTime)
+    sample = db.Column(db.JSON)  # A few of the aggregated events' details
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'event_type': self.event_type,
+            'event_count': self.event_count,
+            'first_seen_at': self.first_seen_at.isoformat() if self.first_seen_at else None,
+            'last_seen_at': self.last_seen_at.isoformat() if self.last_seen_at else None,
+            'severity': self.severity,
+            'actor_type': self.actor_type,
+            'actor_id': self.actor_id,
+            'ip_address': self.ip_address,
+            'endpoint': self.endpoint,
+            'method': self.method,
+            'details': self.details or {},
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+
+class ApiUsageEvent(db.Model):
+    """
+    Per-request API and webhook usage log, range-partitioned by month on
+    PostgreSQL like ``SecurityEvent``.
+    """
+    __tablename__ = 'api_usage_events'
+    __table_args__ = (
+        db.Index('ix_api_usage_events_key_created_at', 'api_key_hash', 'created_at'),
+    )
+
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    api_key_hash = db.Column(db.String(16), nullable=False)
+    endpoint = db.Column(db.String(100), nullable=False)
+    method = db.Column(db.String(10), nullable=False)
+    status_code = db.Column(db.Integer)
+    response_time_ms = db.Column(db.Float)
+    ip_address = db.Column(db.String(45))
+    user_agent = db.Column(db.String(255))
+    error_message = db.Column(db.String(255))
@@ -6,12 +6,47 @@ from .base import BaseModel
 from flask_login import UserMixin
 from .enums import PaymentStatus
 from sqlalchemy import event, func, distinct
-from sqlalchemy.orm import relationship, backref
+from sqlalchemy.orm import relationship, backref, object_session
 
 # Import the feature access configuration
 from ..config.packages import FeatureAccessMixin, sync_client_status_with_package, client_has_feature
 from ..config import config
 
+# Standard dashboard features shown to every commission-based client
+COMMISSION_DASHBOARD_FEATURES = (
+    {
+        'key': 'basic_payment',
+        'name': 'Basic Payment Processing',
+        'icon': 'bi-credit-card',
+        'description': 'Accept crypto payments with simple integration.'
+    },
+    {
+        'key': 'platform_wallet',
+        'name': 'Platform Wallet',
+        'icon': 'bi-wallet2',
+        'description': 'Funds are held in a secure platform wallet.'
+    },
+    {
+        'key': 'basic_analytics',
+        'name': 'Basic Analytics',
+        'icon': 'bi-bar-chart',
+        'description': 'View basic payment and withdrawal stats.'
+    },
+    {
+        'key': 'email_support',
+        'name': 'Email Support',
+        'icon': 'bi-envelope',
+        'description': 'Get help via email for any issues.'
+    },
+    {
+        'key': 'withdraw_request',
+        'name': 'Withdrawal Request',
+        'icon': 'bi-arrow-down-circle',
+        'description': 'Request payout of your net balance.'
+    },
+)
+
+
 class Client(BaseModel, FeatureAccessMixin, UserMixin):
     __tablename__ = 'clients'
     __table_args__ = {'extend_existing': True}
@@ -213,27 +248,24 @@ class Client(BaseModel, FeatureAccessMixin, UserMixin):
         lock_duration = datetime.utcnow() - self.locked_at
         return lock_duration.total_seconds() < 3600  # Lock for 1 hour
         
+    @property
+    def entitlements(self):
+        """Compiled features, coins and limits of this client's package"""
+        from app.utils.entitlements import entitlements_for_package
+        return entitlements_for_package(self.package_id)
+        
     @property
     def allowed_coins(self):
         """Get the list of coin symbols allowed for this client's package."""
-        if not hasattr(self, 'package') or not self.package:
-            return []
-            
-        from .coin import Coin
-        coins = Coin.get_allowed_coins(self.package.slug)
-        return [coin.symbol for coin in coins]
+        return list(self.entitlements.coin_order)
         
     def is_coin_allowed(self, coin_symbol):
         """Check if a coin is allowed for this client's package."""
-        if not coin_symbol:
-            return False
-        return coin_symbol.upper() in self.allowed_coins
+        return self.entitlements.allows_coin(coin_symbol)
         
     def get_coin_limit(self):
         """Get the maximum number of coins allowed for this client's package."""
-        if not hasattr(self, 'package') or not self.package:
-            return 0
-        return config.PACKAGE_COIN_LIMITS.get(self.package.slug, 0)
+        return self.entitlements.limit('coins', 0)
         
     def get_coin_usage(self):
         """Get the number of unique coins used by this client."""
@@ -335,53 +367,9 @@ class Client(BaseModel, FeatureAccessMixin, UserMixin):
         """
         # Commission-based clients: minimal, standard features
         if self.is_commission_based():
-            return [
-                {
-                    'key': 'basic_payment',
-                    'name': 'Basic Payment Processing',
-                    'icon': 'bi-credit-card',
-                    'description': 'Accept crypto payments with simple integration.'
-                },
-                {
-                    'key': 'platform_wallet',
-                    'name': 'Platform Wallet',
-                    'icon': 'bi-wallet2',
-                    'description': 'Funds are held in a secure platform wallet.'
-                },
-                {
-                    'key': 'basic_analytics',
-                    'name': 'Basic Analytics',
-                    'icon': 'bi-bar-chart',
-                    'description': 'View basic payment and withdrawal stats.'
-                },
-                {
-                    'key': 'email_support',
-                    'name': 'Email Support',
-                    'icon': 'bi-envelope',
-                    'description': 'Get help via email for any issues.'
-                },
-                {
-                    'key': 'withdraw_request',
-                    'name': 'Withdrawal Request',
-                    'icon': 'bi-arrow-down-circle',
-                    'description': 'Request payout of your net balance.'
-                }
-            ]
-        # Flat-rate clients: features based on their package
-        package = self.get_current_package()
-        if not package:
-            return []
-        # Example: You may want to fetch features from the package relationship
-        # If package.features is a relationship/list of Feature objects:
-        features = []
-        for feature in getattr(package, 'features', []) or []:
-            features.append({
-                'key': feature.key,
-                'name': feature.name,
-                'icon': feature.icon or 'bi-star',
-                'description': feature.description
-            })
-        return features
+            return list(COMMISSION_DASHBOARD_FEATURES)
+        # Flat-rate clients: features included in their package
+        return list(self.entitlements.dashboard_features)
     
     def get_pending_withdrawal_requests_count(self):
         """Get count of pending withdrawal requests for this client"""
@@ -448,11 +436,44 @@ class ClientNotificationPreference(db.Model):
     client = db.relationship('Client', back_populates='notification_preferences')
 
 # Event listeners for audit trail and package sync
+
+# Columns updated on hot paths (usage counters, login bookkeeping) that would
+# otherwise write an audit row per payment or login
+AUDIT_IGNORED_COLUMNS = frozenset({
+    'current_month_volume',
+    'current_month_transactions',
+    'last_usage_reset',
+    'last_login_at',
+    'login_attempts',
+    'updated_at',
+})
+
+# Recorded as changed, but never with their values
+AUDIT_REDACTED_COLUMNS = frozenset({
+    'password_hash',
+    'reset_password_token',
+    'verification_token',
+    'api_key',
+})
+
+def _audit_actor_id(target):
+    """Acting admin user if there is one, otherwise the client's own user"""
+    from flask import has_request_context
+    from flask_login import current_user
+    from .user import User
+    if has_request_context() and isinstance(current_user._get_current_object(), User):
+        return current_user.id
+    return target.user_id
+
+from .audit import track_previous_values
+track_previous_values(Client, ignore=AUDIT_IGNORED_COLUMNS)
+
 @event.listens_for(Client, 'after_insert')
 def log_client_insert(mapper, connection, target):
-    from .audit import AuditTrail, AuditActionType
-    AuditTrail.log_action(
-        user_id=target.id,
+    from .audit import AuditActionType, queue_audit_row
+    queue_audit_row(
+        object_session(target),
+        user_id=_audit_actor_id(target),
         action_type=AuditActionType.CREATE.value,
         entity_type='client',
         entity_id=target.id,
@@ -462,14 +483,20 @@ def log_client_insert(mapper, connection, target):
 
 @event.listens_for(Client, 'after_update')
 def log_client_update(mapper, connection, target):
-    from .audit import AuditTrail, AuditActionType
-    AuditTrail.log_action(
-        user_id=target.id,
+    from .audit import AuditActionType, changed_attributes, queue_audit_row
+    old_values, new_values = changed_attributes(
+        target, ignore=AUDIT_IGNORED_COLUMNS, redact=AUDIT_REDACTED_COLUMNS
+    )
+    if not new_values:
+        return
+    queue_audit_row(
+        object_session(target),
+        user_id=_audit_actor_id(target),
         action_type=AuditActionType.UPDATE.value,
         entity_type='client',
         entity_id=target.id,
-        old_value=None,
-        new_value=target.to_dict()
+        old_value=old_values,
+        new_value=new_values
     )
 
     # Usage tracking methods for flat-rate plans (NEW)
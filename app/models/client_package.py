@@ -133,6 +133,9 @@ class ClientPackage(db.Model):
     
     def has_feature(self, feature_key):
         """Check if package includes a specific feature"""
+        if self.id is not None:
+            from app.utils.entitlements import entitlements_for_package
+            return entitlements_for_package(self.id).includes(feature_key)
         return any(pf.feature.feature_key == feature_key and pf.is_included 
                   for pf in self.package_features)
     
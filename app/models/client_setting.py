@@ -46,15 +46,14 @@ class ClientSetting(db.Model):
     
     @classmethod
     def get_setting(cls, client_id, key, default=None):
-        """Get a setting value for a client"""
+        """Get a setting value for a client (from the cached client settings)"""
+        from app.utils.settings_snapshot import client_settings
         if not isinstance(key, ClientSettingKey):
             try:
                 key = ClientSettingKey(key)
             except ValueError:
                 return default
-                
-        setting = cls.query.filter_by(client_id=client_id, key=key).first()
-        return setting.value if setting else default
+        return client_settings(client_id).setting(key.value, default)
     
     @classmethod
     def set_setting(cls, client_id, key, value, description=None, is_public=False):
@@ -86,10 +85,12 @@ class ClientSetting(db.Model):
     @classmethod
     def get_all_settings(cls, client_id, include_private=False):
         """Get all settings for a client"""
-        query = cls.query.filter_by(client_id=client_id)
-        if not include_private:
-            query = query.filter_by(is_public=True)
-        return {setting.key: setting.value for setting in query.all()}
+        from app.utils.settings_snapshot import client_settings
+        snapshot = client_settings(client_id)
+        return {
+            ClientSettingKey(key): value for key, value in snapshot.settings.items()
+            if include_private or key in snapshot.public_keys
+        }
     
     @classmethod
     def delete_setting(cls, client_id, key):
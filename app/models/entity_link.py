@@ -0,0 +1,39 @@
+from datetime import datetime
+from ..extensions import db
+
+
+class EntityLink(db.Model):
+    """
+    Observed link between two entities, e.g. a client and a withdrawal
+    address or a user and a login IP (see app/utils/entity_graph.py).
+
+    Entities are ``<type>:<value>`` keys: ``client:12``, ``user:7``,
+    ``address:0xab...``, ``ip:203.0.113.5``.
+    """
+    __tablename__ = 'entity_links'
+    __table_args__ = (
+        db.UniqueConstraint('entity_a', 'entity_b', name='uq_entity_links_pair'),
+        db.Index('ix_entity_links_entity_b', 'entity_b'),
+        db.Index('ix_entity_links_created_at', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    entity_a = db.Column(db.String(160), nullable=False)
+    entity_b = db.Column(db.String(160), nullable=False)
+    source = db.Column(db.String(50))  # What produced the link (withdrawal, login, ...)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<EntityLink {self.entity_a} - {self.entity_b}>'
+
+
+class EntityRiskFlag(db.Model):
+    """Entity marked as risky; counts toward the risk of its whole cluster"""
+    __tablename__ = 'entity_risk_flags'
+
+    entity = db.Column(db.String(160), primary_key=True)
+    reason = db.Column(db.String(100), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<EntityRiskFlag {self.entity} ({self.reason})>'
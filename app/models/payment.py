@@ -9,6 +9,13 @@ from app.utils.exchange import get_exchange_rate as fetch_exchange_rate
 
 class Payment(BaseModel):
     __tablename__ = 'payments'
+    __table_args__ = (
+        # Dashboard KPIs filter on status over a recent created_at window
+        db.Index('ix_payments_status_created_at', 'status', 'created_at'),
+        # Keyset pagination for /api/v1/payments, with and without a status filter
+        db.Index('ix_payments_client_status_created_id', 'client_id', 'status', 'created_at', 'id'),
+        db.Index('ix_payments_client_created_id', 'client_id', 'created_at', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     client_id = db.Column(db.Integer, db.ForeignKey('clients.id'), nullable=False, index=True)
@@ -50,7 +57,7 @@ class Payment(BaseModel):
     description = db.Column(db.String(255))
     
     # Timestamps
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     expires_at = db.Column(db.DateTime, nullable=True)  # When the payment expires
 
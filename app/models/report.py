@@ -1,6 +1,7 @@
 from ..extensions import db
 from datetime import datetime, timedelta
 from enum import Enum
+from sqlalchemy import func
 import json
 
 class ReportType(Enum):
@@ -16,6 +17,10 @@ class ReportStatus(Enum):
     COMPLETED = 'completed'
     FAILED = 'failed'
 
+class ReportFormat(Enum):
+    JSON = 'json'
+    CSV = 'csv'
+
 class ReportFilterType(Enum):
     DATE_RANGE = 'date_range'
     CLIENT_GROUP = 'client_group'
@@ -23,6 +28,22 @@ class ReportFilterType(Enum):
     PAYMENT_METHOD = 'payment_method'
     CURRENCY = 'currency'
 
+
+def _to_float(value):
+    """Convert Decimal/None aggregates to JSON-friendly floats"""
+    return float(value) if value is not None else 0.0
+
+
+def _method_key(payment_method, payment_provider=None):
+    return f"{payment_method} ({payment_provider or 'N/A'})"
+
+
+def _parse_date(value):
+    if isinstance(value, datetime):
+        return value
+    return datetime.strptime(value, '%Y-%m-%d')
+
+
 class Report(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -31,12 +52,40 @@ class Report(db.Model):
     filters = db.Column(db.JSON)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Background job tracking (see app/utils/report_jobs.py)
+    status = db.Column(db.String(20), nullable=False, default=ReportStatus.PENDING.value, index=True)
+    result_format = db.Column(db.String(10), nullable=False, default=ReportFormat.JSON.value)
+    artifact_path = db.Column(db.String(255))  # Generated JSON/CSV file
+    error_message = db.Column(db.Text)
+    started_at = db.Column(db.DateTime)
+    completed_at = db.Column(db.DateTime)
     
-    def __init__(self, name, description, report_type, filters=None):
+    def __init__(self, name, description, report_type, filters=None, result_format=ReportFormat.JSON.value):
         self.name = name
         self.description = description
         self.report_type = report_type
         self.filters = filters or {}
+        self.result_format = result_format
+        self.status = ReportStatus.PENDING.value
+
+    @property
+    def is_finished(self):
+        return self.status in (ReportStatus.COMPLETED.value, ReportStatus.FAILED.value)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'report_type': self.report_type,
+            'filters': self.filters or {},
+            'status': self.status,
+            'format': self.result_format,
+            'error': self.error_message,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+        }
 
     def generate_report(self):
         """Generate the report based on type and filters"""
@@ -52,72 +101,93 @@ class Report(db.Model):
             return self._generate_overdue_payments()
         return None
 
-    def _generate_payment_summary(self):
+    def _filter_payment_dates(self, query):
+        """Apply the start/end date filters to a Payment query"""
         from .payment import Payment
-        """Generate payment summary report"""
         start_date = self.filters.get('start_date')
         end_date = self.filters.get('end_date')
-        
-        query = Payment.query
         if start_date:
-            query = query.filter(Payment.created_at >= start_date)
+            query = query.filter(Payment.created_at >= _parse_date(start_date))
         if end_date:
-            query = query.filter(Payment.created_at <= end_date)
-        
-        payments = query.all()
+            # end_date is inclusive of the whole day
+            query = query.filter(Payment.created_at < _parse_date(end_date) + timedelta(days=1))
+        return query
+
+    def _generate_payment_summary(self):
+        from .payment import Payment
+        """Generate payment summary report"""
+        base = db.session.query
+
+        total_payments, total_amount = self._filter_payment_dates(
+            base(func.count(Payment.id), func.sum(Payment.amount))
+        ).one()
         
         summary = {
-            'total_payments': len(payments),
-            'total_amount': sum(p.amount for p in payments),
+            'total_payments': total_payments or 0,
+            'total_amount': _to_float(total_amount),
             'by_status': {},
             'by_currency': {},
             'by_method': {}
         }
-        
-        for payment in payments:
-            # Status breakdown
-            summary['by_status'][payment.status] = summary['by_status'].get(payment.status, 0) + 1
-            
-            # Currency breakdown
-            summary['by_currency'][payment.currency] = summary['by_currency'].get(payment.currency, 0) + payment.amount
-            
-            # Payment method breakdown
-            key = f"{payment.payment_method} ({payment.payment_provider or 'N/A'})"
-            summary['by_method'][key] = summary['by_method'].get(key, 0) + 1
+
+        # Status breakdown
+        for status, count in self._filter_payment_dates(
+                base(Payment._status, func.count(Payment.id))).group_by(Payment._status):
+            key = status.value if hasattr(status, 'value') else status
+            summary['by_status'][key] = count
+
+        # Currency breakdown
+        for currency, amount in self._filter_payment_dates(
+                base(Payment.currency, func.sum(Payment.amount))).group_by(Payment.currency):
+            summary['by_currency'][currency] = _to_float(amount)
+
+        # Payment method breakdown
+        for method, count in self._filter_payment_dates(
+                base(Payment.payment_method, func.count(Payment.id))).group_by(Payment.payment_method):
+            summary['by_method'][_method_key(method)] = count
         
         return summary
 
     def _generate_client_analysis(self):
         from .client import Client
         from .payment import Payment
+        from .recurring_payment import RecurringPayment
         """Generate client analysis report"""
         start_date = self.filters.get('start_date')
         end_date = self.filters.get('end_date')
         
-        query = Client.query
+        query = db.session.query(Client.id, Client.is_active)
         if start_date:
-            query = query.filter(Client.created_at >= start_date)
+            query = query.filter(Client.created_at >= _parse_date(start_date))
         if end_date:
-            query = query.filter(Client.created_at <= end_date)
+            query = query.filter(Client.created_at < _parse_date(end_date) + timedelta(days=1))
         
-        clients = query.all()
+        client_ids = query.subquery()
+        clients = db.session.query(client_ids).all()
         
         analysis = {
             'total_clients': len(clients),
-            'active_clients': len([c for c in clients if c.is_active]),
-            'payment_history': {},
+            'active_clients': sum(1 for c in clients if c.is_active),
+            'payment_history': {c.id: {'total_payments': 0, 'total_amount': 0.0} for c in clients},
             'recurring_payments': 0
         }
-        
-        for client in clients:
-            payments = Payment.query.filter_by(client_id=client.id).all()
-            analysis['payment_history'][client.id] = {
-                'total_payments': len(payments),
-                'total_amount': sum(p.amount for p in payments)
+
+        # One grouped query instead of a Payment query per client
+        payment_totals = db.session.query(
+            Payment.client_id, func.count(Payment.id), func.sum(Payment.amount)
+        ).filter(
+            Payment.client_id.in_(db.select(client_ids.c.id))
+        ).group_by(Payment.client_id)
+
+        for client_id, count, amount in payment_totals:
+            analysis['payment_history'][client_id] = {
+                'total_payments': count,
+                'total_amount': _to_float(amount)
             }
             
-            recurring = RecurringPayment.query.filter_by(client_id=client.id).count()
-            analysis['recurring_payments'] += recurring
+        analysis['recurring_payments'] = db.session.query(func.count(RecurringPayment.id)).filter(
+            RecurringPayment.client_id.in_(db.select(client_ids.c.id))
+        ).scalar() or 0
         
         return analysis
 
@@ -129,10 +199,6 @@ class Report(db.Model):
         
         if not start_date or not end_date:
             return None
-            
-        # Calculate date range
-        date_range = (datetime.strptime(end_date, '%Y-%m-%d') - 
-                     datetime.strptime(start_date, '%Y-%m-%d')).days + 1
         
         # Initialize trends data
         trends = {
@@ -141,21 +207,23 @@ class Report(db.Model):
             'monthly': []
         }
         
-        # Get payments within date range
-        payments = Payment.query.filter(
-            Payment.created_at >= start_date,
-            Payment.created_at <= end_date
-        ).all()
-        
-        # Calculate trends
-        current_date = datetime.strptime(start_date, '%Y-%m-%d')
-        while current_date <= datetime.strptime(end_date, '%Y-%m-%d'):
-            # Daily trend
-            daily_payments = [p for p in payments 
-                            if p.created_at.date() == current_date.date()]
+        # Daily totals are aggregated in the database, one row per day with payments
+        day = func.date(Payment.created_at)
+        daily_totals = {
+            str(row_day): _to_float(amount)
+            for row_day, amount in self._filter_payment_dates(
+                db.session.query(day, func.sum(Payment.amount))
+            ).group_by(day)
+        }
+        
+        # Walk the calendar once; weekly/monthly windows are rolling sums over the daily series
+        current_date = _parse_date(start_date)
+        last_date = _parse_date(end_date)
+        while current_date <= last_date:
+            date_key = current_date.strftime('%Y-%m-%d')
             trends['daily'].append({
-                'date': current_date.strftime('%Y-%m-%d'),
-                'amount': sum(p.amount for p in daily_payments)
+                'date': date_key,
+                'amount': daily_totals.get(date_key, 0.0)
             })
             
             # Weekly trend (if enough days)
@@ -181,48 +249,52 @@ class Report(db.Model):
     def _generate_payment_methods(self):
         from .payment import Payment
         """Generate payment methods report"""
-        start_date = self.filters.get('start_date')
-        end_date = self.filters.get('end_date')
-        
-        query = Payment.query
-        if start_date:
-            query = query.filter(Payment.created_at >= start_date)
-        if end_date:
-            query = query.filter(Payment.created_at <= end_date)
-        
-        payments = query.all()
+        rows = self._filter_payment_dates(
+            db.session.query(
+                Payment.payment_method,
+                Payment.currency,
+                func.count(Payment.id),
+                func.sum(Payment.amount)
+            )
+        ).group_by(Payment.payment_method, Payment.currency)
         
         methods = {}
-        for payment in payments:
-            key = f"{payment.payment_method} ({payment.payment_provider or 'N/A'})"
+        for method, currency, count, amount in rows:
+            key = _method_key(method)
             if key not in methods:
                 methods[key] = {
                     'count': 0,
-                    'total_amount': 0,
+                    'total_amount': 0.0,
                     'by_currency': {}
                 }
             
-            methods[key]['count'] += 1
-            methods[key]['total_amount'] += payment.amount
-            methods[key]['by_currency'][payment.currency] = (
-                methods[key]['by_currency'].get(payment.currency, 0) + payment.amount
+            methods[key]['count'] += count
+            methods[key]['total_amount'] += _to_float(amount)
+            methods[key]['by_currency'][currency] = (
+                methods[key]['by_currency'].get(currency, 0.0) + _to_float(amount)
             )
         
         return methods
 
     def _generate_overdue_payments(self):
+        from .client import Client
         from .payment import Payment
+        from .enums import PaymentStatus
         """Generate overdue payments report"""
         current_time = datetime.utcnow()
-        
-        overdue_payments = Payment.query.filter(
-            Payment.status == 'pending',
-            Payment.due_date < current_time
-        ).all()
+
+        # Payments have no separate due date; a pending payment is overdue once it expires
+        overdue = db.session.query(
+            Payment.amount, Payment.currency, Payment.expires_at,
+            func.coalesce(Client.name, Client.company_name)
+        ).join(Client, Client.id == Payment.client_id).filter(
+            Payment._status == PaymentStatus.PENDING,
+            Payment.expires_at < current_time
+        ).order_by(Payment.expires_at).yield_per(1000)
         
         report = {
-            'total_overdue': len(overdue_payments),
-            'total_amount': sum(p.amount for p in overdue_payments),
+            'total_overdue': 0,
+            'total_amount': 0.0,
             'by_age': {
                 '1-7 days': [],
                 '8-30 days': [],
@@ -230,21 +302,23 @@ class Report(db.Model):
             }
         }
         
-        for payment in overdue_payments:
-            days_overdue = (current_time - payment.due_date).days
+        for amount, currency, due_date, client_name in overdue:
+            days_overdue = (current_time - due_date).days
             if days_overdue <= 7:
                 key = '1-7 days'
             elif days_overdue <= 30:
                 key = '8-30 days'
             else:
                 key = '31+ days'
-            
+
+            report['total_overdue'] += 1
+            report['total_amount'] += _to_float(amount)
             report['by_age'][key].append({
-                'client': payment.client.name,
-                'amount': payment.amount,
-                'currency': payment.currency,
+                'client': client_name,
+                'amount': _to_float(amount),
+                'currency': currency,
                 'days_overdue': days_overdue,
-                'due_date': payment.due_date.strftime('%Y-%m-%d')
+                'due_date': due_date.strftime('%Y-%m-%d')
             })
         
         return report
@@ -63,19 +63,22 @@ class Setting(db.Model):
 
     @classmethod
     def get_setting(cls, key):
-        """Get a setting by key"""
+        """Get a setting row by key (for updates; use get_value to read)"""
         return cls.query.filter_by(key=key).first()
 
+    @classmethod
+    def get_value(cls, key, default=None):
+        """Get a setting value from the in-memory snapshot"""
+        from app.utils.settings_snapshot import settings_store
+        if isinstance(key, SettingKey):
+            key = key.value
+        return settings_store.snapshot().get(key, default)
+
     @classmethod
     def get_all_settings(cls):
-        """Get all settings grouped by type"""
-        settings = cls.query.all()
-        grouped = {}
-        for setting in settings:
-            if setting.setting_type not in grouped:
-                grouped[setting.setting_type] = []
-            grouped[setting.setting_type].append(setting)
-        return grouped
+        """Get all settings grouped by type (read-only entries from the snapshot)"""
+        from app.utils.settings_snapshot import settings_store
+        return settings_store.snapshot().by_type()
 
     @classmethod
     def update_setting(cls, key, value):
@@ -238,3 +241,15 @@ class Setting(db.Model):
 
     def __repr__(self):
         return f'<Setting {self.key}: {self.value}>'
+
+
+class SettingsVersion(db.Model):
+    """
+    Single-row counter bumped in the same transaction as any change to
+    Setting, ClientSetting or Client.settings; workers reload their settings
+    snapshot when it moves (see app/utils/settings_snapshot.py).
+    """
+    __tablename__ = 'settings_version'
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
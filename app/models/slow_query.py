@@ -0,0 +1,33 @@
+from datetime import datetime
+
+from app.extensions import db
+
+
+class SlowQuery(db.Model):
+    """Slow statements aggregated per fingerprint (see app/utils/slow_queries.py)"""
+    __tablename__ = 'slow_queries'
+
+    id = db.Column(db.Integer, primary_key=True)
+    fingerprint_hash = db.Column(db.String(40), nullable=False, unique=True)
+    fingerprint = db.Column(db.Text, nullable=False)
+    endpoint = db.Column(db.String(255))  # Last request endpoint or job that ran it
+
+    call_count = db.Column(db.Integer, nullable=False, default=0)
+    total_ms = db.Column(db.Float, nullable=False, default=0.0)
+    max_ms = db.Column(db.Float, nullable=False, default=0.0)
+    p95_ms = db.Column(db.Float)
+    latency_sketch = db.Column(db.JSON)  # LatencySketch.to_dict()
+
+    first_seen_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_seen_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    plan = db.Column(db.Text)  # Latest sampled EXPLAIN output
+    plan_ms = db.Column(db.Float)  # Duration of the sampled execution
+    plan_captured_at = db.Column(db.DateTime)
+
+    @property
+    def avg_ms(self):
+        return self.total_ms / self.call_count if self.call_count else None
+
+    def __repr__(self):
+        return f'<SlowQuery {self.fingerprint_hash[:12]} x{self.call_count}>'
@@ -8,13 +8,18 @@ from app.models.enums import WithdrawalMethodType, WithdrawalStatus, WithdrawalT
 
 class WithdrawalRequest(BaseModel):
     __tablename__ = 'withdrawal_requests'
+    __table_args__ = (
+        # Keyset pagination for /api/v1/withdrawals, with and without a status filter
+        db.Index('ix_withdrawal_requests_client_status_created_id', 'client_id', 'status', 'created_at', 'id'),
+        db.Index('ix_withdrawal_requests_client_created_id', 'client_id', 'created_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     client_id = db.Column(db.Integer, db.ForeignKey('clients.id'), nullable=False)
     amount = db.Column(db.Float, nullable=False)
     currency = db.Column(db.String(10), nullable=False)
     crypto_address = db.Column(db.String(100), nullable=False)
-    status = db.Column(db.Enum(WithdrawalStatus), default=WithdrawalStatus.PENDING)
+    status = db.Column(db.Enum(WithdrawalStatus), default=WithdrawalStatus.PENDING, index=True)
     withdrawal_type = db.Column(db.Enum(WithdrawalType), default=WithdrawalType.USER_REQUEST)
     
     # Administrative fields
@@ -31,6 +36,8 @@ class WithdrawalRequest(BaseModel):
     # User information (for user withdrawals)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))  # For B2C withdrawals
     user_wallet_address = db.Column(db.String(100))  # User's destination wallet
+    memo = db.Column(db.String(64))  # Destination memo/tag for shared exchange addresses
+    request_ip = db.Column(db.String(45))  # IP the request was submitted from (IPv4 or IPv6)
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -1,9 +1,12 @@
-from flask import Blueprint, render_template, redirect, request, url_for, flash
+from flask import Blueprint, render_template, redirect, request, url_for, flash, jsonify, send_from_directory, abort, current_app
 from flask_login import login_required, current_user
 from app.models import User, Client
 from app.forms import ClientForm
 from app import db
 from app.utils.decorators import admin_required
+from app.utils.query_stats import query_budget
+import datetime
+import os
 
 admin_bp = Blueprint("admin", __name__, url_prefix="/admin120724")
 
@@ -13,33 +16,19 @@ from flask_babel import _
 @admin_bp.route("/dashboard")
 @login_required
 @admin_required
+@query_budget(15)
 def admin_dashboard():
-    # Debug logging
-    print(f"[DEBUG] Admin dashboard - Current user: {current_user}, is_authenticated: {current_user.is_authenticated}")
-    print(f"[DEBUG] User attributes: {dir(current_user)}")
-    if hasattr(current_user, 'role'):
-        print(f"[DEBUG] User role: {getattr(current_user.role, 'name', 'No role')}")
-    
+    from app.utils.admin_kpis import get_dashboard_kpis
+
     try:
-        clients = Client.query.all()
-        stats = {
-            'pending_withdrawals': 0,
-            'total_clients': len(clients),
-            'active_clients_change': 0,
-            'success_rate': 0,
-            'success_rate_change': 0,
-            'total_commission': 0,
-            'commission_change': 0,
-            'volume_24h': 0,
-        }
-        import datetime
+        stats = dict(get_dashboard_kpis())
+        top_clients = stats.pop('top_clients', [])
         current_time = datetime.datetime.now()
-        
-        print(f"[DEBUG] Admin dashboard rendered successfully")
     except Exception as e:
-        print(f"[ERROR] Error in admin dashboard: {str(e)}")
+        current_app.logger.exception("Error in admin dashboard: %s", e)
         raise
-    return render_template("admin/dashboard.html", clients=clients, stats=stats, current_time=current_time)
+    return render_template("admin/dashboard.html", stats=stats,
+                           top_clients=top_clients, current_time=current_time)
 
     # --- Add Client ---
 @admin_bp.route("/clients/add", methods=["GET", "POST"])
@@ -138,8 +127,8 @@ def list_clients():
     
     # Apply search filter
     if search:
-        query = query.filter(Client.company_name.contains(search) | 
-                           Client.email.contains(search))
+        from app.utils.admin_search import text_search_filter
+        query = query.filter(text_search_filter(Client, ('company_name', 'email'), search))
     
     # Apply status filter
     if status:
@@ -191,6 +180,240 @@ def delete_client(client_id):
     flash("Client deleted", "info")
     return redirect(url_for("admin.list_clients"))
     
+# --- Report Jobs ---
+@admin_bp.route('/reports/jobs', methods=['POST'])
+@login_required
+@admin_required
+def create_report_job():
+    """Queue a report for background generation"""
+    from app.models.report import ReportType, ReportFormat
+    from app.utils.report_jobs import enqueue_report
+
+    data = request.get_json(silent=True) or request.form
+    report_type = data.get('report_type')
+    result_format = data.get('format', ReportFormat.JSON.value)
+
+    if report_type not in {t.value for t in ReportType}:
+        return jsonify({'error': 'invalid_report_type', 'message': _('Unknown report type')}), 400
+    if result_format not in {f.value for f in ReportFormat}:
+        return jsonify({'error': 'invalid_format', 'message': _('Format must be json or csv')}), 400
+
+    filters = {k: data.get(k) for k in ('start_date', 'end_date') if data.get(k)}
+    report = enqueue_report(
+        name=data.get('name') or report_type.replace('_', ' ').title(),
+        report_type=report_type,
+        filters=filters,
+        result_format=result_format,
+        description=data.get('description')
+    )
+    return jsonify({
+        'report': report.to_dict(),
+        'status_url': url_for('admin.report_job_status', report_id=report.id)
+    }), 202
+
+@admin_bp.route('/reports/jobs/<int:report_id>')
+@login_required
+@admin_required
+def report_job_status(report_id):
+    """Poll the status of a report job"""
+    from app.models.report import Report, ReportStatus
+
+    report = db.session.get(Report, report_id) or abort(404)
+    payload = {'report': report.to_dict()}
+    if report.status == ReportStatus.COMPLETED.value:
+        payload['download_url'] = url_for('admin.download_report', report_id=report.id)
+    return jsonify(payload)
+
+@admin_bp.route('/reports/jobs/<int:report_id>/download')
+@login_required
+@admin_required
+def download_report(report_id):
+    """Download a finished report artifact"""
+    from app.models.report import Report, ReportStatus
+    from app.utils.report_jobs import get_artifact_dir
+
+    report = db.session.get(Report, report_id) or abort(404)
+    if report.status != ReportStatus.COMPLETED.value or not report.artifact_path:
+        return jsonify({'error': 'not_ready', 'message': _('Report is not ready yet')}), 409
+    return send_from_directory(get_artifact_dir(), report.artifact_path, as_attachment=True)
+
+# --- Address Screening ---
+@admin_bp.route('/screening/batch', methods=['POST'])
+@login_required
+@admin_required
+def screen_addresses_batch():
+    """Screen a batch of withdrawal addresses (JSON list or uploaded file, one per line)"""
+    from app.utils.address_screening import address_screener, screen_addresses
+
+    upload = request.files.get('file')
+    if upload:
+        addresses = [line.strip() for line in upload.read().decode('utf-8', 'replace').splitlines()]
+    else:
+        addresses = (request.get_json(silent=True) or {}).get('addresses')
+    if not isinstance(addresses, list):
+        return jsonify({'error': 'invalid_request', 'message': _('Provide an addresses list or a file')}), 400
+
+    addresses = [a.split(',', 1)[0].strip() for a in addresses if isinstance(a, str) and a.strip()]
+    hits = screen_addresses(addresses)
+    return jsonify({
+        'screened': len(addresses),
+        'flagged': [{'address': address, 'lists': lists} for address, lists in hits.items()],
+        'lists': address_screener.lists
+    })
+
+# --- Cache ---
+@admin_bp.route('/cache/stats')
+@login_required
+@admin_required
+def cache_stats():
+    """Hit/miss/latency counters of the tiered cache (this worker only)"""
+    from app.utils.cache_bus import cache_bus
+    from app.utils.caching import tiered_cache
+    stats = tiered_cache.stats()
+    stats['bus'] = dict(cache_bus.stats, transport=cache_bus.transport)
+    return jsonify(stats)
+
+# --- Query Stats ---
+@admin_bp.route('/queries/stats')
+@login_required
+@admin_required
+def query_stats():
+    """Per-endpoint query counts, SQL time and N+1 hits (this worker only)"""
+    from app.utils.query_stats import query_stats as registry
+    return jsonify(registry.stats())
+
+# --- Slow Queries ---
+SLOW_QUERY_SORTS = {'total': 'total_ms', 'count': 'call_count', 'p95': 'p95_ms', 'max': 'max_ms', 'recent': 'last_seen_at'}
+
+@admin_bp.route('/slow-queries')
+@login_required
+@admin_required
+def slow_queries():
+    """Top slow statement fingerprints with their latest sampled plan"""
+    from app.models.slow_query import SlowQuery
+    from app.utils.slow_queries import slow_query_sampler
+
+    sort = request.args.get('sort', 'total')
+    if sort not in SLOW_QUERY_SORTS:
+        sort = 'total'
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    slow_query_sampler.flush()  # Include this worker's buffered statements
+    column = getattr(SlowQuery, SLOW_QUERY_SORTS[sort])
+    queries = SlowQuery.query.order_by(column.desc().nullslast(), SlowQuery.id).limit(limit).all()
+    return render_template('admin/slow_queries.html', queries=queries, sort=sort,
+                           threshold_ms=slow_query_sampler.threshold_ms)
+
+# --- Memory Diagnostics ---
+@admin_bp.route('/memory')
+@login_required
+@admin_required
+def memory_stats():
+    """RSS, gc counts and growing structures of every worker, plus stored snapshots"""
+    from app.utils.memory_diagnostics import memory_diagnostics
+    return jsonify({
+        'served_by': os.getpid(),
+        'workers': memory_diagnostics.workers(),
+        'snapshots': memory_diagnostics.snapshots(),
+    })
+
+@admin_bp.route('/memory/tracemalloc', methods=['POST'])
+@login_required
+@admin_required
+def memory_tracemalloc():
+    """Start (``action=start``, optional ``frames``) or stop tracemalloc in all workers"""
+    from app.utils.memory_diagnostics import memory_diagnostics
+
+    data = request.get_json(silent=True) or request.form
+    action = data.get('action')
+    if action == 'start':
+        try:
+            frames = min(max(int(data.get('frames') or 1), 1), 25)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'invalid_frames', 'message': _('frames must be a number')}), 400
+        memory_diagnostics.start_tracing(frames)
+    elif action == 'stop':
+        memory_diagnostics.stop_tracing()
+    else:
+        return jsonify({'error': 'invalid_action', 'message': _('Action must be start or stop')}), 400
+    return jsonify({'status': 'ok', 'action': action})
+
+@admin_bp.route('/memory/snapshots', methods=['POST'])
+@login_required
+@admin_required
+def memory_snapshot():
+    """Dump a named tracemalloc snapshot in every tracing worker"""
+    from app.utils.memory_diagnostics import memory_diagnostics
+
+    data = request.get_json(silent=True) or request.form
+    name = data.get('name') or datetime.datetime.utcnow().strftime('%Y%m%d-%H%M%S')
+    try:
+        memory_diagnostics.take_snapshot(name)
+    except ValueError as e:
+        return jsonify({'error': 'invalid_name', 'message': str(e)}), 400
+    return jsonify({'status': 'ok', 'name': name})
+
+@admin_bp.route('/memory/snapshots/<int:pid>/<name>')
+@login_required
+@admin_required
+def memory_snapshot_top(pid, name):
+    """Top allocation sites of one worker's snapshot"""
+    from app.utils.memory_diagnostics import memory_diagnostics
+
+    limit = min(max(request.args.get('limit', 25, type=int), 1), 200)
+    key_type = 'traceback' if request.args.get('group') == 'traceback' else 'lineno'
+    try:
+        return jsonify(memory_diagnostics.top(pid, name, limit=limit, key_type=key_type))
+    except (OSError, ValueError):
+        abort(404)
+
+@admin_bp.route('/memory/diff')
+@login_required
+@admin_required
+def memory_diff():
+    """Allocation growth between two snapshots (``pid``, ``from``, ``to``) of one worker"""
+    from app.utils.memory_diagnostics import memory_diagnostics
+
+    pid = request.args.get('pid', type=int)
+    older, newer = request.args.get('from'), request.args.get('to')
+    if not pid or not older or not newer:
+        return jsonify({'error': 'missing_arguments', 'message': _('pid, from and to are required')}), 400
+    limit = min(max(request.args.get('limit', 25, type=int), 1), 200)
+    try:
+        return jsonify(memory_diagnostics.diff(pid, older, newer, limit=limit))
+    except (OSError, ValueError):
+        abort(404)
+
+# --- Unified Search ---
+@admin_bp.route('/search')
+@login_required
+@admin_required
+def search():
+    """Search clients, payments, payment sessions and withdrawals"""
+    from app.utils.admin_search import admin_search, SEARCH_TARGETS, MIN_QUERY_LENGTH
+
+    query = request.args.get('q', '', type=str).strip()
+    kind = request.args.get('type', '', type=str)
+    limit = request.args.get('limit', 20, type=int)
+    cursor = request.args.get('cursor')
+
+    if kind and kind not in SEARCH_TARGETS:
+        return jsonify({'error': 'invalid_type', 'message': _('Unknown search type')}), 400
+
+    try:
+        results = admin_search(
+            query,
+            types=[kind] if kind else None,
+            limit=limit,
+            cursors={kind: cursor} if kind and cursor else None
+        )
+    except ValueError as e:
+        return jsonify({'error': 'invalid_cursor', 'message': str(e)}), 400
+
+    if request.args.get('format') == 'json':
+        return jsonify({'query': query, 'results': results})
+    return render_template('admin/search.html', query=query, kind=kind, results=results,
+                           min_length=MIN_QUERY_LENGTH)
+
 # Payments list route
 @admin_bp.route('/payments')
 @login_required
@@ -228,8 +451,37 @@ def wallet_balances():
 @login_required
 @admin_required
 def audit_trail():
-    # Add logic to fetch and display audit trail
-    return render_template('admin/audit_trail.html')
+    from app.models.audit import AuditTrail, AuditActionType
+    from app.utils.audit import get_security_events
+
+    query = AuditTrail.query
+    for field in ('action_type', 'entity_type'):
+        value = request.args.get(field)
+        if value:
+            query = query.filter(getattr(AuditTrail, field) == value)
+    user_id = request.args.get('user_id', type=int)
+    if user_id:
+        query = query.filter(AuditTrail.user_id == user_id)
+    try:
+        start_date = request.args.get('start_date')
+        if start_date:
+            query = query.filter(AuditTrail.created_at >= datetime.datetime.strptime(start_date, '%Y-%m-%d'))
+        end_date = request.args.get('end_date')
+        if end_date:
+            end = datetime.datetime.strptime(end_date, '%Y-%m-%d') + datetime.timedelta(days=1)
+            query = query.filter(AuditTrail.created_at < end)
+    except ValueError:
+        flash(_("Dates must be in YYYY-MM-DD format"), "warning")
+    audit_entries = query.order_by(AuditTrail.created_at.desc()).limit(100).all()
+
+    # Served by the (severity, created_at) index on the recent partitions only
+    security_events = get_security_events(hours=24, severity=['high', 'critical'], limit=200)
+
+    return render_template('admin/audit_trail.html',
+                           audit_entries=audit_entries,
+                           security_events=security_events,
+                           AuditActionType=AuditActionType,
+                           users=User.query.order_by(User.email).all())
 
 # Access Control route
 @admin_bp.route('/access-control')
@@ -13,12 +13,12 @@ def create_payment_session():
     sig = request.headers.get("X-Paycrypt-Signature", "")
     key = request.headers.get("X-Paycrypt-Key", "")
 
-    key_record: ClientApiKey = ClientApiKey.query.filter_by(key=key, is_active=True).first()
+    key_record: ClientApiKey = ClientApiKey.find_by_key(key)
     if not key_record or not key_record.secret_key:
         return jsonify({"error": "invalid key"}), 401
 
     # Optional: basic IP allowlist check
-    if key_record.allowed_ips and request.remote_addr not in (key_record.allowed_ips or []):
+    if not key_record.is_ip_allowed(request.remote_addr):
         return jsonify({"error": "ip_not_allowed"}), 403
 
     verify_hmac(key_record.secret_key.encode(), raw, ts, sig)
@@ -1,4 +1,4 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
 from flask_login import current_user
 from datetime import datetime, timedelta
 from functools import wraps
@@ -10,10 +10,22 @@ from app.models import Payment, WithdrawalRequest
 from app.models.enums import PaymentStatus, WithdrawalStatus
 from app import db
 from sqlalchemy import func
+from sqlalchemy.orm import load_only
+from app.utils.pagination import keyset_paginate, offset_paginate
+from app.utils.export_stream import EXPORT_FORMATS, parse_date_range, stream_export
+from app.utils.address_screening import log_screening_hit, screen_address
+from app.utils.entity_graph import record_withdrawal_links
+from app.utils.security import rate_limiter
+from app.utils.usage_anomaly import throttle_identifier, usage_anomaly_detector
+from app.utils.caching import client_tag, tiered_cache
+from app.utils.entitlements import entitlements_for_package
+from app.utils.query_stats import query_budget
 import uuid
 
 api_v1 = Blueprint('api_v1', __name__, url_prefix='/api/v1')
 
+BALANCE_CACHE_TIMEOUT = 300
+
 def api_key_required(f):
     """Decorator to require API key authentication"""
     @wraps(f)
@@ -28,7 +40,7 @@ def api_key_required(f):
         api_key = auth_header.replace('Bearer ', '')
         
         # Find the API key
-        key_record = ClientApiKey.query.filter_by(key=api_key, is_active=True).first()
+        key_record = ClientApiKey.find_by_key(api_key)
         if not key_record:
             return jsonify({
                 'error': 'Invalid API key',
@@ -42,6 +54,27 @@ def api_key_required(f):
                 'message': 'Please regenerate your API key'
             }), 401
         
+        if not key_record.is_ip_allowed(request.remote_addr):
+            return jsonify({
+                'error': 'IP not allowed',
+                'message': 'Request IP is not in the allowlist for this API key'
+            }), 403
+        
+        # Keys flagged by the usage anomaly detector get a reduced rate limit
+        throttle = usage_anomaly_detector.throttle_factor(key_record.id)
+        if throttle is not None:
+            limit = max(1, int((key_record.rate_limit or 60) * throttle))
+            allowed, info = rate_limiter.is_allowed('api_anomaly_throttle', limit, 60,
+                                                    identifier=throttle_identifier(key_record.id))
+            if not allowed:
+                response = jsonify({
+                    'error': 'Rate limit exceeded',
+                    'message': f'Unusual activity detected; this key is limited to {limit} requests per minute'
+                })
+                response.status_code = 429
+                response.headers['Retry-After'] = '60'
+                return response
+        
         # Update usage stats
         key_record.last_used_at = datetime.utcnow()
         key_record.usage_count = (key_record.usage_count or 0) + 1
@@ -50,12 +83,24 @@ def api_key_required(f):
         # Add client to request context
         request.api_client = key_record.client
         request.api_key_record = key_record
+        request.api_entitlements = entitlements_for_package(request.api_client.package_id)
         
         return f(*args, **kwargs)
     return decorated_function
 
-def check_permission(permission):
-    """Decorator to check if API key has specific permission"""
+@api_v1.after_request
+def observe_api_usage(response):
+    """Feed authenticated requests into the streaming usage anomaly detector"""
+    key_record = getattr(request, 'api_key_record', None)
+    if key_record is not None:
+        try:
+            usage_anomaly_detector.observe(key_record.id, request.path, response.status_code)
+        except Exception as e:
+            current_app.logger.error(f"Usage anomaly detection failed: {e}")
+    return response
+
+def check_permission(permission, feature=None):
+    """Decorator to check if API key has specific permission (and the package a feature)"""
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
@@ -64,10 +109,74 @@ def check_permission(permission):
                     'error': 'Insufficient permissions',
                     'message': f'API key requires {permission} permission'
                 }), 403
+            if feature and not request.api_entitlements.has(feature):
+                return jsonify({
+                    'error': 'Feature not available',
+                    'message': f'Your package does not include {feature}'
+                }), 403
             return f(*args, **kwargs)
         return decorated_function
     return decorator
 
+def _flag(value):
+    """Interpret a query string flag such as ?include_count=true"""
+    return (value or '').lower() in ('1', 'true', 'yes')
+
+def _paginate_list(query, page_query, created_col, id_col):
+    """
+    Page a list endpoint by ``cursor``, or by the deprecated ``page`` number.
+
+    ``page`` is served with OFFSET and reports ``page``/``pages``/``total`` as
+    before cursors existed, plus a ``next_cursor`` to switch over with.
+
+    Returns:
+        tuple: (items, pagination dict, error response or None)
+    """
+    per_page = request.args.get('per_page', 20, type=int)
+    per_page = min(per_page, 100) if per_page and per_page > 0 else 20
+    cursor = request.args.get('cursor')
+    page = request.args.get('page', type=int)
+    if 'page' in request.args and (page is None or page < 1):
+        return None, None, (jsonify({
+            'error': 'Invalid page',
+            'message': 'page must be a positive integer; use cursor to paginate'
+        }), 400)
+    if page is not None and cursor:
+        return None, None, (jsonify({
+            'error': 'Conflicting pagination',
+            'message': 'Send either cursor or the deprecated page parameter, not both'
+        }), 400)
+
+    if page is not None:
+        items, next_cursor = offset_paginate(page_query, created_col, id_col, page=page, limit=per_page)
+    else:
+        try:
+            items, next_cursor = keyset_paginate(page_query, created_col, id_col, cursor=cursor, limit=per_page)
+        except ValueError:
+            return None, None, (jsonify({
+                'error': 'Invalid cursor',
+                'message': 'Cursor must be a next_cursor value returned by this endpoint'
+            }), 400)
+
+    pagination = {
+        'per_page': per_page,
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None
+    }
+    if page is not None or _flag(request.args.get('include_count')):
+        pagination['total'] = query.with_entities(func.count(id_col)).scalar()
+    if page is not None:
+        pagination['page'] = page
+        pagination['pages'] = -(-pagination['total'] // per_page)
+    return items, pagination, None
+
+def _list_response(body):
+    response = jsonify(body)
+    if 'page' in body['pagination']:
+        response.headers['Deprecation'] = 'true'
+        response.headers['Warning'] = '299 - "page is deprecated; follow pagination.next_cursor with ?cursor="'
+    return response
+
 # === AUTHENTICATION & STATUS ===
 @api_v1.route('/status', methods=['GET'])
 @api_key_required
@@ -177,29 +286,32 @@ def betslip_status(payment_id):
 @api_v1.route('/payments', methods=['GET'])
 @api_key_required
 @check_permission('flat_rate:payment:read')
+@query_budget(10)
 def list_payments():
-    """List payments for the client"""
-    page = request.args.get('page', 1, type=int)
-    per_page = min(request.args.get('per_page', 20, type=int), 100)
+    """List payments for the client, newest first, using cursor pagination"""
     status = request.args.get('status')
     
-    query = Payment.query.filter_by(client_id=request.api_client.id)
+    query = Payment.query.filter(Payment.client_id == request.api_client.id)
     
     if status:
         try:
             status_enum = PaymentStatus(status)
-            query = query.filter_by(status=status_enum)
+            query = query.filter(Payment._status == status_enum)
         except ValueError:
             return jsonify({
                 'error': 'Invalid status',
                 'message': f'Status must be one of: {[s.value for s in PaymentStatus]}'
             }), 400
     
-    payments = query.order_by(Payment.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    page_query = query.options(load_only(
+        Payment.id, Payment.transaction_id, Payment.amount, Payment.crypto_currency,
+        Payment._status, Payment.description, Payment.created_at
+    ))
+    payments, pagination, error = _paginate_list(query, page_query, Payment.created_at, Payment.id)
+    if error:
+        return error
     
-    return jsonify({
+    return _list_response({
         'payments': [{
             'id': p.id,
             'transaction_id': p.transaction_id,
@@ -208,13 +320,8 @@ def list_payments():
             'status': p.status.value,
             'description': p.description,
             'created_at': p.created_at.isoformat()
-        } for p in payments.items],
-        'pagination': {
-            'page': payments.page,
-            'pages': payments.pages,
-            'per_page': payments.per_page,
-            'total': payments.total
-        }
+        } for p in payments],
+        'pagination': pagination
     })
 
 @api_v1.route('/payments', methods=['POST'])
@@ -276,44 +383,65 @@ def create_payment():
 def get_balance():
     """Get client balance information"""
     client = request.api_client
-    
-    # Calculate current balance
+    return jsonify(tiered_cache.get_or_set(
+        'balance', client.id, lambda: _compute_balance(client.id),
+        timeout=BALANCE_CACHE_TIMEOUT, tags=(client_tag(client.id),)
+    ))
+
+def _compute_balance(client_id):
+    """Balance summary for one client (cached until its payments or withdrawals change)"""
     total_payments = db.session.query(func.sum(Payment.fiat_amount)).filter(
-        Payment.client_id == client.id,
+        Payment.client_id == client_id,
         Payment.status == PaymentStatus.COMPLETED
     ).scalar() or 0
     
     total_withdrawals = db.session.query(func.sum(WithdrawalRequest.net_amount)).filter(
-        WithdrawalRequest.client_id == client.id,
+        WithdrawalRequest.client_id == client_id,
         WithdrawalRequest.status == WithdrawalStatus.COMPLETED
     ).scalar() or 0
     
     current_balance = float(total_payments) - float(total_withdrawals)
     
-    return jsonify({
+    return {
         'balance': current_balance,
         'total_payments': float(total_payments),
         'total_withdrawals': float(total_withdrawals),
         'currency': 'USD',
         'last_updated': datetime.utcnow().isoformat()
-    })
+    }
 
 # === WITHDRAWAL ENDPOINTS ===
 @api_v1.route('/withdrawals', methods=['GET'])
 @api_key_required
 @check_permission('flat_rate:withdrawal:read')
 def list_withdrawals():
-    """List withdrawal requests"""
-    page = request.args.get('page', 1, type=int)
-    per_page = min(request.args.get('per_page', 20, type=int), 100)
+    """List withdrawal requests, newest first, using cursor pagination"""
+    status = request.args.get('status')
     
-    withdrawals = WithdrawalRequest.query.filter_by(
-        client_id=request.api_client.id
-    ).order_by(WithdrawalRequest.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
+    query = WithdrawalRequest.query.filter(WithdrawalRequest.client_id == request.api_client.id)
+    
+    if status:
+        try:
+            query = query.filter(WithdrawalRequest.status == WithdrawalStatus(status))
+        except ValueError:
+            return jsonify({
+                'error': 'Invalid status',
+                'message': f'Status must be one of: {[s.value for s in WithdrawalStatus]}'
+            }), 400
+    
+    page_query = query.options(load_only(
+        WithdrawalRequest.id, WithdrawalRequest.amount, WithdrawalRequest.net_amount,
+        WithdrawalRequest.currency, WithdrawalRequest.status,
+        WithdrawalRequest.user_wallet_address, WithdrawalRequest.created_at,
+        WithdrawalRequest.approved_at
+    ))
+    withdrawals, pagination, error = _paginate_list(
+        query, page_query, WithdrawalRequest.created_at, WithdrawalRequest.id
     )
+    if error:
+        return error
     
-    return jsonify({
+    return _list_response({
         'withdrawals': [{
             'id': w.id,
             'amount': float(w.amount),
@@ -322,14 +450,9 @@ def list_withdrawals():
             'status': w.status.value,
             'wallet_address': w.user_wallet_address,
             'created_at': w.created_at.isoformat(),
-            'processed_at': w.processed_at.isoformat() if w.processed_at else None
-        } for w in withdrawals.items],
-        'pagination': {
-            'page': withdrawals.page,
-            'pages': withdrawals.pages,
-            'per_page': withdrawals.per_page,
-            'total': withdrawals.total
-        }
+            'processed_at': w.approved_at.isoformat() if w.approved_at else None
+        } for w in withdrawals],
+        'pagination': pagination
     })
 
 @api_v1.route('/withdrawals', methods=['POST'])
@@ -349,6 +472,16 @@ def create_withdrawal():
                     'message': f'Field {field} is required'
                 }), 400
         
+        # Sanctions / blacklist screening of the destination address
+        screening_hits = screen_address(data['wallet_address'])
+        if screening_hits:
+            log_screening_hit(data['wallet_address'], screening_hits,
+                              client_id=request.api_client.id, context='api_v1.create_withdrawal')
+            return jsonify({
+                'error': 'Address not permitted',
+                'message': 'Destination address failed compliance screening'
+            }), 403
+        
         # Create withdrawal request
         withdrawal = WithdrawalRequest(
             client_id=request.api_client.id,
@@ -357,10 +490,13 @@ def create_withdrawal():
             user_wallet_address=data['wallet_address'],
             memo=data.get('memo'),
             note=data.get('note', 'API Withdrawal Request'),
+            request_ip=request.remote_addr,
             status=WithdrawalStatus.PENDING
         )
         
         db.session.add(withdrawal)
+        record_withdrawal_links(request.api_client.id, data['wallet_address'], request.remote_addr,
+                                memo=data.get('memo'))
         db.session.commit()
         
         return jsonify({
@@ -379,6 +515,102 @@ def create_withdrawal():
             'message': 'Failed to create withdrawal'
         }), 500
 
+# === EXPORTS ===
+PAYMENT_EXPORT_FIELDS = [
+    'id', 'transaction_id', 'amount', 'currency', 'fiat_amount', 'fiat_currency',
+    'payment_method', 'status', 'description', 'created_at'
+]
+WITHDRAWAL_EXPORT_FIELDS = [
+    'id', 'amount', 'net_amount', 'fee', 'currency', 'status', 'wallet_address',
+    'created_at', 'processed_at'
+]
+
+def _export_response(query, created_col, id_col, serialize, fields, name):
+    """Stream ``query`` as NDJSON or CSV for the requested date range"""
+    fmt = request.args.get('format', 'ndjson').lower()
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({
+            'error': 'Invalid format',
+            'message': f'Format must be one of: {list(EXPORT_FORMATS)}'
+        }), 400
+    
+    try:
+        start, end = parse_date_range(request.args.get('start_date'), request.args.get('end_date'))
+    except ValueError as e:
+        return jsonify({
+            'error': 'Invalid date range',
+            'message': str(e) if 'before' in str(e) else 'Dates must be YYYY-MM-DD or ISO 8601'
+        }), 400
+    
+    if start:
+        query = query.filter(created_col >= start)
+    if end:
+        query = query.filter(created_col < end)
+    query = query.order_by(created_col, id_col)
+    
+    compress = _flag(request.args.get('gzip'))
+    filename = f"{name}_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}.{fmt}"
+    headers = {'Content-Disposition': f'attachment; filename="{filename}"'}
+    if compress:
+        headers['Content-Encoding'] = 'gzip'
+    
+    body = stream_export(query, serialize, fields, fmt=fmt, compress=compress)
+    return Response(stream_with_context(body), mimetype=EXPORT_FORMATS[fmt], headers=headers)
+
+@api_v1.route('/payments/export', methods=['GET'])
+@api_key_required
+@check_permission('flat_rate:payment:read')
+def export_payments():
+    """Stream the client's payments as NDJSON or CSV"""
+    query = Payment.query.filter(Payment.client_id == request.api_client.id).options(load_only(
+        Payment.id, Payment.transaction_id, Payment.amount, Payment.crypto_currency,
+        Payment.fiat_amount, Payment.fiat_currency, Payment.payment_method,
+        Payment._status, Payment.description, Payment.created_at
+    ))
+    
+    def serialize(p):
+        return {
+            'id': p.id,
+            'transaction_id': p.transaction_id,
+            'amount': format(p.amount, 'f') if p.amount is not None else None,
+            'currency': p.crypto_currency,
+            'fiat_amount': format(p.fiat_amount, 'f') if p.fiat_amount is not None else None,
+            'fiat_currency': p.fiat_currency,
+            'payment_method': p.payment_method,
+            'status': p.status.value,
+            'description': p.description,
+            'created_at': p.created_at.isoformat() if p.created_at else None
+        }
+    
+    return _export_response(query, Payment.created_at, Payment.id, serialize, PAYMENT_EXPORT_FIELDS, 'payments')
+
+@api_v1.route('/withdrawals/export', methods=['GET'])
+@api_key_required
+@check_permission('flat_rate:withdrawal:read')
+def export_withdrawals():
+    """Stream the client's withdrawal requests as NDJSON or CSV"""
+    query = WithdrawalRequest.query.filter(WithdrawalRequest.client_id == request.api_client.id).options(load_only(
+        WithdrawalRequest.id, WithdrawalRequest.amount, WithdrawalRequest.net_amount,
+        WithdrawalRequest.fee, WithdrawalRequest.currency, WithdrawalRequest.status,
+        WithdrawalRequest.user_wallet_address, WithdrawalRequest.created_at,
+        WithdrawalRequest.approved_at
+    ))
+    
+    def serialize(w):
+        return {
+            'id': w.id,
+            'amount': w.amount,
+            'net_amount': w.net_amount,
+            'fee': w.fee,
+            'currency': w.currency,
+            'status': w.status.value if w.status else None,
+            'wallet_address': w.user_wallet_address,
+            'created_at': w.created_at.isoformat() if w.created_at else None,
+            'processed_at': w.approved_at.isoformat() if w.approved_at else None
+        }
+    
+    return _export_response(query, WithdrawalRequest.created_at, WithdrawalRequest.id, serialize, WITHDRAWAL_EXPORT_FIELDS, 'withdrawals')
+
 # === ERROR HANDLERS ===
 @api_v1.errorhandler(404)
 def api_not_found(error):
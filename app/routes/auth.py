@@ -6,6 +6,7 @@ from app.models import User, Client
 from app.utils import check_password
 from app import db
 from app.forms import ClientLoginForm
+from app.utils.entity_graph import record_login_link
 
 auth_bp = Blueprint("auth", __name__)
 
@@ -61,12 +62,14 @@ def client_login():
             client = user.client
             if client.is_active and not client.is_locked:
                 login_user(user, remember=form.remember.data)
+                record_login_link('user', user.id, request.remote_addr, client_id=client.id)
                 return redirect(url_for("client.client_dashboard"))
         
         # Fallback: try direct Client authentication (for legacy clients)
         client = Client.query.filter_by(username=username).first()
         if client and client.check_password(password) and client.is_active and not client.is_locked:
             login_user(client, remember=form.remember.data)
+            record_login_link('client', client.id, request.remote_addr)
             return redirect(url_for("client.client_dashboard"))
             
         from flask_babel import _
@@ -1,6 +1,8 @@
 from flask import Blueprint, render_template, abort, request, redirect
+from datetime import datetime
 from app.models.api_key import ClientApiKey
 from app.security.signing import sign_body
+from app.utils.tracing import trace_span
 import json, requests
 from app.models.payment_session import PaymentSession
 
@@ -28,8 +30,10 @@ def checkout(ps_id):
 
     # --- Generate Deposit Address ---
     from app.utils import generate_address, create_qr
-    deposit_address = generate_address(ps.client_id, coin=selected_coin)
-    qr_code = create_qr(deposit_address)
+    with trace_span('checkout.generate_address', coin=selected_coin):
+        deposit_address = generate_address(ps.client_id, coin=selected_coin)
+    with trace_span('checkout.create_qr'):
+        qr_code = create_qr(deposit_address)
 
     # --- Countdown Timer ---
     expires_at = ps.expires_at
@@ -61,17 +65,18 @@ def checkout(ps_id):
                 body = json.dumps(payload).encode()
                 ts, sig = sign_body(key_record.secret_key.encode(), body)
                 try:
-                    requests.post(
-                        ps.webhook_url,
-                        data=body,
-                        headers={
-                            "Content-Type": "application/json",
-                            "X-Paycrypt-Key": key_record.key,
-                            "X-Paycrypt-Timestamp": ts,
-                            "X-Paycrypt-Signature": sig,
-                        },
-                        timeout=5,
-                    )
+                    with trace_span('checkout.merchant_webhook'):
+                        requests.post(
+                            ps.webhook_url,
+                            data=body,
+                            headers={
+                                "Content-Type": "application/json",
+                                "X-Paycrypt-Key": key_record.display_prefix,  # Identifies the key; the signature authenticates
+                                "X-Paycrypt-Timestamp": ts,
+                                "X-Paycrypt-Signature": sig,
+                            },
+                            timeout=5,
+                        )
                 except Exception:
                     pass
         return redirect(ps.success_url)
@@ -10,6 +10,7 @@ from app import db
 from werkzeug.security import check_password_hash
 from app.decorators import client_required
 from app.models.api_key import ClientApiKey, ApiKeyScope
+from app.utils.query_stats import query_budget
 
 client_bp = Blueprint("client", __name__, url_prefix="/client")
 
@@ -129,7 +130,7 @@ def create_api_key_management():
 
     # We return the key and secret one time via flash message and redirect to management page
     from flask_babel import _
-    flash(_(f"API key created. Copy now: Key={api_key.key} · Secret={api_key.secret_key}"), 'success')
+    flash(_(f"API key created. Copy now: Key={api_key.plaintext_key} · Secret={api_key.secret_key}"), 'success')
     return redirect(url_for('client.api_management'))
 
 
@@ -364,6 +365,7 @@ def client_logout():
 # --- Dashboard ---
 @client_bp.route("/dashboard")
 @login_required
+@query_budget(8)
 def client_dashboard():
     # Check if user has client role or is a Client instance
     is_client = False
@@ -586,6 +588,15 @@ def create_withdrawal_request():
     form.currency.choices = [(c, c) for c in ["USDT", "BTC", "ETH"]]
 
     if form.validate_on_submit():
+        from app.utils.address_screening import log_screening_hit, screen_address
+        screening_hits = screen_address(form.user_wallet_address.data)
+        if screening_hits:
+            from flask_babel import _
+            log_screening_hit(form.user_wallet_address.data, screening_hits,
+                              client_id=client_data.id, context='client.create_withdrawal_request')
+            flash(_("This destination address cannot be used for withdrawals. Please contact support."), "danger")
+            return render_template("client/create_withdrawal_request.html", form=form)
+        
         req = WithdrawalRequest(
             client_id=client_data.id,
             currency=form.currency.data,
@@ -593,11 +604,16 @@ def create_withdrawal_request():
             user_wallet_address=form.user_wallet_address.data,
             memo=form.memo.data,
             note=form.note.data,
+            request_ip=request.remote_addr,
             status=WithdrawalStatus.PENDING,
             created_at=datetime.utcnow()
         )
         from app import db
+        from app.utils.entity_graph import record_withdrawal_links
         db.session.add(req)
+        record_withdrawal_links(client_data.id, form.user_wallet_address.data, request.remote_addr,
+                                user_id=current_user.id if isinstance(current_user, User) else None,
+                                memo=form.memo.data)
         db.session.commit()
         from flask_babel import _
         flash(_("Withdrawal request submitted and pending admin approval."), "success")
@@ -635,14 +651,12 @@ def api_keys():
     # Get client type for permissions display
     client_type = 'flat_rate' if client_data.package and 'flat' in client_data.package.name.lower() else 'commission'
     
-    # Create key stats (placeholder for now - can be enhanced with actual usage stats)
-    key_stats = {}
+    # Key stats come from the hourly usage rollups plus not yet compacted raw logs
+    from app.utils.usage_rollup import get_key_usage_summary
+    key_stats = get_key_usage_summary(key.id for key in api_keys)
     for key in api_keys:
-        key_stats[key.id] = {
-            'requests_count': 0,  # TODO: Implement actual API request tracking
-            'last_used': None,    # TODO: Implement last used tracking
-            'rate_limit_hits': 0  # TODO: Implement rate limit tracking
-        }
+        key_stats[key.id]['requests_count'] = key_stats[key.id]['total_usage']
+        key_stats[key.id]['last_used'] = key.last_used_at
     
     return render_template("client/api_keys.html", 
                          client=client_data,
@@ -670,12 +684,11 @@ def create_api_key():
     
     # Generate API key and secrets
     import secrets
-    import hashlib
     from app.models import ClientApiKey
     
     key_name = request.form.get('name', 'Default API Key')
     api_key = f"pk_{secrets.token_urlsafe(32)}"
-    key_hash = hashlib.sha256(api_key.encode()).hexdigest()
+    key_hash = ClientApiKey.hash_key(api_key)
     key_prefix = api_key[:8]
     
     # Generate secret key for signing requests
@@ -707,7 +720,6 @@ def create_api_key():
     new_api_key = ClientApiKey(
         client_id=client_data.id,
         name=key_name,
-        key=api_key,
         key_prefix=key_prefix,
         key_hash=key_hash,
         client_type=client_type,
@@ -758,10 +770,17 @@ def api_key_details(key_id):
     # Get base URL from config or default
     base_url = current_app.config.get('PAYCRYPT_BASE_URL', 'https://api.paycrypt.online/v1')
     
+    # Last 30 days of usage from the hourly rollups
+    from app.utils.usage_rollup import get_key_usage_summary
+    usage_summary = get_key_usage_summary(
+        [api_key.id], since=datetime.utcnow() - timedelta(days=30)
+    )[api_key.id]
+    
     return render_template("client/api_key_credentials.html", 
                          client=client_data,
                          api_key=api_key,
-                         base_url=base_url)
+                         base_url=base_url,
+                         usage_summary=usage_summary)
 
 # --- API Documentation Page ---
 @client_bp.route("/api-docs", endpoint="api_docs")
@@ -1,7 +1,9 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, make_response, session, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, make_response, session, jsonify, current_app
+from sqlalchemy import text
 from app.models.payment_session import PaymentSession
 from app.extensions import db
 from datetime import datetime, timedelta
+import time
 from flask_login import current_user
 
 main_bp = Blueprint('main', __name__)
@@ -48,7 +50,20 @@ def pay():
 # --- Root-level Health Check Endpoint ---
 @main_bp.route('/health', methods=['GET'])
 def health():
-    return make_response({'status': 'ok', 'message': 'Service healthy'}, 200)
+    """Liveness plus a database round trip; 503 when the database is unreachable"""
+    started = time.perf_counter()
+    try:
+        db.session.execute(text('SELECT 1'))
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Health check database error: {e}")
+        return make_response({'status': 'error', 'message': 'Database unavailable', 'database': 'error'}, 503)
+    return make_response({
+        'status': 'ok',
+        'message': 'Service healthy',
+        'database': 'ok',
+        'database_ms': round((time.perf_counter() - started) * 1000, 2),
+    }, 200)
 
 @main_bp.route('/set_language', methods=['GET'])
 def set_language():
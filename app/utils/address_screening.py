@@ -0,0 +1,261 @@
+"""
+Screening of withdrawal destination addresses against sanctions/blacklists.
+
+Each list is compiled offline (``scripts/build_screening_index.py``) into one
+binary index file::
+
+    header (64 bytes) | Bloom filter bits | sorted uint64 fingerprints
+
+A fingerprint is the first 8 bytes of BLAKE2b over the normalised address.
+Index files are opened with ``mmap`` read-only, so every gunicorn worker
+shares the same page-cache copy. A lookup checks the Bloom filter first (most
+addresses are clean and stop there) and then binary-searches the fingerprint
+array. Lists are swapped in when a file is replaced on disk; builders write
+to a temporary file and ``os.replace`` it, so readers never see a partial
+index.
+"""
+import bisect
+import hashlib
+import logging
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+
+from flask import current_app, has_app_context
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'PCSCRN01'
+HEADER = struct.Struct('<8sQQI36x')  # magic, entry count, bloom bits, bloom hashes
+INDEX_SUFFIX = '.idx'
+RELOAD_INTERVAL = int(os.getenv('SCREENING_RELOAD_INTERVAL', '30'))
+
+_CASE_INSENSITIVE_PREFIXES = ('0x', 'bc1', 'tb1', 'ltc1', 'bcrt1')
+
+
+def normalize_address(address):
+    """Canonical form used for fingerprints (hex and bech32 addresses are lowercased)"""
+    address = (address or '').strip()
+    if address.lower().startswith(_CASE_INSENSITIVE_PREFIXES):
+        return address.lower()
+    return address
+
+
+def fingerprint(address):
+    """64-bit fingerprint of a normalised address"""
+    digest = hashlib.blake2b(normalize_address(address).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+def _bloom_positions(fp, num_bits, num_hashes):
+    # Kirsch-Mitzenmacher double hashing from the two halves of the fingerprint
+    h1 = fp & 0xFFFFFFFF
+    h2 = (fp >> 32) | 1
+    return [(h1 + i * h2) % num_bits for i in range(num_hashes)]
+
+
+def build_index(addresses, path, false_positive_rate=0.001):
+    """
+    Compile addresses into an index file, replacing ``path`` atomically.
+
+    Args:
+        addresses: Iterable of address strings (blank entries are ignored)
+        path: Destination index file
+        false_positive_rate: Target Bloom filter false positive rate
+
+    Returns:
+        int: Number of distinct fingerprints written
+    """
+    fingerprints = array('Q', sorted({fingerprint(a) for a in addresses if a and a.strip()}))
+    count = len(fingerprints)
+
+    num_bits = max(64, int(-count * math.log(false_positive_rate) / (math.log(2) ** 2)))
+    num_bits = (num_bits + 63) // 64 * 64
+    num_hashes = max(1, round(num_bits / max(count, 1) * math.log(2)))
+    bloom = bytearray(num_bits // 8)
+    for fp in fingerprints:
+        for pos in _bloom_positions(fp, num_bits, num_hashes):
+            bloom[pos >> 3] |= 1 << (pos & 7)
+
+    if fingerprints.itemsize != 8:  # pragma: no cover - exotic platforms
+        raise RuntimeError('uint64 arrays are not 8 bytes on this platform')
+
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, 'wb') as fh:
+        fh.write(HEADER.pack(MAGIC, count, num_bits, num_hashes))
+        fh.write(bloom)
+        fingerprints.tofile(fh)
+    os.replace(tmp_path, path)
+    return count
+
+
+class ScreeningIndex:
+    """Read-only view of one memory-mapped index file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)[:-len(INDEX_SUFFIX)]
+        with open(path, 'rb') as fh:
+            stat = os.fstat(fh.fileno())
+            self.identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            self._mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.count, self.num_bits, self.num_hashes = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a screening index')
+        bloom_start = HEADER.size
+        fp_start = bloom_start + self.num_bits // 8
+        if len(self._mmap) != fp_start + self.count * 8:
+            raise ValueError(f'{path} is truncated')
+        self._bloom = memoryview(self._mmap)[bloom_start:fp_start]
+        self._fingerprints = memoryview(self._mmap)[fp_start:].cast('Q')
+
+    def contains_fingerprint(self, fp):
+        bloom = self._bloom
+        for pos in _bloom_positions(fp, self.num_bits, self.num_hashes):
+            if not bloom[pos >> 3] & (1 << (pos & 7)):
+                return False
+        fingerprints = self._fingerprints
+        i = bisect.bisect_left(fingerprints, fp)
+        return i < self.count and fingerprints[i] == fp
+
+    def __contains__(self, address):
+        return self.contains_fingerprint(fingerprint(address))
+
+    def __len__(self):
+        return self.count
+
+
+class AddressScreener:
+    """
+    All index files in a directory, keyed by list name (file stem).
+
+    The directory is rescanned at most every ``reload_interval`` seconds;
+    new or replaced files are mapped and swapped in, removed files dropped.
+    """
+
+    def __init__(self, directory=None, reload_interval=RELOAD_INTERVAL):
+        self.directory = directory
+        self.reload_interval = reload_interval
+        self._indexes = {}
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def _resolve_directory(self):
+        if self.directory:
+            return self.directory
+        if has_app_context():
+            return (current_app.config.get('SCREENING_INDEX_DIR')
+                    or os.path.join(current_app.instance_path, 'screening'))
+        return None
+
+    def reload(self):
+        """
+        Rescan the index directory and swap in changed lists.
+
+        Returns:
+            dict: list name -> number of entries
+        """
+        directory = self._resolve_directory()
+        indexes = dict(self._indexes)
+        found = set()
+        if directory and os.path.isdir(directory):
+            for filename in os.listdir(directory):
+                if not filename.endswith(INDEX_SUFFIX):
+                    continue
+                path = os.path.join(directory, filename)
+                name = filename[:-len(INDEX_SUFFIX)]
+                found.add(name)
+                try:
+                    stat = os.stat(path)
+                    current = indexes.get(name)
+                    if current is None or current.identity != (stat.st_ino, stat.st_mtime_ns, stat.st_size):
+                        indexes[name] = ScreeningIndex(path)
+                        logger.info("Loaded screening list %s (%d entries)", name, len(indexes[name]))
+                except (OSError, ValueError) as e:
+                    logger.error(f"Failed to load screening list {path}: {e}")
+        for name in set(indexes) - found:
+            del indexes[name]
+        # Old mappings are released once in-flight lookups drop their references
+        self._indexes = indexes
+        return {name: len(index) for name, index in indexes.items()}
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.reload_interval:
+            return
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.reload_interval:
+                return
+            self._checked_at = now
+            self.reload()
+
+    def screen(self, address):
+        """
+        Check one address against every loaded list.
+
+        Returns:
+            list: Names of the lists containing the address (empty when clean)
+        """
+        self._maybe_reload()
+        if not address:
+            return []
+        fp = fingerprint(address)
+        return [name for name, index in self._indexes.items() if index.contains_fingerprint(fp)]
+
+    def screen_many(self, addresses):
+        """
+        Batch screening (e.g. bulk withdrawal uploads).
+
+        Returns:
+            dict: address -> list names, for flagged addresses only
+        """
+        self._maybe_reload()
+        indexes = list(self._indexes.items())
+        hits = {}
+        for address in addresses:
+            if not address:
+                continue
+            fp = fingerprint(address)
+            matched = [name for name, index in indexes if index.contains_fingerprint(fp)]
+            if matched:
+                hits[address] = matched
+        return hits
+
+    @property
+    def lists(self):
+        return {name: len(index) for name, index in self._indexes.items()}
+
+
+address_screener = AddressScreener(os.getenv('SCREENING_INDEX_DIR'))
+
+
+def screen_address(address):
+    """Names of the screening lists that contain ``address``"""
+    return address_screener.screen(address)
+
+
+def screen_addresses(addresses):
+    """Flagged addresses from ``addresses`` mapped to the lists that contain them"""
+    return address_screener.screen_many(addresses)
+
+
+def log_screening_hit(address, lists, client_id=None, context=None):
+    """Record a blocked address as a critical security event and flag it for linked-entity scoring"""
+    from app.utils.audit import log_security_event
+    from app.utils.entity_graph import entity_graph, entity_key
+    try:
+        entity_graph.flag(entity_key('address', address), 'screening:' + ','.join(lists))
+    except Exception as e:
+        logger.error(f"Failed to flag screened address: {e}")
+    log_security_event(
+        event_type='withdrawal_address_screened',
+        details={'address': address, 'lists': lists, 'client_id': client_id, 'context': context},
+        user_id=client_id,
+        severity='critical',
+        actor_type='client' if client_id else None
+    )
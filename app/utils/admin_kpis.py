@@ -0,0 +1,194 @@
+"""
+Admin dashboard KPIs.
+
+All figures are computed with aggregate queries over indexed columns so the
+cost does not grow with the number of client rows. Results are cached in
+process for a short TTL; once stale, the previous value keeps being served
+while a background thread recomputes it.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, func, case
+
+from app.extensions import db
+from app.models.client import Client
+from app.models.payment import Payment
+from app.models.withdrawal import WithdrawalRequest
+from app.models.enums import PaymentStatus, WithdrawalStatus
+
+logger = logging.getLogger(__name__)
+
+KPI_TTL_SECONDS = int(os.getenv('ADMIN_KPI_TTL', '60'))
+TOP_CLIENTS_LIMIT = 5
+
+# Payments that count towards volume and commission
+SUCCESSFUL_PAYMENT_STATUSES = (PaymentStatus.APPROVED, PaymentStatus.COMPLETED)
+
+_cache = {'value': None, 'computed_at': 0.0}
+_lock = threading.Lock()
+_refreshing = threading.Event()
+
+
+def _percent_change(current, previous):
+    if not previous:
+        return 0.0
+    return (current - previous) / previous * 100
+
+
+def _window_stats(start, end):
+    """Return (total, successful, volume) for payments created in [start, end)"""
+    successful = Payment._status.in_(SUCCESSFUL_PAYMENT_STATUSES)
+    total, ok, volume = db.session.query(
+        func.count(Payment.id),
+        func.sum(case((successful, 1), else_=0)),
+        func.sum(case((successful, Payment.amount), else_=0))
+    ).filter(
+        Payment.created_at >= start,
+        Payment.created_at < end
+    ).one()
+    return total or 0, int(ok or 0), float(volume or 0)
+
+
+def _total_commission(until=None):
+    """Platform commission across all clients, mirroring FinanceCalculator.calculate_commission"""
+    deposit_rate = func.coalesce(Client.deposit_commission_rate, 0.035)
+    withdrawal_rate = func.coalesce(Client.withdrawal_commission_rate, 0.015)
+
+    deposits = db.session.query(func.sum(Payment.amount * deposit_rate)).join(
+        Client, Client.id == Payment.client_id
+    ).filter(Payment._status == PaymentStatus.APPROVED)
+    withdrawals = db.session.query(func.sum(WithdrawalRequest.amount * withdrawal_rate)).join(
+        Client, Client.id == WithdrawalRequest.client_id
+    ).filter(WithdrawalRequest.status == WithdrawalStatus.APPROVED)
+
+    if until is not None:
+        deposits = deposits.filter(Payment.created_at < until)
+        withdrawals = withdrawals.filter(WithdrawalRequest.created_at < until)
+
+    return float(deposits.scalar() or 0) + float(withdrawals.scalar() or 0)
+
+
+def _top_clients(since):
+    """Top clients by successful payment volume since ``since``"""
+    volume = func.sum(Payment.amount).label('total_volume')
+    rows = db.session.query(
+        Client.id, Client.company_name, Client.email,
+        volume, func.count(Payment.id).label('transaction_count')
+    ).join(Payment, Payment.client_id == Client.id).filter(
+        Payment.created_at >= since,
+        Payment._status.in_(SUCCESSFUL_PAYMENT_STATUSES)
+    ).group_by(Client.id, Client.company_name, Client.email).order_by(
+        volume.desc()
+    ).limit(TOP_CLIENTS_LIMIT).all()
+
+    return [{
+        'id': row.id,
+        'company_name': row.company_name,
+        'email': row.email,
+        'total_volume': float(row.total_volume or 0),
+        'transaction_count': row.transaction_count
+    } for row in rows]
+
+
+def compute_dashboard_kpis():
+    """
+    Compute dashboard KPIs from aggregate queries.
+
+    Returns:
+        dict: stats consumed by admin/dashboard.html, plus ``top_clients``
+    """
+    now = datetime.utcnow()
+    day_ago = now - timedelta(days=1)
+    two_days_ago = now - timedelta(days=2)
+
+    total_clients, active_clients, new_active_clients_24h = db.session.query(
+        func.count(Client.id),
+        func.sum(case((Client.is_active.is_(True), 1), else_=0)),
+        func.sum(case((and_(Client.is_active.is_(True), Client.created_at >= day_ago), 1), else_=0))
+    ).one()
+    total_clients = total_clients or 0
+    active_clients = int(active_clients or 0)
+    new_active_clients_24h = int(new_active_clients_24h or 0)
+
+    pending_withdrawals = db.session.query(func.count(WithdrawalRequest.id)).filter(
+        WithdrawalRequest.status == WithdrawalStatus.PENDING
+    ).scalar() or 0
+
+    total_24h, ok_24h, volume_24h = _window_stats(day_ago, now)
+    total_prev, ok_prev, _ = _window_stats(two_days_ago, day_ago)
+    success_rate = ok_24h / total_24h * 100 if total_24h else 0.0
+    success_rate_prev = ok_prev / total_prev * 100 if total_prev else 0.0
+
+    total_commission = _total_commission()
+    commission_before = _total_commission(until=day_ago)
+
+    return {
+        'total_clients': total_clients,
+        'active_clients': active_clients,
+        'active_clients_change': _percent_change(active_clients, active_clients - new_active_clients_24h),
+        'pending_withdrawals': pending_withdrawals,
+        'volume_24h': volume_24h,
+        'transactions_24h': total_24h,
+        'success_rate': success_rate,
+        'success_rate_change': success_rate - success_rate_prev,
+        'total_commission': total_commission,
+        'commission_change': _percent_change(total_commission, commission_before),
+        'top_clients': _top_clients(now - timedelta(days=30)),
+        'computed_at': now
+    }
+
+
+def _refresh_in_background(app):
+    def worker():
+        try:
+            with app.app_context():
+                value = compute_dashboard_kpis()
+                db.session.remove()
+            with _lock:
+                _cache['value'] = value
+                _cache['computed_at'] = time.monotonic()
+        except Exception:
+            logger.exception("Failed to refresh admin dashboard KPIs")
+        finally:
+            _refreshing.clear()
+
+    if _refreshing.is_set():
+        return
+    _refreshing.set()
+    threading.Thread(target=worker, name='admin-kpi-refresh', daemon=True).start()
+
+
+def get_dashboard_kpis(ttl=None):
+    """
+    Return cached dashboard KPIs.
+
+    The first call computes synchronously. Afterwards a stale value is returned
+    immediately and a single background refresh is started.
+    """
+    ttl = KPI_TTL_SECONDS if ttl is None else ttl
+    with _lock:
+        value = _cache['value']
+        age = time.monotonic() - _cache['computed_at']
+
+    if value is None:
+        value = compute_dashboard_kpis()
+        with _lock:
+            _cache['value'] = value
+            _cache['computed_at'] = time.monotonic()
+        return value
+
+    if age > ttl:
+        _refresh_in_background(current_app._get_current_object())
+    return value
+
+
+def invalidate_dashboard_kpis():
+    """Drop the cached KPIs so the next request recomputes them"""
+    with _lock:
+        _cache['value'] = None
+        _cache['computed_at'] = 0.0
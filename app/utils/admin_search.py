@@ -0,0 +1,186 @@
+"""
+Unified admin search over clients, payments, payment sessions and withdrawals.
+
+On PostgreSQL the searchable columns carry ``pg_trgm`` GIN indexes, so the
+``ILIKE '%term%'`` filter is an index scan and results are ranked by trigram
+similarity. Other databases (SQLite in tests) fall back to a plain ILIKE with
+exact/prefix ranking. Exact matches on identifiers always rank first.
+
+Each result type is paginated independently with a keyset cursor on
+``(score, id)``. Trigram scores are cast to ``numeric(6,5)`` so the value
+carried in the cursor compares equal to the one the next page recomputes.
+"""
+from decimal import Decimal, InvalidOperation
+
+from sqlalchemy import Numeric, and_, case, cast, func, literal, or_
+
+from app.extensions import db
+from app.models.client import Client
+from app.models.payment import Payment
+from app.models.payment_session import PaymentSession
+from app.models.withdrawal import WithdrawalRequest
+from app.utils.pagination import encode_cursor, decode_cursor
+
+MIN_QUERY_LENGTH = 3  # pg_trgm indexes only help from three characters up
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+SCORE_QUANTUM = Decimal('0.00001')  # matches numeric(6,5)
+
+# type -> (model, searchable columns)
+SEARCH_TARGETS = {
+    'clients': (Client, ('company_name', 'email', 'name', 'username')),
+    'payments': (Payment, ('transaction_id', 'description')),
+    'payment_sessions': (PaymentSession, ('public_id', 'order_id', 'customer_email')),
+    'withdrawals': (WithdrawalRequest, ('crypto_address', 'user_wallet_address')),
+}
+
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _use_trigram():
+    return db.engine.dialect.name == 'postgresql'
+
+
+def text_search_filter(model, column_names, term):
+    """Case-insensitive substring filter over ``column_names`` (trigram-index friendly)"""
+    pattern = f"%{_escape_like(term)}%"
+    return or_(*[getattr(model, name).ilike(pattern, escape='\\') for name in column_names])
+
+
+def _score_expression(model, column_names, term):
+    columns = [getattr(model, name) for name in column_names]
+    lowered = term.lower()
+    exact = or_(*[func.lower(col) == lowered for col in columns])
+
+    if _use_trigram():
+        similarity = func.greatest(*[func.coalesce(func.similarity(col, term), 0) for col in columns]) \
+            if len(columns) > 1 else func.coalesce(func.similarity(columns[0], term), 0)
+        return cast(case((exact, literal(1.0)), else_=literal(0.0)) + similarity, Numeric(6, 5))
+
+    prefix_pattern = f"{_escape_like(lowered)}%"
+    prefix = or_(*[func.lower(col).like(prefix_pattern, escape='\\') for col in columns])
+    return case((exact, literal(2.0)), (prefix, literal(1.0)), else_=literal(0.0))
+
+
+def _cursor_score(value):
+    return str(Decimal(str(value or 0)).quantize(SCORE_QUANTUM))
+
+
+def _parse_cursor_score(value):
+    try:
+        score = Decimal(value).quantize(SCORE_QUANTUM)
+    except (InvalidOperation, TypeError):
+        raise ValueError('Invalid cursor')
+    return score if _use_trigram() else float(score)
+
+
+def _serialize(kind, obj):
+    if kind == 'clients':
+        return {
+            'id': obj.id,
+            'title': obj.company_name,
+            'subtitle': obj.email,
+            'status': 'active' if obj.is_active else 'inactive',
+            'created_at': obj.created_at
+        }
+    if kind == 'payments':
+        return {
+            'id': obj.id,
+            'title': obj.transaction_id or f"Payment #{obj.id}",
+            'subtitle': f"{obj.amount} {obj.currency or ''}".strip(),
+            'status': obj.status.value if obj.status else None,
+            'client_id': obj.client_id,
+            'created_at': obj.created_at
+        }
+    if kind == 'payment_sessions':
+        return {
+            'id': obj.id,
+            'title': obj.public_id,
+            'subtitle': f"Order {obj.order_id}",
+            'status': obj.status,
+            'client_id': obj.client_id,
+            'created_at': obj.created_at
+        }
+    return {
+        'id': obj.id,
+        'title': obj.crypto_address,
+        'subtitle': f"{obj.amount} {obj.currency}",
+        'status': obj.status.value if obj.status else None,
+        'client_id': obj.client_id,
+        'created_at': obj.created_at
+    }
+
+
+def search_type(kind, term, limit=DEFAULT_LIMIT, cursor=None):
+    """
+    Search a single entity type.
+
+    Args:
+        kind: Key of ``SEARCH_TARGETS``
+        term: Search string
+        limit: Page size
+        cursor: Cursor returned by a previous call for the same kind
+
+    Returns:
+        dict: ``{'results': [...], 'next_cursor': str or None}``
+
+    Raises:
+        ValueError: On unknown kind or malformed cursor
+    """
+    if kind not in SEARCH_TARGETS:
+        raise ValueError(f"Unknown search type: {kind}")
+    model, column_names = SEARCH_TARGETS[kind]
+    limit = max(1, min(limit, MAX_LIMIT))
+
+    score = _score_expression(model, column_names, term).label('score')
+    query = db.session.query(model, score).filter(text_search_filter(model, column_names, term))
+
+    if cursor:
+        last_score, last_id = decode_cursor(cursor, size=2)
+        last_score = _parse_cursor_score(last_score)
+        query = query.filter(or_(
+            score < last_score,
+            and_(score == last_score, model.id < last_id)
+        ))
+
+    rows = query.order_by(score.desc(), model.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    results = []
+    for obj, row_score in rows:
+        item = _serialize(kind, obj)
+        item['type'] = kind
+        item['score'] = float(row_score or 0)
+        results.append(item)
+
+    next_cursor = None
+    if has_more and rows:
+        last_obj, last_score = rows[-1]
+        next_cursor = encode_cursor([_cursor_score(last_score), last_obj.id])
+    return {'results': results, 'next_cursor': next_cursor}
+
+
+def admin_search(term, types=None, limit=DEFAULT_LIMIT, cursors=None):
+    """
+    Search every requested entity type.
+
+    Args:
+        term: Search string (at least ``MIN_QUERY_LENGTH`` characters)
+        types: Iterable of ``SEARCH_TARGETS`` keys, defaults to all
+        limit: Page size per type
+        cursors: Optional mapping of type -> cursor
+
+    Returns:
+        dict: type -> ``{'results': [...], 'next_cursor': ...}``
+    """
+    term = (term or '').strip()
+    if len(term) < MIN_QUERY_LENGTH:
+        return {}
+    cursors = cursors or {}
+    return {
+        kind: search_type(kind, term, limit=limit, cursor=cursors.get(kind))
+        for kind in (types or SEARCH_TARGETS.keys())
+    }
@@ -2,10 +2,11 @@
 Audit logging utilities for the CPGateway application.
 """
 
-from flask import request
+from flask import request, has_request_context, current_app
 from flask_login import current_user
-from app.models.audit import AuditTrail
+from app.models.audit import AuditTrail, SecurityEvent, ApiUsageEvent
 from app.extensions import db
+from app.utils.security_event_aggregator import security_event_aggregator
 from app.models.user import User
 from app.models.admin import AdminUser
 import logging
@@ -62,8 +63,32 @@ def log_audit(action, model, model_id, description, old_values=None, new_values=
         return False
 
 
+def _request_value(getter):
+    """Read a request attribute, returning None outside a request context"""
+    try:
+        return getter() if has_request_context() else None
+    except Exception:
+        return None
+
+
+def _current_actor():
+    """Return (actor_type, actor_id) for the logged in user or client"""
+    if not has_request_context():
+        return None, None
+    try:
+        if not current_user.is_authenticated:
+            return None, None
+        actor_id = getattr(current_user, 'id', None)
+        if isinstance(current_user._get_current_object(), User):
+            return 'user', actor_id
+        return 'client', actor_id
+    except Exception:
+        return None, None
+
+
 def log_security_event(event_type: str, details: Dict[str, Any], user_id: Optional[int] = None, 
-                      severity: str = 'medium', ip_address: Optional[str] = None):
+                      severity: str = 'medium', ip_address: Optional[str] = None,
+                      actor_type: Optional[str] = None):
     """
     Log security-related events for monitoring and analysis
     
@@ -73,42 +98,23 @@ def log_security_event(event_type: str, details: Dict[str, Any], user_id: Option
         user_id: User ID if applicable
         severity: Event severity (low, medium, high, critical)
         ip_address: IP address if different from request
+        actor_type: Kind of actor user_id refers to (user, client, api_key, system)
     """
     try:
-        # Get current user if not provided
-        if user_id is None and hasattr(current_user, 'id'):
-            user_id = current_user.id
-        
-        # Get IP address
-        if ip_address is None and request:
-            ip_address = request.remote_addr
-        
-        # Enhanced details
-        enhanced_details = {
-            'event_type': event_type,
-            'severity': severity,
-            'timestamp': datetime.utcnow().isoformat(),
-            'ip_address': ip_address,
-            'user_agent': request.headers.get('User-Agent') if request else None,
-            'endpoint': request.endpoint if request else None,
-            'method': request.method if request else None,
-            **details
-        }
+        if user_id is None:
+            actor_type, user_id = _current_actor()
+        elif actor_type is None:
+            actor_type = 'user'
         
-        # Log to AuditTrail with security event type
-        audit = AuditTrail.log_action(
-            user_id=user_id,
-            action_type=f'security_{event_type}',
-            entity_type='security_event',
-            entity_id=0,  # No specific entity
-            old_value=None,
-            new_value=enhanced_details,
-            request=request
-        )
+        if ip_address is None:
+            ip_address = _request_value(lambda: request.remote_addr)
         
-        db.session.commit()
+        user_agent = _request_value(lambda: request.headers.get('User-Agent'))
+        user_agent = user_agent[:255] if user_agent else None
+        endpoint = _request_value(lambda: request.endpoint)
+        method = _request_value(lambda: request.method)
         
-        # Also log to application logger based on severity
+        # Log to application logger based on severity
         log_level = {
             'low': logging.INFO,
             'medium': logging.WARNING,
@@ -116,6 +122,37 @@ def log_security_event(event_type: str, details: Dict[str, Any], user_id: Option
             'critical': logging.CRITICAL
         }.get(severity, logging.WARNING)
         
+        if severity != 'critical' and current_app.config.get('SECURITY_EVENT_AGGREGATION', True):
+            # Repeated events are counted in memory and written as one row per window
+            first_in_window = security_event_aggregator.record(
+                current_app._get_current_object(),
+                event_type[:64], severity,
+                ip_address=ip_address,
+                actor_type=actor_type,
+                actor_id=user_id,
+                endpoint=endpoint,
+                method=method,
+                user_agent=user_agent,
+                details=details
+            )
+            if first_in_window:
+                logger.log(log_level, f"Security event [{severity.upper()}]: {event_type} - {details}")
+            return
+        
+        event = SecurityEvent(
+            event_type=event_type[:64],
+            severity=severity,
+            actor_type=actor_type,
+            actor_id=user_id,
+            ip_address=ip_address,
+            user_agent=user_agent,
+            endpoint=endpoint,
+            method=method,
+            details=details
+        )
+        db.session.add(event)
+        db.session.commit()
+        
         logger.log(log_level, f"Security event [{severity.upper()}]: {event_type} - {details}")
         
     except Exception as e:
@@ -198,31 +235,17 @@ def log_api_usage(api_key: str, endpoint: str, method: str, response_code: int,
         # Hash API key for privacy
         api_key_hash = hashlib.sha256(api_key.encode()).hexdigest()[:16]
         
-        usage_details = {
-            'api_key_hash': api_key_hash,
-            'endpoint': endpoint,
-            'method': method,
-            'response_code': response_code,
-            'response_time_ms': response_time,
-            'timestamp': datetime.utcnow().isoformat(),
-            'ip_address': request.remote_addr if request else None,
-            'user_agent': request.headers.get('User-Agent') if request else None
-        }
-        
-        if error_message:
-            usage_details['error_message'] = error_message
-        
-        # Log to audit trail
-        audit = AuditTrail.log_action(
-            user_id=None,  # API usage is not tied to a specific user
-            action_type='api_usage',
-            entity_type='api_endpoint',
-            entity_id=0,
-            old_value=None,
-            new_value=usage_details,
-            request=request
-        )
-        
+        user_agent = _request_value(lambda: request.headers.get('User-Agent'))
+        db.session.add(ApiUsageEvent(
+            api_key_hash=api_key_hash,
+            endpoint=endpoint[:100],
+            method=method,
+            status_code=response_code,
+            response_time_ms=response_time,
+            ip_address=_request_value(lambda: request.remote_addr),
+            user_agent=user_agent[:255] if user_agent else None,
+            error_message=error_message[:255] if error_message else None
+        ))
         db.session.commit()
         
         # Log anomalies
@@ -280,37 +303,41 @@ def log_transaction_decision(transaction_id: int, decision: str, reason: str,
     )
 
 
-def get_security_events(hours: int = 24, severity: Optional[str] = None, 
-                       event_type: Optional[str] = None) -> List[AuditTrail]:
+def get_security_events(hours: int = 24, severity: Optional[Any] = None, 
+                       event_type: Optional[str] = None, limit: Optional[int] = None) -> List[SecurityEvent]:
     """
-    Retrieve security events from audit log
+    Retrieve security events, newest first
     
     Args:
         hours: Number of hours to look back
-        severity: Filter by severity level
+        severity: Severity level, or a list of levels
         event_type: Filter by event type
+        limit: Maximum number of events to return
         
     Returns:
-        List of AuditTrail records
+        List of SecurityEvent records
     """
     try:
         from datetime import timedelta
         
         since = datetime.utcnow() - timedelta(hours=hours)
         
-        query = AuditTrail.query.filter(
-            AuditTrail.action_type.like('security_%'),
-            AuditTrail.created_at >= since
-        )
+        # created_at bounds let PostgreSQL prune to the recent partitions
+        query = SecurityEvent.query.filter(SecurityEvent.created_at >= since)
         
         if severity:
-            # Filter by severity in new_value JSON
-            query = query.filter(AuditTrail.new_value.contains(f'"severity": "{severity}"'))
+            if isinstance(severity, (list, tuple, set)):
+                query = query.filter(SecurityEvent.severity.in_(list(severity)))
+            else:
+                query = query.filter(SecurityEvent.severity == severity)
         
         if event_type:
-            query = query.filter(AuditTrail.action_type == f'security_{event_type}')
+            query = query.filter(SecurityEvent.event_type == event_type)
         
-        return query.order_by(AuditTrail.created_at.desc()).all()
+        query = query.order_by(SecurityEvent.created_at.desc())
+        if limit:
+            query = query.limit(limit)
+        return query.all()
         
     except Exception as e:
         logger.error(f"Failed to retrieve security events: {e}")
@@ -0,0 +1,195 @@
+"""
+Monthly partition management for the audit event tables.
+
+On PostgreSQL ``security_events`` and ``api_usage_events`` are declared
+``PARTITION BY RANGE (created_at)`` with one child table per month, named
+``<table>_pYYYYMM``. Upcoming months are created ahead of time, rows that
+fell into the default partition are moved into their month's partition, and
+retention drops whole partitions instead of deleting rows. Other databases have plain
+tables, where retention falls back to batched deletes.
+"""
+import logging
+import os
+from datetime import datetime
+
+from sqlalchemy import text
+
+from app.extensions import db
+
+logger = logging.getLogger(__name__)
+
+# table -> retention in months
+PARTITIONED_TABLES = {
+    'security_events': int(os.getenv('SECURITY_EVENT_RETENTION_MONTHS', '12')),
+    'api_usage_events': int(os.getenv('API_USAGE_RETENTION_MONTHS', '3')),
+}
+
+MONTHS_AHEAD = 2
+DELETE_BATCH_SIZE = 10000
+
+
+def _month_start(year, month):
+    """First day of the month, normalising month overflow/underflow"""
+    year += (month - 1) // 12
+    month = (month - 1) % 12 + 1
+    return datetime(year, month, 1)
+
+
+def _add_months(dt, months):
+    return _month_start(dt.year, dt.month + months)
+
+
+def partition_name(table, month_start):
+    return f"{table}_p{month_start:%Y%m}"
+
+
+def _is_postgres():
+    return db.engine.dialect.name == 'postgresql'
+
+
+def create_partition_sql(table, month_start):
+    """DDL for the partition covering the month starting at ``month_start``"""
+    month_end = _add_months(month_start, 1)
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(table, month_start)} "
+        f"PARTITION OF {table} FOR VALUES FROM ('{month_start:%Y-%m-%d}') TO ('{month_end:%Y-%m-%d}')"
+    )
+
+
+def ensure_partitions(months_ahead=MONTHS_AHEAD, now=None):
+    """
+    Create partitions for the current month and ``months_ahead`` following months.
+
+    Rows that landed in the default partition while their month had none are
+    moved into a newly created partition for that month, keeping the default
+    partition empty; anything left there afterwards is logged as an error.
+
+    Returns:
+        list: Names of partitions that were checked/created (empty when not on PostgreSQL)
+    """
+    if not _is_postgres():
+        return []
+
+    now = now or datetime.utcnow()
+    current = _month_start(now.year, now.month)
+    names = []
+    with db.engine.begin() as conn:
+        for table, retention_months in PARTITIONED_TABLES.items():
+            existing = set(_list_partitions(conn, table))
+            months = [_add_months(current, offset) for offset in range(months_ahead + 1)]
+            months += _stranded_months(conn, table, existing, _add_months(current, -retention_months))
+            for month_start in sorted(set(months)):
+                _create_partition(conn, table, month_start, existing)
+                names.append(partition_name(table, month_start))
+
+            default = f'{table}_default'
+            if default in existing:
+                left = conn.execute(text(f"SELECT count(*) FROM {default}")).scalar()
+                if left:
+                    logger.error("%s rows remain in %s; check its created_at values", left, default)
+    return names
+
+
+def _stranded_months(conn, table, existing, cutoff):
+    """Unexpired months with rows in the default partition"""
+    default = f'{table}_default'
+    if default not in existing:
+        return []
+    rows = conn.execute(text(
+        f"SELECT DISTINCT date_trunc('month', created_at) FROM {default} WHERE created_at >= :cutoff"
+    ), {'cutoff': cutoff})
+    return [_month_start(row[0].year, row[0].month) for row in rows]
+
+
+def _create_partition(conn, table, month_start, existing):
+    """
+    Create one monthly partition, moving its rows out of the default partition.
+
+    PostgreSQL refuses a new partition whose range already has rows in the
+    default partition, so the default is detached while they are moved.
+    """
+    name = partition_name(table, month_start)
+    if name in existing:
+        return
+    default = f'{table}_default'
+    params = {'start': month_start, 'end': _add_months(month_start, 1)}
+    in_range = "created_at >= :start AND created_at < :end"
+    stranded = default in existing and conn.execute(
+        text(f"SELECT EXISTS (SELECT 1 FROM {default} WHERE {in_range})"), params
+    ).scalar()
+
+    if not stranded:
+        conn.execute(text(create_partition_sql(table, month_start)))
+    else:
+        conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {default}"))
+        conn.execute(text(create_partition_sql(table, month_start)))
+        moved = conn.execute(text(f"INSERT INTO {name} SELECT * FROM {default} WHERE {in_range}"), params).rowcount
+        conn.execute(text(f"DELETE FROM {default} WHERE {in_range}"), params)
+        conn.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT"))
+        logger.warning("Moved %s rows from %s into new partition %s", moved, default, name)
+    existing.add(name)
+
+
+def drop_expired_partitions(now=None):
+    """
+    Enforce retention for every partitioned table.
+
+    PostgreSQL: detaches and drops monthly partitions that end before the
+    retention cutoff, and deletes expired rows from the default partition.
+    Elsewhere: deletes expired rows in batches.
+
+    Returns:
+        dict: table -> list of dropped partitions (or number of deleted rows)
+    """
+    now = now or datetime.utcnow()
+    current = _month_start(now.year, now.month)
+    result = {}
+
+    for table, retention_months in PARTITIONED_TABLES.items():
+        cutoff = _add_months(current, -retention_months)
+
+        if not _is_postgres():
+            result[table] = _delete_expired_rows(table, cutoff)
+            continue
+
+        dropped = []
+        with db.engine.begin() as conn:
+            for name in _list_partitions(conn, table):
+                if name == f'{table}_default':
+                    # Rows that arrived while their month had no partition
+                    deleted = conn.execute(text(f"DELETE FROM {name} WHERE created_at < :cutoff"),
+                                           {'cutoff': cutoff}).rowcount
+                    if deleted:
+                        logger.info("Deleted %s expired rows from %s", deleted, name)
+                    continue
+                suffix = name.rsplit('_p', 1)[-1]
+                if not suffix.isdigit() or len(suffix) != 6:
+                    continue  # foreign child
+                month_start = datetime(int(suffix[:4]), int(suffix[4:]), 1)
+                if _add_months(month_start, 1) <= cutoff:
+                    conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+                    conn.execute(text(f"DROP TABLE {name}"))
+                    dropped.append(name)
+        if dropped:
+            logger.info("Dropped expired %s partitions: %s", table, ', '.join(dropped))
+        result[table] = dropped
+    return result
+
+
+def _delete_expired_rows(table, cutoff):
+    total = 0
+    while True:
+        deleted = db.session.execute(text(
+            f"DELETE FROM {table} WHERE id IN "
+            f"(SELECT id FROM {table} WHERE created_at < :cutoff LIMIT :batch)"
+        ), {'cutoff': cutoff, 'batch': DELETE_BATCH_SIZE}).rowcount
+        db.session.commit()
+        total += deleted or 0
+        if not deleted or deleted < DELETE_BATCH_SIZE:
+            return total
+
+
+def maintain_partitions():
+    """Create upcoming partitions and apply retention; run daily"""
+    ensure_partitions()
+    return drop_expired_partitions()
@@ -0,0 +1,449 @@
+"""
+Cluster-wide invalidation bus for process-local caches.
+
+Every gunicorn worker keeps its own in-memory caches; when a row changes in
+one worker the others must drop what they hold. Changes are announced as
+``(namespace, key, version)`` messages:
+
+- ``namespace`` names the cache (``tag``, ``settings``, ``package``, ...)
+- ``key`` is the entry to drop, or None for the whole namespace
+- ``version`` is a ``time.time_ns()`` stamp; caches only evict entries
+  loaded before it, so late or duplicate messages are harmless. Receivers
+  stamp remote messages with their own clock on arrival rather than trusting
+  the publisher's, so clock skew between hosts can't keep stale entries
+
+Messages queued during a transaction are handed over from the session's
+``after_commit`` hook, so nothing is announced for rolled-back work. They go
+into an outbox drained by a sender thread, so a committing request never
+waits on the transport or on a second pooled connection. Transports:
+
+- ``postgres``: ``NOTIFY`` on a channel, with each worker holding one
+  dedicated ``LISTEN`` connection and one dedicated sending connection (the
+  default on PostgreSQL)
+- ``redis``: pub/sub on ``CACHE_BUS_REDIS_URL`` / ``REDIS_URL``
+- ``local``: single-process delivery only (SQLite, tests)
+
+Local subscribers are called synchronously on publish, and each worker's
+listener thread skips its own messages. After the listener reconnects,
+every subscriber is told to drop its whole namespace, since messages sent
+while it was disconnected are lost.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import select
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from app.extensions import db
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = os.getenv('CACHE_BUS_CHANNEL', 'paycrypt_cache')
+RECONNECT_DELAY = float(os.getenv('CACHE_BUS_RECONNECT_DELAY', '2'))
+PENDING_MESSAGES_KEY = 'pending_cache_bus_messages'
+MAX_PAYLOAD_BYTES = 7000  # NOTIFY payloads must stay under 8000 bytes
+OUTBOX_SIZE = int(os.getenv('CACHE_BUS_OUTBOX_SIZE', '10000'))
+SHUTDOWN_FLUSH_SECONDS = 2.0
+
+
+class _LocalTransport:
+    name = 'local'
+
+    def send(self, payload):
+        pass
+
+    def listen(self, deliver, connected, stop):
+        stop.wait()
+
+
+class _PostgresTransport:
+    name = 'postgres'
+
+    def __init__(self, app, channel):
+        self.app = app
+        self.channel = channel
+        self._send_conn = None
+        self._send_pid = None
+
+    def _engine(self):
+        with self.app.app_context():
+            return db.engine
+
+    def _dedicated_connection(self):
+        raw = self._engine().raw_connection()
+        raw.detach()
+        conn = raw.driver_connection
+        conn.autocommit = True
+        return conn
+
+    def send(self, payload):
+        # Only called from the bus's sender thread, over one persistent connection
+        if self._send_conn is None or self._send_pid != os.getpid():
+            self._send_conn, self._send_pid = self._dedicated_connection(), os.getpid()
+        try:
+            with self._send_conn.cursor() as cursor:
+                cursor.execute('SELECT pg_notify(%s, %s)', (self.channel, payload))
+        except Exception:
+            conn, self._send_conn = self._send_conn, None
+            try:
+                conn.close()
+            except Exception:
+                pass
+            raise
+
+    def listen(self, deliver, connected, stop):
+        # A dedicated connection taken out of the pool for the worker's lifetime
+        conn = self._dedicated_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(f'LISTEN "{self.channel}"')
+            connected()
+            while not stop.is_set():
+                if select.select([conn], [], [], 1.0) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    deliver(conn.notifies.pop(0).payload)
+        finally:
+            conn.close()
+
+
+class _RedisTransport:
+    name = 'redis'
+
+    def __init__(self, url, channel):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.channel = channel
+
+    def send(self, payload):
+        self.client.publish(self.channel, payload)
+
+    def listen(self, deliver, connected, stop):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(self.channel)
+            connected()
+            while not stop.is_set():
+                message = pubsub.get_message(timeout=1.0)
+                if message and message['type'] == 'message':
+                    deliver(message['data'])
+        finally:
+            pubsub.close()
+
+
+class CacheBus:
+    """Publishes invalidations and applies those from other processes"""
+
+    def __init__(self):
+        self.origin = uuid.uuid4().hex[:12]
+        self._subscribers = {}  # namespace -> [callback(key, version)]
+        self._transport = _LocalTransport()
+        self._listener_pid = None
+        self._sender_pid = None
+        self._sender = None
+        self._outbox = queue.Queue(OUTBOX_SIZE)
+        self._connections = 0
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self.stats = {'published': 0, 'received': 0, 'applied': 0, 'send_errors': 0, 'reconnects': 0}
+
+    def init_app(self, app):
+        """Pick the transport from ``CACHE_BUS`` (postgres, redis or local)"""
+        kind = app.config.get('CACHE_BUS') or os.getenv('CACHE_BUS')
+        if not kind:
+            kind = 'postgres' if app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgresql') else 'local'
+        channel = app.config.get('CACHE_BUS_CHANNEL', CHANNEL)
+        if kind == 'postgres':
+            self._transport = _PostgresTransport(app, channel)
+        elif kind == 'redis':
+            url = app.config.get('CACHE_BUS_REDIS_URL') or os.getenv('CACHE_BUS_REDIS_URL') or os.getenv('REDIS_URL')
+            self._transport = _RedisTransport(url, channel)
+        else:
+            self._transport = _LocalTransport()
+        # Listener threads don't survive a fork, so each worker starts its own
+        app.before_request(self.ensure_listening)
+
+    @property
+    def transport(self):
+        return self._transport.name
+
+    # --- subscribing ---
+
+    def subscribe(self, namespace, callback):
+        """
+        Call ``callback(key, version)`` for every invalidation in ``namespace``.
+
+        ``key`` is None when the whole namespace should be dropped.
+        """
+        self._subscribers.setdefault(namespace, []).append(callback)
+
+    def _apply(self, namespace, key, version):
+        for callback in self._subscribers.get(namespace, ()):
+            try:
+                callback(key, version)
+                self.stats['applied'] += 1
+            except Exception:
+                logger.exception(f"Cache invalidation handler for {namespace} failed")
+
+    def _reset_all(self):
+        version = time.time_ns()
+        for namespace in list(self._subscribers):
+            self._apply(namespace, None, version)
+
+    # --- publishing ---
+
+    def publish(self, namespace, key=None, version=None):
+        """Invalidate ``namespace``/``key`` in this process and announce it to the others"""
+        self.publish_many([(namespace, key, version or time.time_ns())])
+
+    def publish_many(self, messages):
+        messages = [[ns, key, version or time.time_ns()] for ns, key, version in messages]
+        for namespace, key, version in messages:
+            self._apply(namespace, key, version)
+        if self._transport.name == 'local':
+            return
+        self._ensure_sender()
+        for payload in self._payloads(messages):
+            try:
+                self._outbox.put_nowait(payload)
+            except queue.Full:
+                self.stats['send_errors'] += 1
+                logger.error(f"Cache bus outbox full; dropped an invalidation for {self._transport.name}")
+
+    def _payloads(self, messages):
+        batch, size = [], 0
+        for message in messages:
+            encoded = json.dumps(message, default=str)
+            if batch and size + len(encoded) > MAX_PAYLOAD_BYTES:
+                yield json.dumps({'o': self.origin, 'm': batch}, default=str)
+                batch, size = [], 0
+            batch.append(message)
+            size += len(encoded) + 1
+        if batch:
+            yield json.dumps({'o': self.origin, 'm': batch}, default=str)
+
+    def publish_on_commit(self, session, namespace, key=None):
+        """Queue an invalidation to be published once ``session`` commits"""
+        if session is None:
+            self.publish(namespace, key)
+            return
+        session.info.setdefault(PENDING_MESSAGES_KEY, {})[(namespace, key)] = None
+
+    def watch(self, model, namespace, key=None):
+        """
+        Publish an invalidation whenever a ``model`` row is inserted, updated or deleted.
+
+        Args:
+            model: Mapped class
+            namespace: Cache namespace to invalidate
+            key: Optional callable mapping the row to a key; None drops the namespace
+        """
+        def _queue(mapper, connection, target):
+            self.publish_on_commit(object_session(target), namespace, key(target) if key else None)
+
+        for name in ('after_insert', 'after_update', 'after_delete'):
+            event.listen(model, name, _queue)
+
+    # --- listening ---
+
+    def _deliver(self, payload):
+        try:
+            data = json.loads(payload)
+        except (TypeError, ValueError):
+            logger.warning("Ignoring malformed cache bus payload")
+            return
+        if data.get('o') == self.origin:
+            return
+        # Anything loaded before now may predate the publisher's commit
+        received = time.time_ns()
+        for namespace, key, _ in data.get('m', ()):
+            self.stats['received'] += 1
+            self._apply(namespace, key, received)
+
+    def _connected(self):
+        self._connections += 1
+        if self._connections > 1:
+            self.stats['reconnects'] += 1
+            self._reset_all()
+
+    def ensure_listening(self):
+        """Start this worker's listener thread if it isn't running"""
+        if self._listener_pid == os.getpid() or self._transport.name == 'local':
+            return
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+            # A forked worker gets its own identity so it hears the parent's messages
+            self.origin = uuid.uuid4().hex[:12]
+            self._connections = 0
+            self._stop.clear()
+            threading.Thread(target=self._run, name='cache-bus-listener', daemon=True).start()
+            atexit.register(self.shutdown)
+
+    def _ensure_sender(self):
+        """Start this process's sender thread if it isn't running"""
+        if self._sender_pid == os.getpid():
+            return
+        with self._lock:
+            if self._sender_pid == os.getpid():
+                return
+            self._sender_pid = os.getpid()
+            self._outbox = queue.Queue(OUTBOX_SIZE)  # The parent's queue and its lock don't survive a fork
+            self._sender = threading.Thread(target=self._send_loop, name='cache-bus-sender', daemon=True)
+            self._sender.start()
+            atexit.register(self._flush)
+
+    def _send_loop(self):
+        while True:
+            payload = self._outbox.get()
+            if payload is None:
+                return
+            while True:
+                try:
+                    self._transport.send(payload)
+                    self.stats['published'] += 1
+                    break
+                except Exception as e:
+                    self.stats['send_errors'] += 1
+                    logger.error(f"Failed to publish cache invalidation over {self._transport.name}: {e}")
+                    if self._stop.wait(RECONNECT_DELAY):
+                        return
+
+    def _flush(self):
+        """Send what is still queued before the process exits"""
+        if self._sender is None or self._sender_pid != os.getpid():
+            return
+        try:
+            self._outbox.put(None, timeout=SHUTDOWN_FLUSH_SECONDS)
+        except queue.Full:
+            return
+        self._sender.join(SHUTDOWN_FLUSH_SECONDS)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._transport.listen(self._deliver, self._connected, self._stop)
+            except Exception as e:
+                logger.error(f"Cache bus listener ({self._transport.name}) disconnected: {e}")
+                self._stop.wait(RECONNECT_DELAY)
+
+    def shutdown(self):
+        self._stop.set()
+
+
+cache_bus = CacheBus()
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_committed(session):
+    pending = session.info.pop(PENDING_MESSAGES_KEY, None)
+    if pending:
+        cache_bus.publish_many([(namespace, key, None) for namespace, key in pending])
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_pending_messages(session, previous_transaction):
+    if not session.in_transaction():
+        session.info.pop(PENDING_MESSAGES_KEY, None)
+
+
+class LocalCache:
+    """
+    Process-local dict cache kept coherent through ``cache_bus``.
+
+    Entries remember the version (``time.time_ns()``) taken before they were
+    loaded. An invalidation only drops entries loaded before its version, and
+    a load that started before a matching invalidation is not stored, so a
+    reader racing a writer can't cache the old row.
+    """
+
+    _instances = []
+
+    def __init__(self, namespace, maxsize=10000):
+        LocalCache._instances.append(self)
+        self.namespace = namespace
+        self.maxsize = maxsize
+        self._entries = {}  # key -> (version, value)
+        self._evicted = OrderedDict()  # key -> version of the latest invalidation
+        self._cleared_at = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+        cache_bus.subscribe(namespace, self.evict)
+
+    @classmethod
+    def instances(cls):
+        """Every LocalCache created in this process"""
+        return tuple(cls._instances)
+
+    @staticmethod
+    def version():
+        """Version to pass to ``set`` for a value about to be loaded"""
+        return time.time_ns()
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value, version):
+        """Store ``value`` unless it was invalidated after ``version``; returns True if stored"""
+        with self._lock:
+            if version < self._cleared_at or version < self._evicted.get(key, 0):
+                return False
+            current = self._entries.get(key)
+            if current is not None and current[0] > version:
+                return False
+            if current is None and len(self._entries) >= self.maxsize:
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = (version, value)
+            return True
+
+    def get_or_load(self, key, loader):
+        """Cached value, calling ``loader()`` and storing its result on a miss"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        version = self.version()
+        value = loader()
+        self.set(key, value, version)
+        return value
+
+    def evict(self, key, version):
+        """Drop ``key`` (or everything when None) if loaded before ``version``"""
+        with self._lock:
+            if key is None:
+                self._cleared_at = max(self._cleared_at, version)
+                self._entries = {k: e for k, e in self._entries.items() if e[0] >= version}
+                self._evicted = OrderedDict((k, v) for k, v in self._evicted.items() if v > version)
+                return
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < version:
+                del self._entries[key]
+            if version > self._evicted.get(key, 0):
+                self._evicted[key] = version
+                self._evicted.move_to_end(key)
+                while len(self._evicted) > self.maxsize:
+                    self._evicted.popitem(last=False)
+
+    def clear(self):
+        """Drop everything in this process only"""
+        with self._lock:
+            self._entries = {}
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,433 @@
+"""
+Two-tier cache with per-model namespaces and tag-based invalidation.
+
+L1 is a small per-process LRU with a short TTL; L2 is the Flask-Caching
+backend configured in ``create_app`` (Redis when ``CACHE_REDIS_URL`` or
+``REDIS_URL`` is set, otherwise per-process memory). Keys are stored as
+``<namespace>:<key>``.
+
+Invalidation works by tag versions rather than key scans: every entry
+records the current version token of each of its tags (and of its
+namespace) when it is computed, and a read whose recorded tokens no longer
+match is treated as a miss. Bumping ``client:12`` therefore invalidates every
+view cached for client 12 in every worker. Tag tokens are themselves held in
+L1 for ``CACHE_TAG_TTL`` seconds, which bounds how long another worker can
+keep serving an invalidated entry; tag bumps are also broadcast on the
+cache bus (app/utils/cache_bus.py) so other workers drop their copy of the
+token within milliseconds.
+
+Misses are single-flight: concurrent callers for the same key in one process
+share a single loader call, and across processes an L2 ``add`` lock lets one
+worker compute the value while the others briefly poll for it.
+"""
+import functools
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.extensions import cache
+from app.utils.cache_bus import cache_bus
+
+logger = logging.getLogger(__name__)
+
+L1_SIZE = int(os.getenv('CACHE_L1_SIZE', '4096'))
+L1_TTL = float(os.getenv('CACHE_L1_TTL', '5'))
+TAG_TTL = float(os.getenv('CACHE_TAG_TTL', '2'))
+LOCK_TTL = int(os.getenv('CACHE_LOCK_TTL', '30'))
+LOCK_WAIT = float(os.getenv('CACHE_LOCK_WAIT', '2'))
+LOCK_POLL_INTERVAL = 0.05
+L2_RETRY_AFTER = float(os.getenv('CACHE_L2_RETRY_AFTER', '5'))
+
+# Backends private to one process; tag tokens can't be shared through them
+PROCESS_LOCAL_BACKENDS = ('SimpleCache', 'NullCache')
+
+PENDING_TAGS_KEY = 'pending_cache_tags'
+
+# Tables whose rows make up a client's cached views; a committed change to
+# one of them bumps that client's tag
+CLIENT_TAGGED_TABLES = {
+    'clients', 'payments', 'withdrawal_requests', 'client_wallets',
+    'client_balances', 'client_settings',
+}
+
+
+def client_tag(client_id):
+    """Tag shared by everything cached for one client"""
+    return f"client:{client_id}"
+
+
+class _Stats:
+    __slots__ = ('l1_hits', 'l2_hits', 'misses', 'coalesced', 'loads', 'load_errors',
+                 'load_seconds', 'load_seconds_max', 'l2_seconds', 'l2_errors')
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, 0)
+
+    def as_dict(self):
+        lookups = self.l1_hits + self.l2_hits + self.misses
+        data = {name: getattr(self, name) for name in self.__slots__}
+        data['hit_ratio'] = round((self.l1_hits + self.l2_hits) / lookups, 4) if lookups else None
+        data['load_avg_ms'] = round(self.load_seconds / self.loads * 1000, 2) if self.loads else None
+        data['load_max_ms'] = round(self.load_seconds_max * 1000, 2)
+        data['l2_seconds'] = round(self.l2_seconds, 4)
+        data['load_seconds'] = round(self.load_seconds, 4)
+        del data['load_seconds_max']
+        return data
+
+
+class _Flight:
+    __slots__ = ('done', 'value', 'ok')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.ok = False
+
+
+class TieredCache:
+    """Process-local L1 in front of the shared Flask-Caching backend"""
+
+    def __init__(self, l1_size=L1_SIZE, l1_ttl=L1_TTL, tag_ttl=TAG_TTL):
+        self.l1_size = l1_size
+        self.l1_ttl = l1_ttl
+        self.tag_ttl = tag_ttl
+        self._l1 = OrderedDict()  # full key -> (expires_at, value, tag tokens)
+        self._tags = {}  # tag -> (expires_at, token)
+        self._renew = set()  # tags bumped elsewhere that need a new token here
+        self._shared_l2 = True
+        self._flights = {}
+        self._stats = {}
+        self._l2_down_until = 0.0
+        self._lock = threading.Lock()
+
+    # --- helpers ---
+
+    def _stat(self, namespace):
+        stats = self._stats.get(namespace)
+        if stats is None:
+            stats = self._stats.setdefault(namespace, _Stats())
+        return stats
+
+    def _backend(self):
+        # Only usable inside an app context; outside one the cache is L1-only.
+        # After a backend error L2 is skipped for L2_RETRY_AFTER seconds.
+        if self._l2_down_until and time.monotonic() < self._l2_down_until:
+            return None
+        try:
+            backend = cache.cache
+        except (RuntimeError, KeyError, AttributeError):
+            return None
+        self._shared_l2 = type(backend).__name__ not in PROCESS_LOCAL_BACKENDS
+        return backend
+
+    def _l2_call(self, stats, method, *args, default=None):
+        backend = self._backend()
+        if backend is None:
+            return default
+        started = time.perf_counter()
+        try:
+            return getattr(backend, method)(*args)
+        except Exception as e:
+            stats.l2_errors += 1
+            self._l2_down_until = time.monotonic() + L2_RETRY_AFTER
+            logger.warning(f"Cache backend {method} failed, using L1 only for {L2_RETRY_AFTER:g}s: {e}")
+            return default
+        finally:
+            stats.l2_seconds += time.perf_counter() - started
+
+    def _tag_tokens(self, tags, stats):
+        """Current token of each tag, creating tokens for tags never seen"""
+        now = time.monotonic()
+        tokens = {}
+        missing = []
+        for tag in tags:
+            cached = self._tags.get(tag)
+            if cached is not None and cached[0] > now:
+                tokens[tag] = cached[1]
+            else:
+                missing.append(tag)
+        if missing:
+            keys = [f"tag:{tag}" for tag in missing]
+            values = self._l2_call(stats, 'get_many', *keys) or [None] * len(keys)
+            for tag, key, token in zip(missing, keys, values):
+                if tag in self._renew:
+                    self._renew.discard(tag)
+                    token = uuid.uuid4().hex[:16]
+                    self._l2_call(stats, 'set', key, token, 0)
+                elif token is None:
+                    token = uuid.uuid4().hex[:16]
+                    # Keep whichever token another worker created first
+                    if not self._l2_call(stats, 'add', key, token, 0):
+                        token = self._l2_call(stats, 'get', key) or token
+                tokens[tag] = token
+                self._tags[tag] = (now + self.tag_ttl, token)
+        return tuple(tokens[tag] for tag in tags)
+
+    def _l1_get(self, key, tokens):
+        with self._lock:
+            entry = self._l1.get(key)
+            if entry is None:
+                return False, None
+            if entry[0] <= time.monotonic() or entry[2] != tokens:
+                del self._l1[key]
+                return False, None
+            self._l1.move_to_end(key)
+            return True, entry[1]
+
+    def _l1_set(self, key, value, tokens, timeout):
+        ttl = min(self.l1_ttl, timeout) if timeout else self.l1_ttl
+        with self._lock:
+            self._l1[key] = (time.monotonic() + ttl, value, tokens)
+            self._l1.move_to_end(key)
+            while len(self._l1) > self.l1_size:
+                self._l1.popitem(last=False)
+
+    def _l2_get(self, key, tokens, stats):
+        entry = self._l2_call(stats, 'get', f"v:{key}")
+        if isinstance(entry, tuple) and len(entry) == 2 and entry[1] == tokens:
+            return True, entry[0]
+        return False, None
+
+    # --- public API ---
+
+    def get(self, namespace, key, tags=()):
+        """
+        Cached value without loading on a miss.
+
+        Returns:
+            tuple: (found, value)
+        """
+        full_key = f"{namespace}:{key}"
+        stats = self._stat(namespace)
+        tokens = self._tag_tokens((f"ns:{namespace}",) + tuple(tags), stats)
+        found, value = self._l1_get(full_key, tokens)
+        if found:
+            stats.l1_hits += 1
+            return True, value
+        found, value = self._l2_get(full_key, tokens, stats)
+        if found:
+            stats.l2_hits += 1
+            self._l1_set(full_key, value, tokens, None)
+            return True, value
+        stats.misses += 1
+        return False, None
+
+    def set(self, namespace, key, value, timeout=None, tags=()):
+        """Store ``value`` under the current versions of ``tags``"""
+        full_key = f"{namespace}:{key}"
+        stats = self._stat(namespace)
+        tokens = self._tag_tokens((f"ns:{namespace}",) + tuple(tags), stats)
+        self._store(full_key, value, tokens, timeout, stats)
+
+    def _store(self, full_key, value, tokens, timeout, stats):
+        self._l1_set(full_key, value, tokens, timeout)
+        self._l2_call(stats, 'set', f"v:{full_key}", (value, tokens), timeout)
+
+    def get_or_set(self, namespace, key, loader, timeout=None, tags=()):
+        """
+        Cached value, computing it with ``loader()`` on a miss.
+
+        Args:
+            namespace: Usually the model or view the value derives from
+            key: Key within the namespace
+            loader: Zero-argument callable producing the value
+            timeout: L2 expiry in seconds (None for the backend default)
+            tags: Extra invalidation tags, e.g. ``client_tag(client.id)``
+
+        Returns:
+            The cached or freshly loaded value
+        """
+        full_key = f"{namespace}:{key}"
+        stats = self._stat(namespace)
+        tokens = self._tag_tokens((f"ns:{namespace}",) + tuple(tags), stats)
+
+        found, value = self._l1_get(full_key, tokens)
+        if found:
+            stats.l1_hits += 1
+            return value
+        found, value = self._l2_get(full_key, tokens, stats)
+        if found:
+            stats.l2_hits += 1
+            self._l1_set(full_key, value, tokens, timeout)
+            return value
+        stats.misses += 1
+
+        with self._lock:
+            flight = self._flights.get(full_key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[full_key] = _Flight()
+        if not leader:
+            flight.done.wait(LOCK_TTL)
+            if flight.ok:
+                stats.coalesced += 1
+                return flight.value
+            return self._load(full_key, loader, tokens, timeout, stats)
+
+        try:
+            flight.value = self._load_shared(full_key, loader, tokens, timeout, stats)
+            flight.ok = True
+            return flight.value
+        finally:
+            with self._lock:
+                self._flights.pop(full_key, None)
+            flight.done.set()
+
+    def _load_shared(self, full_key, loader, tokens, timeout, stats):
+        # Take the cross-process lock, or wait for the worker holding it
+        lock_key = f"lock:{full_key}"
+        backend = self._backend()
+        if backend is not None and not self._l2_call(stats, 'add', lock_key, 1, LOCK_TTL, default=True):
+            deadline = time.monotonic() + LOCK_WAIT
+            while time.monotonic() < deadline:
+                time.sleep(LOCK_POLL_INTERVAL)
+                found, value = self._l2_get(full_key, tokens, stats)
+                if found:
+                    stats.coalesced += 1
+                    self._l1_set(full_key, value, tokens, timeout)
+                    return value
+            return self._load(full_key, loader, tokens, timeout, stats)
+        try:
+            return self._load(full_key, loader, tokens, timeout, stats)
+        finally:
+            if backend is not None:
+                self._l2_call(stats, 'delete', lock_key)
+
+    def _load(self, full_key, loader, tokens, timeout, stats):
+        started = time.perf_counter()
+        try:
+            value = loader()
+        except Exception:
+            stats.load_errors += 1
+            raise
+        elapsed = time.perf_counter() - started
+        stats.loads += 1
+        stats.load_seconds += elapsed
+        if elapsed > stats.load_seconds_max:
+            stats.load_seconds_max = elapsed
+        self._store(full_key, value, tokens, timeout, stats)
+        return value
+
+    def delete(self, namespace, key):
+        """Drop one entry from both tiers"""
+        full_key = f"{namespace}:{key}"
+        with self._lock:
+            self._l1.pop(full_key, None)
+        self._l2_call(self._stat(namespace), 'delete', f"v:{full_key}")
+
+    def bump_tags(self, *tags):
+        """Invalidate every entry carrying any of ``tags``"""
+        if not tags:
+            return
+        mapping = {f"tag:{tag}": uuid.uuid4().hex[:16] for tag in tags}
+        self._l2_call(self._stat('tags'), 'set_many', mapping, 0)
+        # Drops the old token here and, through the bus, in every other worker
+        cache_bus.publish_many([('tag', tag, None) for tag in tags])
+
+    def clear_namespace(self, namespace):
+        """Invalidate every entry in ``namespace``"""
+        self.bump_tags(f"ns:{namespace}")
+
+    def forget_tags(self, *tags):
+        """Drop locally held tag tokens so the next read fetches them from L2"""
+        for tag in tags:
+            self._tags.pop(tag, None)
+
+    def _on_tag_invalidated(self, tag, version):
+        # With a process-local L2 the stored token is stale too, so renew it
+        tags = list(self._tags) if tag is None else [tag]
+        if not self._shared_l2:
+            self._renew.update(tags)
+        if tag is None:
+            with self._lock:
+                self._l1.clear()
+        self.forget_tags(*tags)
+
+    def counters(self):
+        """Raw (l1_hits, l2_hits, misses) per namespace"""
+        return {ns: (stats.l1_hits, stats.l2_hits, stats.misses) for ns, stats in list(self._stats.items())}
+
+    def stats(self):
+        """Counters per namespace plus L1 occupancy"""
+        with self._lock:
+            l1_entries = len(self._l1)
+        return {
+            'backend': type(self._backend()).__name__,
+            'l1_entries': l1_entries,
+            'l1_size': self.l1_size,
+            'namespaces': {ns: stats.as_dict() for ns, stats in sorted(self._stats.items())},
+        }
+
+
+tiered_cache = TieredCache()
+cache_bus.subscribe('tag', tiered_cache._on_tag_invalidated)
+
+
+def cached(namespace, timeout=None, tags=None):
+    """
+    Cache a function's result in ``tiered_cache``, keyed on its arguments.
+
+    Args:
+        namespace: Cache namespace
+        timeout: L2 expiry in seconds
+        tags: Optional callable taking the function's arguments and
+              returning invalidation tags
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = repr((args, sorted(kwargs.items())))
+            entry_tags = tags(*args, **kwargs) if tags else ()
+            return tiered_cache.get_or_set(
+                namespace, key, lambda: fn(*args, **kwargs), timeout=timeout, tags=entry_tags
+            )
+        wrapper.uncached = fn
+        return wrapper
+    return decorator
+
+
+# --- invalidation on commit ---
+
+def _instance_tags(obj):
+    table = getattr(obj, '__tablename__', None)
+    if table not in CLIENT_TAGGED_TABLES:
+        return ()
+    client_id = obj.id if table == 'clients' else getattr(obj, 'client_id', None)
+    return (client_tag(client_id),) if client_id is not None else ()
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_cache_tags(session, flush_context):
+    tags = set()
+    for obj in session.new:
+        tags.update(_instance_tags(obj))
+    for obj in session.dirty:
+        if session.is_modified(obj, include_collections=False):
+            tags.update(_instance_tags(obj))
+    for obj in session.deleted:
+        tags.update(_instance_tags(obj))
+    if tags:
+        session.info.setdefault(PENDING_TAGS_KEY, set()).update(tags)
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_committed_tags(session):
+    tags = session.info.pop(PENDING_TAGS_KEY, None)
+    if tags:
+        try:
+            tiered_cache.bump_tags(*tags)
+        except Exception as e:
+            logger.error(f"Failed to invalidate cache tags {sorted(tags)}: {e}")
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_pending_tags(session, previous_transaction):
+    if not session.in_transaction():
+        session.info.pop(PENDING_TAGS_KEY, None)
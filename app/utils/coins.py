@@ -5,6 +5,8 @@ Handles coin validation, package limits, and display formatting.
 from functools import lru_cache
 from flask import current_app, g, has_request_context
 
+from app.utils.entitlements import allowed_coins_for_slug, entitlements_for
+
 @lru_cache(maxsize=128)
 def get_coin_display_name(coin_symbol):
     """Get the display name for a coin symbol."""
@@ -22,15 +24,7 @@ def get_allowed_coins(package_slug):
     Returns:
         list: List of allowed coin symbols
     """
-    if not package_slug:
-        return []
-        
-    limits = current_app.config.get('PACKAGE_COIN_LIMITS', {})
-    coin_list = current_app.config.get('COIN_LIST', [])
-    
-    # Default to starter plan if package not found
-    limit = limits.get(package_slug, limits.get('starter_flat_rate', 15))
-    return coin_list[:min(limit, len(coin_list))]
+    return list(allowed_coins_for_slug(package_slug))
 
 def is_coin_allowed(client, coin_symbol):
     """
@@ -43,11 +37,7 @@ def is_coin_allowed(client, coin_symbol):
     Returns:
         bool: True if coin is allowed, False otherwise
     """
-    if not client or not client.package or not coin_symbol:
-        return False
-        
-    allowed = get_allowed_coins(client.package.slug)
-    return coin_symbol.upper() in [c.upper() for c in allowed]
+    return entitlements_for(client).allows_coin(coin_symbol)
 
 def get_coin_icon(coin_symbol):
     """
@@ -73,10 +63,7 @@ def get_client_coins(client):
     Returns:
         list: List of dicts with coin info: [{'symbol': 'BTC', 'name': 'Bitcoin'}, ...]
     """
-    if not client or not client.package:
-        return []
-        
-    symbols = get_allowed_coins(client.package.slug)
+    symbols = entitlements_for(client).coin_order
     return [
         {
             'symbol': symbol,
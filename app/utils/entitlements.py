@@ -0,0 +1,233 @@
+"""
+Precompiled per-package entitlements (features, coins and limits).
+
+Feature and coin checks used to walk the ``package_features`` relationship,
+rebuild dicts from PACKAGE_FEATURES and slice/upper-case COIN_LIST on every
+call. Instead, every package is compiled once into an immutable
+``Entitlements`` object:
+
+- features as an int bitset (bit positions from a process-wide registry)
+- allowed coins as a frozenset plus their display order
+- numeric limits (transactions, API calls, wallets, volume, coins and any
+  per-feature ``PackageFeature.limit_value``)
+
+The whole table is rebuilt on first use after ClientPackage, PackageFeature
+or Feature rows change (announced on the cache bus), so checks are a dict
+lookup by ``package_id`` and a bit test.
+"""
+import logging
+import threading
+from types import MappingProxyType
+
+from flask import current_app, has_app_context
+
+from app.extensions import db
+from app.utils.cache_bus import LocalCache, cache_bus
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COIN_LIMIT = 15
+ENTERPRISE_SLUGS = ('enterprise', 'enterprise_flat_rate')
+
+_feature_bits = {}
+_bits_lock = threading.Lock()
+
+
+def feature_bit(feature_key):
+    """Bit assigned to ``feature_key`` (stable for the life of the process)"""
+    bit = _feature_bits.get(feature_key)
+    if bit is None:
+        with _bits_lock:
+            bit = _feature_bits.setdefault(feature_key, 1 << len(_feature_bits))
+    return bit
+
+
+def feature_mask(feature_keys):
+    mask = 0
+    for key in feature_keys:
+        mask |= feature_bit(key)
+    return mask
+
+
+def _keys_in(mask):
+    return frozenset(key for key, bit in _feature_bits.items() if mask & bit)
+
+
+def allowed_coins_for_slug(slug):
+    """
+    Coins a package slug may use, in COIN_LIST order.
+
+    Returns:
+        tuple: Upper-cased coin symbols
+    """
+    if not slug or not has_app_context():
+        return ()
+    limits = current_app.config.get('PACKAGE_COIN_LIMITS', {})
+    coin_list = current_app.config.get('COIN_LIST', [])
+    limit = limits.get(slug, limits.get('starter_flat_rate', DEFAULT_COIN_LIMIT))
+    return tuple(symbol.upper() for symbol in coin_list[:min(limit, len(coin_list))])
+
+
+class Entitlements:
+    """What one package allows; immutable once built"""
+
+    __slots__ = ('package_id', 'slug', 'client_type', 'all_features', 'features', 'preset',
+                 'coins', 'coin_order', 'limits', 'dashboard_features')
+
+    def __init__(self, package_id, slug, client_type, all_features, features, preset,
+                 coin_order, limits, dashboard_features=()):
+        self.package_id = package_id
+        self.slug = slug
+        self.client_type = client_type
+        self.all_features = all_features  # Enterprise flat-rate packages get everything
+        self.features = features  # Bitset of features included in the package rows
+        self.preset = preset  # Bitset of the PACKAGE_FEATURES preset for the slug
+        self.coin_order = coin_order
+        self.coins = frozenset(coin_order)
+        self.limits = MappingProxyType(limits)
+        self.dashboard_features = dashboard_features
+
+    def has(self, feature_key):
+        """Feature check with the enterprise flat-rate rule (FeatureAccessMixin semantics)"""
+        return self.all_features or bool(self.features & feature_bit(feature_key))
+
+    def includes(self, feature_key):
+        """Whether the package rows include ``feature_key`` (ClientPackage.has_feature semantics)"""
+        return bool(self.features & feature_bit(feature_key))
+
+    def allows_coin(self, symbol):
+        return bool(symbol) and symbol.upper() in self.coins
+
+    def limit(self, name, default=None):
+        """Numeric limit, None meaning unlimited"""
+        return self.limits.get(name, default)
+
+    def feature_keys(self):
+        return _keys_in(self.features)
+
+    def preset_keys(self):
+        return _keys_in(self.preset)
+
+    def __repr__(self):
+        return f'<Entitlements {self.slug} ({self.package_id})>'
+
+
+NO_ENTITLEMENTS = Entitlements(None, None, None, False, 0, 0, (), {})
+
+
+def compile_package(package, included_features, preset_features):
+    """
+    Build the Entitlements of one package.
+
+    Args:
+        package: ClientPackage row
+        included_features: [(feature_key, name, description, limit_value)] included in the package
+        preset_features: Feature keys from PACKAGE_FEATURES for the package slug
+    """
+    from app.models.client_package import ClientType
+
+    slug = package.slug
+    limits = {
+        'max_transactions_per_month': package.max_transactions_per_month,
+        'max_api_calls_per_month': package.max_api_calls_per_month,
+        'max_wallets': package.max_wallets,
+        'max_volume_per_month': package.max_volume_per_month,
+    }
+    for feature_key, _, _, limit_value in included_features:
+        if limit_value is not None:
+            limits[f'feature:{feature_key}'] = limit_value
+    coin_order = allowed_coins_for_slug(slug)
+    limits['coins'] = len(coin_order)
+
+    dashboard_features = tuple(
+        MappingProxyType({'key': key, 'name': name, 'icon': 'bi-star', 'description': description})
+        for key, name, description, _ in included_features
+    )
+    return Entitlements(
+        package_id=package.id,
+        slug=slug,
+        client_type=package.client_type.value if package.client_type else None,
+        all_features=package.client_type == ClientType.FLAT_RATE and slug in ENTERPRISE_SLUGS,
+        features=feature_mask(key for key, _, _, _ in included_features),
+        preset=feature_mask(preset_features),
+        coin_order=coin_order,
+        limits=limits,
+        dashboard_features=dashboard_features,
+    )
+
+
+class EntitlementTable:
+    """All packages' entitlements, rebuilt as a whole when any package changes"""
+
+    def __init__(self):
+        self._cache = LocalCache('package_entitlements', maxsize=1)
+
+    def _build(self):
+        from app.models.client_package import ClientPackage, PackageFeature
+        from app.models.feature import Feature
+        from app.utils.package_features import PACKAGE_FEATURES
+
+        included = {}
+        rows = db.session.query(
+            PackageFeature.package_id, Feature.feature_key, Feature.name, Feature.description,
+            PackageFeature.limit_value
+        ).join(Feature, Feature.id == PackageFeature.feature_id).filter(PackageFeature.is_included.is_(True))
+        for package_id, key, name, description, limit_value in rows:
+            included.setdefault(package_id, []).append((key, name, description, limit_value))
+
+        table = {}
+        for package in ClientPackage.query.all():
+            table[package.id] = compile_package(
+                package, included.get(package.id, []), PACKAGE_FEATURES.get(package.slug, ())
+            )
+        logger.info(f"Compiled entitlements for {len(table)} packages")
+        return MappingProxyType(table)
+
+    def table(self):
+        return self._cache.get_or_load('all', self._build)
+
+    def for_package(self, package_id):
+        """
+        Entitlements of a package.
+
+        Returns:
+            Entitlements: NO_ENTITLEMENTS when the package is unknown or None
+        """
+        if package_id is None:
+            return NO_ENTITLEMENTS
+        return self.table().get(package_id, NO_ENTITLEMENTS)
+
+
+entitlement_table = EntitlementTable()
+
+
+def entitlements_for_package(package_id):
+    """Shortcut for ``entitlement_table.for_package``"""
+    return entitlement_table.for_package(package_id)
+
+
+def entitlements_for(subject):
+    """
+    Entitlements of a Client, or of the client linked to a User.
+
+    Returns:
+        Entitlements
+    """
+    if subject is None:
+        return NO_ENTITLEMENTS
+    package_id = getattr(subject, 'package_id', None)
+    if package_id is None:
+        client = getattr(subject, 'client', None)
+        package_id = getattr(client, 'package_id', None) if client is not None else None
+    return entitlement_table.for_package(package_id)
+
+
+def _register_watches():
+    from app.models.client_package import ClientPackage, PackageFeature
+    from app.models.feature import Feature
+
+    for model in (ClientPackage, PackageFeature, Feature):
+        cache_bus.watch(model, 'package_entitlements')
+
+
+_register_watches()
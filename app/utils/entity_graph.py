@@ -0,0 +1,338 @@
+"""
+Linked-entity index across clients, users, withdrawal addresses and IPs.
+
+Every observed pair (client -> withdrawal address, user -> login IP, ...) is
+stored once in ``entity_links`` and merged into an in-memory union-find with
+path compression and union by size, so "which entities are connected to this
+one" is answered in near-constant time. Each cluster keeps its members, the
+number of members per entity type and how many are flagged risky.
+
+Carrier NAT and cloud egress IPs, and exchange deposit addresses told apart
+only by their memo, are shared by unrelated merchants. Addresses are keyed
+with their memo, and an IP or address linked to more than
+``ENTITY_GRAPH_HUB_LINKS`` distinct entities becomes a hub: its further
+links are stored but no longer merge clusters, so one shared node can't
+collapse everyone behind it into a single cluster.
+
+Links are only ever added. A background thread per worker loads the table
+once, then every ``ENTITY_GRAPH_SYNC_INTERVAL`` seconds catches up on links
+written by other workers (re-reading the last ``SYNC_OVERLAP`` of
+``created_at`` so rows that committed late are not missed) and reloads the
+flags; lookups never query the table. Links and flags recorded by this
+worker reach the in-memory graph when their transaction commits, so a
+rolled-back request leaves nothing behind.
+"""
+import atexit
+import ipaddress
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.extensions import db
+
+logger = logging.getLogger(__name__)
+
+SYNC_INTERVAL = int(os.getenv('ENTITY_GRAPH_SYNC_INTERVAL', '60'))
+SYNC_OVERLAP = timedelta(minutes=5)  # Longest expected write transaction
+MAX_KEY_LENGTH = 160
+# Below the linked_to_many_clients threshold, so one shared node alone never reaches it
+HUB_LINK_LIMIT = int(os.getenv('ENTITY_GRAPH_HUB_LINKS', '4'))
+HUB_TYPES = ('ip', 'address')
+PENDING_KEY = 'pending_entity_graph'
+
+
+def entity_key(entity_type, value):
+    """Canonical ``<type>:<value>`` key (addresses are normalised like screening lists)"""
+    if value is None or value == '':
+        return None
+    if entity_type == 'address':
+        from app.utils.address_screening import normalize_address
+        value = normalize_address(value)
+    elif entity_type == 'ip' and not _is_linkable_ip(value):
+        return None
+    return f"{entity_type}:{value}"[:MAX_KEY_LENGTH]
+
+
+def address_key(address, memo=None):
+    """Entity key of a withdrawal destination; the memo/tag tells apart users of a shared address"""
+    key = entity_key('address', address)
+    if key and memo:
+        key = f"{key}#{str(memo).strip()}"[:MAX_KEY_LENGTH]
+    return key
+
+
+def _is_linkable_ip(value):
+    # Private, loopback and proxy addresses are shared by unrelated users
+    try:
+        return ipaddress.ip_address(value).is_global
+    except ValueError:
+        return False
+
+
+def entity_type(key):
+    return key.split(':', 1)[0]
+
+
+class EntityGraph:
+    """Union-find over entity keys with per-cluster membership and risk counts"""
+
+    def __init__(self, sync_interval=SYNC_INTERVAL):
+        self.sync_interval = sync_interval
+        self._parent = {}
+        self._members = {}  # root -> set of keys
+        self._type_counts = {}  # root -> Counter of entity types
+        self._flags = {}  # key -> reason
+        self._edges = set()
+        self._degree = Counter()  # hub-capable key -> distinct linked entities
+        self._synced_until = None  # Newest link created_at loaded
+        self.ready = False  # Whole table loaded at least once
+        self._lock = threading.RLock()
+        self._app = None
+        self._pid = None
+        self._stop = threading.Event()
+
+    def init_app(self, app):
+        self._app = app
+
+    # --- union-find ---
+
+    def _find(self, key):
+        parent = self._parent
+        if key not in parent:
+            parent[key] = key
+            self._members[key] = {key}
+            self._type_counts[key] = Counter((entity_type(key),))
+            return key
+        root = key
+        while parent[root] != root:
+            root = parent[root]
+        while parent[key] != root:
+            parent[key], key = root, parent[key]
+        return root
+
+    def _union(self, a, b):
+        root_a, root_b = self._find(a), self._find(b)
+        if root_a == root_b:
+            return root_a
+        if len(self._members[root_a]) < len(self._members[root_b]):
+            root_a, root_b = root_b, root_a
+        self._parent[root_b] = root_a
+        self._members[root_a] |= self._members.pop(root_b)
+        self._type_counts[root_a] += self._type_counts.pop(root_b)
+        return root_a
+
+    def _add_edge(self, a, b):
+        edge = (a, b) if a <= b else (b, a)
+        if edge in self._edges:
+            return False
+        self._edges.add(edge)
+        hub = False
+        for key in edge:
+            if entity_type(key) in HUB_TYPES:
+                self._degree[key] += 1
+                hub = hub or self._degree[key] > HUB_LINK_LIMIT
+        if hub:
+            # Keep the endpoints known, but don't merge clusters through a hub
+            self._find(a)
+            self._find(b)
+        else:
+            self._union(a, b)
+        return True
+
+    def is_hub(self, key):
+        """Whether ``key`` is an IP/address linked to too many entities to merge through"""
+        with self._lock:
+            return self._degree.get(key, 0) > HUB_LINK_LIMIT
+
+    # --- persistence ---
+
+    def sync(self):
+        """
+        Load links and flags written by any worker since the last sync.
+
+        Runs on the background thread; must be called inside an application context.
+        """
+        from app.models.entity_link import EntityLink, EntityRiskFlag
+
+        query = db.session.query(EntityLink.entity_a, EntityLink.entity_b, EntityLink.created_at)
+        if self._synced_until is not None:
+            query = query.filter(EntityLink.created_at >= self._synced_until - SYNC_OVERLAP)
+        # Oldest first, so every worker merges the same links before a node turns into a hub
+        query = query.order_by(EntityLink.id)
+        newest = self._synced_until
+        for a, b, created_at in query.yield_per(10000):
+            with self._lock:
+                self._add_edge(a, b)
+            if newest is None or created_at > newest:
+                newest = created_at
+        flags = dict(db.session.query(EntityRiskFlag.entity, EntityRiskFlag.reason))
+        with self._lock:
+            self._flags.update(flags)
+            self._synced_until = newest or datetime.utcnow()
+            self.ready = True
+
+    def _ensure_worker(self):
+        if self._pid == os.getpid() or self._app is None:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            threading.Thread(target=self._run, name='entity-graph-sync', daemon=True).start()
+            atexit.register(self._stop.set)
+
+    def _run(self):
+        while True:
+            try:
+                with self._app.app_context():
+                    self.sync()
+                    db.session.remove()
+            except Exception:
+                logger.exception("Entity graph sync failed")
+            if self._stop.wait(self.sync_interval):
+                return
+
+    def link(self, a, b, source=None):
+        """
+        Record that two entities were seen together.
+
+        The link joins the in-memory graph once the current transaction commits.
+
+        Returns:
+            bool: True if a new link row was written
+        """
+        if not a or not b or a == b:
+            return False
+        from app.models.entity_link import EntityLink
+
+        self._ensure_worker()
+        if a > b:
+            a, b = b, a
+        with self._lock:
+            if (a, b) in self._edges:
+                return False
+        created = True
+        try:
+            with db.session.begin_nested():
+                db.session.add(EntityLink(entity_a=a, entity_b=b, source=source))
+        except IntegrityError:
+            created = False  # Another worker stored it first
+        db.session.info.setdefault(PENDING_KEY, []).append(('link', a, b))
+        return created
+
+    def flag(self, key, reason):
+        """Mark an entity as risky (visible once the current transaction commits)"""
+        from app.models.entity_link import EntityRiskFlag
+
+        if not key or key in self._flags:
+            return
+        reason = reason[:100]
+        try:
+            with db.session.begin_nested():
+                db.session.add(EntityRiskFlag(entity=key, reason=reason))
+        except IntegrityError:
+            pass
+        db.session.info.setdefault(PENDING_KEY, []).append(('flag', key, reason))
+
+    def _apply_committed(self, pending):
+        with self._lock:
+            for kind, a, b in pending:
+                if kind == 'link':
+                    self._add_edge(a, b)
+                else:
+                    self._flags.setdefault(a, b)
+
+    # --- queries ---
+
+    def cluster(self, key):
+        """
+        Entities connected to ``key`` (including itself).
+
+        Returns:
+            set: Entity keys in the same cluster
+        """
+        self._ensure_worker()
+        with self._lock:
+            if key not in self._parent:
+                return {key}
+            return set(self._members[self._find(key)])
+
+    def connected(self, a, b):
+        """Whether two entities are in the same cluster"""
+        self._ensure_worker()
+        with self._lock:
+            if a not in self._parent or b not in self._parent:
+                return a == b
+            return self._find(a) == self._find(b)
+
+    def cluster_stats(self, key):
+        """
+        Size, per-type counts and flagged members of ``key``'s cluster.
+
+        Returns:
+            dict: {'size', 'types', 'flagged'}
+        """
+        self._ensure_worker()
+        with self._lock:
+            if key not in self._parent:
+                flagged = {key: self._flags[key]} if key in self._flags else {}
+                return {'size': 1, 'types': {entity_type(key): 1}, 'flagged': flagged}
+            root = self._find(key)
+            members = self._members[root]
+            flags = self._flags
+            if len(flags) < len(members):
+                flagged = {k: r for k, r in flags.items() if k in members}
+            else:
+                flagged = {k: flags[k] for k in members if k in flags}
+            return {'size': len(members), 'types': dict(self._type_counts[root]), 'flagged': flagged}
+
+    def __len__(self):
+        return len(self._parent)
+
+
+entity_graph = EntityGraph()
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_committed(session):
+    pending = session.info.pop(PENDING_KEY, None)
+    if pending:
+        entity_graph._apply_committed(pending)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_pending(session, previous_transaction):
+    if not session.in_transaction():
+        session.info.pop(PENDING_KEY, None)
+
+
+def record_withdrawal_links(client_id, address, ip_address=None, user_id=None, memo=None):
+    """Link a withdrawal's client to its destination address (with memo), request IP and user"""
+    client = entity_key('client', client_id)
+    try:
+        entity_graph.link(client, address_key(address, memo), source='withdrawal')
+        entity_graph.link(client, entity_key('ip', ip_address), source='withdrawal')
+        entity_graph.link(client, entity_key('user', user_id), source='withdrawal')
+    except Exception as e:
+        logger.error(f"Failed to record entity links for client {client_id}: {e}")
+
+
+def record_login_link(actor_type, actor_id, ip_address, client_id=None):
+    """Link a login (user or client) to its IP, and a user to its client"""
+    actor = entity_key(actor_type, actor_id)
+    try:
+        entity_graph.link(actor, entity_key('ip', ip_address), source='login')
+        if client_id and actor_type != 'client':
+            entity_graph.link(actor, entity_key('client', client_id), source='login')
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Failed to record login link for {actor}: {e}")
@@ -16,6 +16,8 @@ from app.models.client import Client
 from app.models.user import User
 from app.models.payment import Payment
 from app.utils.audit import log_security_event
+from app.utils.entity_graph import address_key, entity_graph, entity_key
+from app.utils.geoip import lookup_ip
 from app.extensions import db
 
 logger = logging.getLogger(__name__)
@@ -93,6 +95,18 @@ class FraudDetectionService:
         risk_factors.extend(time_factors)
         metadata.update(time_meta)
         
+        # 6. Linked entities across clients
+        link_risk, link_factors, link_meta = self._analyze_linked_entities(withdrawal)
+        risk_score += link_risk
+        risk_factors.extend(link_factors)
+        metadata.update(link_meta)
+        
+        # 7. Request origin (local GeoIP/ASN)
+        geo_risk, geo_factors, geo_meta = self._analyze_request_origin(withdrawal)
+        risk_score += geo_risk
+        risk_factors.extend(geo_factors)
+        metadata.update(geo_meta)
+        
         # Determine risk level
         risk_level = self._calculate_risk_level(risk_score)
         
@@ -366,6 +380,89 @@ class FraudDetectionService:
         
         return risk_score, factors, metadata
     
+    def _analyze_linked_entities(self, withdrawal: WithdrawalRequest) -> Tuple[int, List[str], Dict]:
+        """Analyze the cluster of clients/addresses/IPs linked to this withdrawal"""
+        risk_score = 0
+        factors = []
+        metadata = {}
+        
+        address = withdrawal.crypto_address or withdrawal.user_wallet_address
+        destination_key = address_key(address, withdrawal.memo)
+        if not destination_key:
+            return risk_score, factors, metadata
+        
+        try:
+            stats = entity_graph.cluster_stats(destination_key)
+        except Exception as e:
+            logger.error(f"Entity graph lookup failed for withdrawal {withdrawal.id}: {e}")
+            return risk_score, factors, metadata
+        
+        # Shared too widely (exchange, custodian) to say who else its users are
+        if entity_graph.is_hub(destination_key):
+            metadata['shared_destination'] = True
+            risk_score += 10
+            factors.append("destination_shared_by_many_entities")
+            stats = dict(stats, types={}, flagged={key: reason for key, reason in stats['flagged'].items()
+                                                   if key == destination_key})
+        
+        # The withdrawal's own client may not be linked yet
+        client_key = entity_key('client', withdrawal.client_id)
+        linked_clients = stats['types'].get('client', 0)
+        if not entity_graph.connected(client_key, destination_key):
+            linked_clients += 1
+        
+        metadata['linked_cluster_size'] = stats['size']
+        metadata['linked_clients'] = linked_clients
+        metadata['linked_flagged'] = sorted(stats['flagged'])
+        
+        # Address or IPs shared with other merchants
+        if linked_clients >= 5:
+            risk_score += 35
+            factors.append("linked_to_many_clients")
+        elif linked_clients >= 2:
+            risk_score += 20
+            factors.append("linked_to_other_clients")
+        
+        # Cluster contains entities already flagged as risky
+        if stats['flagged']:
+            risk_score += min(40, 20 * len(stats['flagged']))
+            factors.append("linked_to_flagged_entity")
+        
+        return risk_score, factors, metadata
+    
+    def _analyze_request_origin(self, withdrawal: WithdrawalRequest) -> Tuple[int, List[str], Dict]:
+        """Analyze where the withdrawal was requested from (country changes, datacenter ASNs)"""
+        risk_score = 0
+        factors = []
+        metadata = {}
+        
+        geo = lookup_ip(withdrawal.request_ip)
+        if geo is None:
+            return risk_score, factors, metadata
+        
+        metadata['request_country'] = geo.country
+        metadata['request_asn'] = geo.asn
+        
+        # Requests from hosting providers are usually proxies/VPNs or automation
+        if geo.is_hosting:
+            risk_score += 15
+            factors.append("datacenter_asn")
+        
+        previous_ip = db.session.query(WithdrawalRequest.request_ip).filter(
+            WithdrawalRequest.client_id == withdrawal.client_id,
+            WithdrawalRequest.id != withdrawal.id,
+            WithdrawalRequest.request_ip.isnot(None)
+        ).order_by(WithdrawalRequest.created_at.desc()).limit(1).scalar()
+        
+        previous = lookup_ip(previous_ip)
+        if previous is not None:
+            metadata['previous_country'] = previous.country
+            if previous.country != geo.country:
+                risk_score += 20
+                factors.append("country_changed_since_last_withdrawal")
+        
+        return risk_score, factors, metadata
+    
     def _calculate_risk_level(self, risk_score: int) -> FraudRiskLevel:
         """Calculate risk level based on score"""
         if risk_score >= 85:
@@ -432,10 +529,34 @@ class FraudDetectionService:
         Returns:
             List of anomalies detected
         """
-        anomalies = []
+        from app.models.api_key import ClientApiKey
+        from app.models.audit import SecurityEvent
+        from app.utils.usage_anomaly import usage_anomaly_detector
         
-        # This would integrate with API usage logging
-        # For now, return placeholder
+        anomalies = []
+        key_record = ClientApiKey.find_by_key(api_key, active_only=False)
+        if not key_record:
+            return anomalies
+        
+        # Anomalies flagged by the streaming detector (any worker) in the window
+        events = SecurityEvent.query.filter(
+            SecurityEvent.actor_type == 'api_key',
+            SecurityEvent.actor_id == key_record.id,
+            SecurityEvent.event_type == 'api_usage_anomaly',
+            SecurityEvent.created_at >= datetime.utcnow() - timedelta(hours=hours)
+        ).order_by(SecurityEvent.created_at.desc()).all()
+        
+        for event in events:
+            details = event.details or {}
+            for anomaly in details.get('anomalies', []):
+                anomalies.append(dict(anomaly, detected_at=event.created_at.isoformat(),
+                                      path=details.get('path'), occurrences=event.event_count or 1))
+        
+        # Live state from this worker (throttle status, current vs baseline rate)
+        state = usage_anomaly_detector.snapshot(key_record.id)
+        if state.get('throttled_until'):
+            anomalies.insert(0, {'type': 'throttled', 'until': state['throttled_until'],
+                                 'reasons': state['throttle_reason']})
         
         return anomalies
 
@@ -0,0 +1,189 @@
+"""
+Local GeoIP / ASN lookup for fraud scoring.
+
+The database is a binary file built offline by ``scripts/build_geoip_db.py``
+from an ip2asn-style TSV (range start, range end, AS number, country, AS
+description). It holds non-overlapping, sorted ranges::
+
+    header (32 bytes)
+    IPv4: starts (uint32[n4]) | records (end uint32, asn uint32, cc 2s, flags, pad)[n4]
+    IPv6: start high 64 bits (uint64[n6]) | start low 64 bits (uint64[n6])
+          | records (end 16s big-endian, asn uint32, cc 2s, flags, pad)[n6]
+
+and is opened with ``mmap`` so workers share one page-cache copy. A lookup
+is a binary search over the range starts followed by one record read, with
+an LRU cache in front for repeat addresses. No network calls are made.
+"""
+import bisect
+import logging
+import mmap
+import os
+import socket
+import struct
+import threading
+import time
+from collections import namedtuple
+from functools import lru_cache
+
+from flask import current_app, has_app_context
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'PCGEOIP1'
+HEADER = struct.Struct('<8sQQ8x')  # magic, IPv4 ranges, IPv6 ranges
+V4_RECORD = struct.Struct('<I I 2s B x')
+V6_RECORD = struct.Struct('<16s I 2s B x')
+FLAG_HOSTING = 0x01
+
+CACHE_SIZE = int(os.getenv('GEOIP_CACHE_SIZE', '65536'))
+RELOAD_INTERVAL = int(os.getenv('GEOIP_RELOAD_INTERVAL', '60'))
+
+GeoInfo = namedtuple('GeoInfo', 'country asn is_hosting')
+
+
+def write_database(path, v4_ranges, v6_ranges):
+    """
+    Write a database file atomically.
+
+    Args:
+        path: Destination file
+        v4_ranges: Sorted, non-overlapping (start int, end int, asn, country, flags)
+        v6_ranges: Same for IPv6 (128-bit ints)
+    """
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, 'wb') as fh:
+        fh.write(HEADER.pack(MAGIC, len(v4_ranges), len(v6_ranges)))
+        fh.write(struct.pack(f'<{len(v4_ranges)}I', *(r[0] for r in v4_ranges)))
+        for start, end, asn, country, flags in v4_ranges:
+            fh.write(V4_RECORD.pack(end, asn, country.encode('ascii')[:2], flags))
+        fh.write(struct.pack(f'<{len(v6_ranges)}Q', *(r[0] >> 64 for r in v6_ranges)))
+        fh.write(struct.pack(f'<{len(v6_ranges)}Q', *(r[0] & 0xFFFFFFFFFFFFFFFF for r in v6_ranges)))
+        for start, end, asn, country, flags in v6_ranges:
+            fh.write(V6_RECORD.pack(end.to_bytes(16, 'big'), asn, country.encode('ascii')[:2], flags))
+    os.replace(tmp_path, path)
+
+
+class GeoIPDatabase:
+    """Read-only, memory-mapped GeoIP/ASN database"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as fh:
+            stat = os.fstat(fh.fileno())
+            self.identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            self._mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.v4_count, self.v6_count = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a GeoIP database')
+        offset = HEADER.size
+        view = memoryview(self._mmap)
+        self._v4_starts = view[offset:offset + 4 * self.v4_count].cast('I')
+        offset += 4 * self.v4_count
+        self._v4_records = offset
+        offset += V4_RECORD.size * self.v4_count
+        self._v6_high = view[offset:offset + 8 * self.v6_count].cast('Q')
+        offset += 8 * self.v6_count
+        self._v6_low = view[offset:offset + 8 * self.v6_count].cast('Q')
+        offset += 8 * self.v6_count
+        self._v6_records = offset
+        if len(self._mmap) != offset + V6_RECORD.size * self.v6_count:
+            raise ValueError(f'{path} is truncated')
+        self.lookup = lru_cache(maxsize=CACHE_SIZE)(self._lookup)
+
+    def _lookup(self, address):
+        try:
+            if ':' in address:
+                packed = socket.inet_pton(socket.AF_INET6, address)
+                if packed[:12] == b'\x00' * 10 + b'\xff\xff':
+                    return self._lookup_v4(int.from_bytes(packed[12:], 'big'))
+                return self._lookup_v6(packed)
+            return self._lookup_v4(int.from_bytes(socket.inet_pton(socket.AF_INET, address), 'big'))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def _lookup_v4(self, value):
+        i = bisect.bisect_right(self._v4_starts, value) - 1
+        if i < 0:
+            return None
+        end, asn, country, flags = V4_RECORD.unpack_from(self._mmap, self._v4_records + i * V4_RECORD.size)
+        if value > end:
+            return None
+        return GeoInfo(country.decode('ascii'), asn, bool(flags & FLAG_HOSTING))
+
+    def _lookup_v6(self, packed):
+        high = int.from_bytes(packed[:8], 'big')
+        low = int.from_bytes(packed[8:], 'big')
+        i = bisect.bisect_right(self._v6_high, high) - 1
+        # Starts are sorted by (high, low); step back over same-high ranges starting later
+        while i >= 0 and self._v6_high[i] == high and self._v6_low[i] > low:
+            i -= 1
+        if i < 0:
+            return None
+        end, asn, country, flags = V6_RECORD.unpack_from(self._mmap, self._v6_records + i * V6_RECORD.size)
+        if packed > end:
+            return None
+        return GeoInfo(country.decode('ascii'), asn, bool(flags & FLAG_HOSTING))
+
+
+class GeoIPResolver:
+    """Holds the current database and swaps it when the file is replaced"""
+
+    def __init__(self, path=None, reload_interval=RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._db = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def _resolve_path(self):
+        if self.path:
+            return self.path
+        if has_app_context():
+            return (current_app.config.get('GEOIP_DB_PATH')
+                    or os.path.join(current_app.instance_path, 'geoip.bin'))
+        return None
+
+    def reload(self):
+        """Map the database file if it is new or changed; returns True when loaded"""
+        path = self._resolve_path()
+        if not path or not os.path.exists(path):
+            self._db = None
+            return False
+        stat = os.stat(path)
+        if self._db is not None and self._db.identity == (stat.st_ino, stat.st_mtime_ns, stat.st_size):
+            return True
+        try:
+            self._db = GeoIPDatabase(path)
+            logger.info("Loaded GeoIP database %s (%d IPv4, %d IPv6 ranges)",
+                        path, self._db.v4_count, self._db.v6_count)
+            return True
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load GeoIP database {path}: {e}")
+            return False
+
+    def lookup(self, address):
+        """
+        Country and ASN for an IP address.
+
+        Returns:
+            GeoInfo or None: None when unknown or no database is installed
+        """
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.reload_interval:
+            with self._lock:
+                if self._checked_at is None or now - self._checked_at >= self.reload_interval:
+                    self._checked_at = now
+                    self.reload()
+        database = self._db
+        if database is None or not address:
+            return None
+        return database.lookup(address)
+
+
+geoip = GeoIPResolver(os.getenv('GEOIP_DB_PATH'))
+
+
+def lookup_ip(address):
+    """Shortcut for ``geoip.lookup``"""
+    return geoip.lookup(address)
@@ -0,0 +1,166 @@
+"""
+Flask-Login identity loading with eager relationships and a short-TTL cache.
+
+Session ids are typed (``user_<id>`` / ``client_<id>``, see ``get_id`` on
+User and Client), so the loader runs exactly one query:
+
+- users with their role, linked client and that client's package
+- clients with their package and linked user
+
+Bare numeric ids from sessions created before ids were prefixed are still
+resolved as a User, then a Client.
+
+Loaded identities are cached per session id for ``IDENTITY_CACHE_TTL``
+seconds as detached instances (loaded in their own short-lived session) and
+merged into the request session with ``load=False``, which copies their state
+without touching the database. Entries are evicted cluster-wide through the
+cache bus on logout and whenever the user, its role or the client changes.
+"""
+import logging
+import os
+import time
+
+from flask_login import user_logged_out
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session, joinedload
+
+from app.extensions import db
+from app.utils.cache_bus import LocalCache, cache_bus
+
+logger = logging.getLogger(__name__)
+
+IDENTITY_TTL = float(os.getenv('IDENTITY_CACHE_TTL', '30'))
+IDENTITY_CACHE_SIZE = int(os.getenv('IDENTITY_CACHE_SIZE', '10000'))
+
+
+def parse_session_id(user_id):
+    """
+    Split a Flask-Login session id into (kind, id).
+
+    Returns:
+        tuple: ('user' | 'client' | 'legacy', int), or None when malformed
+    """
+    if not isinstance(user_id, str):
+        user_id = str(user_id)
+    kind, _, raw = user_id.rpartition('_')
+    if kind not in ('user', 'client', ''):
+        return None
+    try:
+        return (kind or 'legacy', int(raw))
+    except ValueError:
+        return None
+
+
+def _user_query(user_id):
+    from app.models.client import Client
+    from app.models.user import User
+    return select(User).where(User.id == user_id).options(
+        joinedload(User.role),
+        joinedload(User.client).joinedload(Client.package),
+    )
+
+
+def _client_query(client_id):
+    from app.models.client import Client
+    return select(Client).where(Client.id == client_id).options(
+        joinedload(Client.package),
+        joinedload(Client.user),
+    )
+
+
+def load_identity(kind, identity_id):
+    """
+    Load a User or Client with the relationships every page uses.
+
+    The instance is loaded in its own session and returned detached.
+    """
+    with Session(db.engine) as session:
+        if kind == 'user':
+            return session.execute(_user_query(identity_id)).unique().scalar_one_or_none()
+        if kind == 'client':
+            return session.execute(_client_query(identity_id)).unique().scalar_one_or_none()
+        # Legacy un-prefixed id: admin users first, then clients
+        return (session.execute(_user_query(identity_id)).unique().scalar_one_or_none()
+                or session.execute(_client_query(identity_id)).unique().scalar_one_or_none())
+
+
+class IdentityCache:
+    """Detached identities per session id, merged into each request's session"""
+
+    def __init__(self, ttl=IDENTITY_TTL, maxsize=IDENTITY_CACHE_SIZE):
+        self.ttl = ttl
+        self._cache = LocalCache('identity', maxsize=maxsize)
+
+    def load(self, user_id):
+        """
+        The identity for a session id, attached to ``db.session``.
+
+        Returns:
+            User, Client or None
+        """
+        parsed = parse_session_id(user_id)
+        if parsed is None:
+            return None
+        key = str(user_id)
+        entry = self._cache.get(key)
+        if entry is None or time.monotonic() - entry[0] >= self.ttl:
+            version = self._cache.version()
+            identity = load_identity(*parsed)
+            if identity is None:
+                return None
+            entry = (time.monotonic(), identity)
+            self._cache.set(key, entry, version)
+        return db.session.merge(entry[1], load=False)
+
+    def invalidate(self, *session_ids):
+        """Evict session ids in every worker"""
+        cache_bus.publish_many([('identity', str(session_id), None) for session_id in session_ids])
+
+    def __len__(self):
+        return len(self._cache)
+
+
+identity_cache = IdentityCache()
+
+
+def load_user(user_id):
+    """Flask-Login user_loader"""
+    return identity_cache.load(user_id)
+
+
+@user_logged_out.connect
+def _evict_on_logout(sender, user=None, **extra):
+    if user is not None and hasattr(user, 'get_id'):
+        identity_cache.invalidate(user.get_id())
+
+
+def _identity_changed(mapper, connection, target):
+    from app.models.client import Client
+    session = inspect(target).session
+    keys = []
+    if isinstance(target, Client):
+        keys += [f"client_{target.id}", str(target.id)]
+        if target.user_id:
+            keys += [f"user_{target.user_id}", str(target.user_id)]
+    else:
+        keys += [f"user_{target.id}", str(target.id)]
+    for key in keys:
+        cache_bus.publish_on_commit(session, 'identity', key)
+
+
+def _register_listeners():
+    from app.models.client import Client
+    from app.models.client_package import ClientPackage
+    from app.models.role import Role
+    from app.models.user import User
+
+    for model in (User, Client):
+        event.listen(model, 'after_update', _identity_changed)
+        event.listen(model, 'after_delete', _identity_changed)
+    # Role names decide admin access and cached clients carry their package;
+    # drop every cached identity when either changes
+    cache_bus.watch(Role, 'identity')
+    cache_bus.watch(ClientPackage, 'identity')
+
+
+_register_listeners()
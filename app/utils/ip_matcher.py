@@ -0,0 +1,226 @@
+"""
+Compiled IPv4/IPv6 prefix matching for allowlists and blocklists.
+
+Networks are stored in a multibit trie with an 8-bit stride: each level is a
+dict keyed by one address byte, and a prefix that ends inside a byte is
+expanded into every child it covers (controlled prefix expansion). A lookup
+walks at most 4 levels for IPv4 and 16 for IPv6, so its cost depends on the
+address length only, never on how many networks are loaded.
+
+Entries are parsed with ``socket.inet_pton`` rather than ``ipaddress`` to
+keep large threat-feed files fast to load.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# Marks a node whose whole subtree is covered by a stored prefix
+_COVERED = -1
+
+_V4_MAPPED_PREFIX = b'\x00' * 10 + b'\xff\xff'
+
+
+def _address_bytes(address):
+    """Packed address bytes for an IPv4/IPv6 string (IPv4-mapped IPv6 unwrapped)"""
+    if ':' in address:
+        packed = socket.inet_pton(socket.AF_INET6, address.split('%', 1)[0])
+        if packed[:12] == _V4_MAPPED_PREFIX:
+            return packed[12:]
+        return packed
+    return socket.inet_pton(socket.AF_INET, address)
+
+
+def parse_network(entry):
+    """
+    Parse ``addr`` or ``addr/len`` into packed network bytes and prefix length.
+
+    Host bits below the prefix are ignored, like ``ip_network(strict=False)``.
+
+    Raises:
+        ValueError: If the entry is not a valid IPv4/IPv6 address or network
+    """
+    entry = entry.strip()
+    address, _, length = entry.partition('/')
+    try:
+        packed = _address_bytes(address)
+    except (OSError, ValueError):
+        raise ValueError(f'Invalid IP address or network: {entry!r}')
+
+    if not length:
+        return packed, len(packed) * 8
+    max_len = 128 if ':' in address else 32
+    if not length.isdigit() or int(length) > max_len:
+        raise ValueError(f'Invalid prefix length in {entry!r}')
+    prefix_len = int(length)
+    if max_len == 128 and len(packed) == 4:
+        # ::ffff:a.b.c.d/len counts the 96 mapped bits
+        prefix_len = max(0, prefix_len - 96)
+    return packed, prefix_len
+
+
+class IPMatcher:
+    """Set of IPv4/IPv6 networks with prefix-length lookups"""
+
+    __slots__ = ('_roots', '_size')
+
+    def __init__(self, entries=()):
+        self._roots = {4: {}, 16: {}}
+        self._size = 0
+        for entry in entries:
+            self.add(entry)
+
+    def add(self, entry):
+        """Add an address or CIDR network (raises ValueError when invalid)"""
+        packed, prefix_len = parse_network(entry)
+        node = self._roots[len(packed)]
+        full_bytes, rest = divmod(prefix_len, 8)
+
+        for byte in packed[:full_bytes]:
+            if _COVERED in node:
+                break
+            node = node.setdefault(byte, {})
+        else:
+            if rest == 0:
+                node.clear()
+                node[_COVERED] = True
+            elif _COVERED not in node:
+                span = 1 << (8 - rest)
+                base = packed[full_bytes] & (0xFF ^ (span - 1))
+                for byte in range(base, base + span):
+                    child = node.setdefault(byte, {})
+                    child.clear()
+                    child[_COVERED] = True
+        self._size += 1
+
+    def __contains__(self, address):
+        return self.match(address)
+
+    def match(self, address):
+        """
+        Check whether an address falls inside any stored network.
+
+        Invalid or empty addresses never match.
+        """
+        if not address:
+            return False
+        try:
+            packed = _address_bytes(address)
+        except (OSError, ValueError):
+            return False
+
+        node = self._roots[len(packed)]
+        for byte in packed:
+            if _COVERED in node:
+                return True
+            node = node.get(byte)
+            if node is None:
+                return False
+        return _COVERED in node
+
+    def __len__(self):
+        return self._size
+
+    def __bool__(self):
+        return self._size > 0
+
+    @classmethod
+    def from_lines(cls, lines, source='<list>'):
+        """
+        Build a matcher from text lines, skipping blanks, ``#`` comments and
+        invalid entries (which are logged).
+        """
+        matcher = cls()
+        invalid = 0
+        for line in lines:
+            entry = line.split('#', 1)[0].strip()
+            if not entry:
+                continue
+            # Threat feeds often carry extra columns (";" or whitespace separated)
+            entry = entry.split(';', 1)[0].split()[0]
+            try:
+                matcher.add(entry)
+            except ValueError:
+                invalid += 1
+        if invalid:
+            logger.warning("Skipped %d invalid entries in %s", invalid, source)
+        return matcher
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding='utf-8', errors='replace') as fh:
+            return cls.from_lines(fh, source=path)
+
+
+@lru_cache(maxsize=4096)
+def _compile(entries):
+    return IPMatcher.from_lines(entries, source='allowlist')
+
+
+def compile_ip_list(entries):
+    """
+    Cached matcher for a list of addresses/networks (e.g. ``allowed_ips``).
+
+    The cache is keyed on the list contents, so editing a list compiles a
+    fresh matcher and identical lists share one.
+    """
+    return _compile(tuple(str(entry) for entry in (entries or ())))
+
+
+class IPBlocklist:
+    """
+    Blocklist loaded from a file of addresses/networks, reloaded when the
+    file changes on disk.
+    """
+
+    def __init__(self, path=None, check_interval=30):
+        self.path = path
+        self.check_interval = check_interval
+        self._matcher = IPMatcher()
+        self._mtime = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+
+    def load(self, path=None):
+        """
+        (Re)load the blocklist file, swapping the matcher atomically.
+
+        Returns:
+            int: Number of entries loaded
+        """
+        path = path or self.path
+        if not path:
+            return 0
+        mtime = os.path.getmtime(path)
+        matcher = IPMatcher.from_file(path)
+        with self._lock:
+            self.path = path
+            self._matcher = matcher
+            self._mtime = mtime
+        logger.info("Loaded %d IP blocklist entries from %s", len(matcher), path)
+        return len(matcher)
+
+    def _maybe_reload(self, now):
+        if not self.path or now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        try:
+            if os.path.getmtime(self.path) != self._mtime:
+                self.load()
+        except OSError as e:
+            logger.warning(f"IP blocklist {self.path} unavailable: {e}")
+
+    def is_blocked(self, address):
+        """Check an address against the blocklist"""
+        self._maybe_reload(time.time())
+        return self._matcher.match(address)
+
+    def __len__(self):
+        return len(self._matcher)
+
+
+ip_blocklist = IPBlocklist(os.getenv('IP_BLOCKLIST_FILE'))
@@ -0,0 +1,81 @@
+"""
+Mergeable latency sketch for usage rollups.
+
+Values are counted in logarithmic buckets (the DDSketch layout), so every
+quantile is within ``relative_accuracy`` of the true value, two sketches merge
+by adding bucket counts, and the serialized form stays small. That lets hourly
+rollups be combined into daily or monthly percentiles without raw rows.
+"""
+import math
+
+
+class LatencySketch:
+    """Log-bucketed histogram with bounded relative error"""
+
+    __slots__ = ('relative_accuracy', '_gamma', '_log_gamma', 'buckets', 'zero_count', 'count')
+
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.buckets = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value, weight=1):
+        """Record a latency in milliseconds"""
+        if value is None:
+            return
+        if value <= 0:
+            self.zero_count += weight
+        else:
+            index = math.ceil(math.log(value) / self._log_gamma)
+            self.buckets[index] = self.buckets.get(index, 0) + weight
+        self.count += weight
+
+    def merge(self, other):
+        """Add another sketch's counts into this one (same accuracy required)"""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError('Cannot merge sketches with different accuracy')
+        for index, weight in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + weight
+        self.zero_count += other.zero_count
+        self.count += other.count
+        return self
+
+    def quantile(self, q):
+        """
+        Estimate the ``q`` quantile (0..1).
+
+        Returns:
+            float or None: None when the sketch is empty
+        """
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        seen = self.zero_count
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                # Midpoint of the bucket (gamma^(i-1), gamma^i] in relative terms
+                return 2 * self._gamma ** index / (self._gamma + 1)
+        return 2 * self._gamma ** max(self.buckets) / (self._gamma + 1)
+
+    def to_dict(self):
+        return {
+            'a': self.relative_accuracy,
+            'z': self.zero_count,
+            'b': {str(index): weight for index, weight in self.buckets.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(relative_accuracy=(data or {}).get('a', 0.01))
+        if not data:
+            return sketch
+        sketch.zero_count = data.get('z', 0)
+        sketch.buckets = {int(index): weight for index, weight in data.get('b', {}).items()}
+        sketch.count = sketch.zero_count + sum(sketch.buckets.values())
+        return sketch
@@ -0,0 +1,407 @@
+"""
+Per-worker memory diagnostics and RSS-triggered worker recycling.
+
+Every worker writes a small report (RSS, gc generation counts, sizes of the
+process-local structures known to grow, tracemalloc state) to
+``MEMORY_DIAGNOSTICS_DIR`` at most every ``MEMORY_CHECK_INTERVAL`` seconds, so
+whichever worker answers the admin request can show all of them.
+
+tracemalloc is off by default. Starting or stopping it, and taking named
+snapshots, is announced on the cache bus (namespace ``memory``) so every
+worker acts on it; snapshots are dumped to the same directory as
+``<pid>-<name>.snapshot`` and any worker can load two of them to diff.
+
+When ``MEMORY_RECYCLE_RSS_MB`` is set, a gunicorn worker whose RSS exceeds it
+(after serving at least ``MEMORY_RECYCLE_MIN_REQUESTS`` requests) sends itself
+SIGTERM: gunicorn treats that as a graceful exit, finishes the in-flight
+request and forks a replacement, which bounds memory without a blind
+``max_requests``.
+"""
+import gc
+import json
+import logging
+import os
+import re
+import resource
+import signal
+import threading
+import time
+import tracemalloc
+
+from flask import request
+
+from app.utils.cache_bus import cache_bus
+
+logger = logging.getLogger(__name__)
+
+DIAGNOSTICS_DIR = os.getenv('MEMORY_DIAGNOSTICS_DIR', '/tmp/paycrypt-memory')
+CHECK_INTERVAL = float(os.getenv('MEMORY_CHECK_INTERVAL', '30'))
+RECYCLE_RSS_MB = float(os.getenv('MEMORY_RECYCLE_RSS_MB', '0'))  # 0 disables recycling
+RECYCLE_MIN_REQUESTS = int(os.getenv('MEMORY_RECYCLE_MIN_REQUESTS', '100'))
+MAX_SNAPSHOTS = int(os.getenv('MEMORY_MAX_SNAPSHOTS', '10'))  # Per worker
+DEFAULT_FRAMES = 1
+
+_SNAPSHOT_NAME = re.compile(r'^[A-Za-z0-9_.-]{1,64}$')
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+# tracemalloc's own bookkeeping and the import machinery are noise in diffs
+_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+def rss_bytes():
+    """
+    Current resident set size of this process.
+
+    Falls back to the peak RSS from getrusage where /proc is unavailable.
+
+    Returns:
+        int: RSS in bytes
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def tracked_structures():
+    """
+    Entry counts of the process-local structures that grow with uptime.
+
+    Returns:
+        dict: Structure name -> size (entries), missing modules are skipped
+    """
+    sizes = {}
+    try:
+        from app.utils import security
+        if not security.REDIS_AVAILABLE:
+            sizes['rate_limit_memory_store'] = len(security._memory_store)
+    except Exception:
+        pass
+    try:
+        from app.utils.exchange import _fetch_cached_rate
+        sizes['exchange_rate_lru'] = _fetch_cached_rate.cache_info().currsize
+    except Exception:
+        pass
+    try:
+        from app.utils.coins import get_coin_display_name
+        sizes['coin_display_name_lru'] = get_coin_display_name.cache_info().currsize
+    except Exception:
+        pass
+    try:
+        from app.utils.cache_bus import LocalCache
+        for cache in LocalCache.instances():
+            sizes[f'local_cache:{cache.namespace}'] = len(cache)
+    except Exception:
+        pass
+    try:
+        from app.utils.caching import tiered_cache
+        sizes['tiered_cache_l1'] = len(tiered_cache._l1)
+    except Exception:
+        pass
+    try:
+        from app.utils.identity import identity_cache
+        sizes['identity_cache'] = len(identity_cache)
+    except Exception:
+        pass
+    try:
+        from app.utils.query_stats import query_stats
+        sizes['query_stats_endpoints'] = len(query_stats.stats())
+    except Exception:
+        pass
+    try:
+        from app.utils.slow_queries import slow_query_sampler
+        sizes['slow_query_buffer'] = len(slow_query_sampler)
+    except Exception:
+        pass
+    return sizes
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class MemoryDiagnostics:
+    """Worker memory reports, tracemalloc control and size-triggered recycling"""
+
+    def __init__(self, directory=DIAGNOSTICS_DIR):
+        self.directory = directory
+        self.recycle_rss_bytes = int(RECYCLE_RSS_MB * 1024 * 1024)
+        self.started_at = time.time()
+        self.requests = 0
+        self.recycling = False
+        self._pid = os.getpid()
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.directory = app.config.get('MEMORY_DIAGNOSTICS_DIR', self.directory)
+        self.recycle_rss_bytes = int(float(app.config.get('MEMORY_RECYCLE_RSS_MB', RECYCLE_RSS_MB)) * 1024 * 1024)
+        cache_bus.subscribe('memory', self._on_command)
+        app.after_request(self._after_request)
+
+    # --- reports ---
+
+    def report(self):
+        """Memory report of this worker"""
+        tracing = tracemalloc.is_tracing()
+        current, peak = tracemalloc.get_traced_memory() if tracing else (None, None)
+        return {
+            'pid': os.getpid(),
+            'rss_bytes': rss_bytes(),
+            'peak_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            'uptime_seconds': round(time.time() - self.started_at, 1),
+            'requests': self.requests,
+            'gc': {
+                'counts': gc.get_count(),
+                'thresholds': gc.get_threshold(),
+                'collections': [stat['collections'] for stat in gc.get_stats()],
+                'uncollectable': [stat['uncollectable'] for stat in gc.get_stats()],
+                'garbage': len(gc.garbage),
+            },
+            'structures': tracked_structures(),
+            'tracemalloc': {
+                'tracing': tracing,
+                'frames': tracemalloc.get_traceback_limit() if tracing else None,
+                'traced_bytes': current,
+                'peak_traced_bytes': peak,
+            },
+            'recycle_rss_bytes': self.recycle_rss_bytes or None,
+            'recycling': self.recycling,
+            'reported_at': time.time(),
+        }
+
+    def _write_report(self, report):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"{report['pid']}.json")
+            tmp = f'{path}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(report, f)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Could not write memory report to {self.directory}: {e}")
+
+    def workers(self):
+        """
+        Latest report of every live worker, this one refreshed first.
+
+        Reports left by exited workers are removed.
+
+        Returns:
+            list: Reports sorted by RSS, largest first
+        """
+        current = self.report()
+        self._write_report(current)
+        reports = {current['pid']: current}
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            names = []
+        for name in names:
+            if not name.endswith('.json') or not name[:-5].isdigit():
+                continue
+            pid = int(name[:-5])
+            path = os.path.join(self.directory, name)
+            if pid in reports:
+                continue
+            if not _pid_alive(pid):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(path) as f:
+                    reports[pid] = json.load(f)
+            except (OSError, ValueError):
+                continue
+        return sorted(reports.values(), key=lambda r: r.get('rss_bytes') or 0, reverse=True)
+
+    # --- tracemalloc ---
+
+    def start_tracing(self, frames=DEFAULT_FRAMES):
+        """Start tracemalloc in every worker"""
+        cache_bus.publish('memory', f'start:{int(frames)}')
+
+    def stop_tracing(self):
+        """Stop tracemalloc in every worker, dropping its traces"""
+        cache_bus.publish('memory', 'stop')
+
+    def take_snapshot(self, name):
+        """
+        Dump a tracemalloc snapshot named ``name`` in every tracing worker.
+
+        Raises:
+            ValueError: If the name is not usable as a file name
+        """
+        if not _SNAPSHOT_NAME.match(name or ''):
+            raise ValueError('Snapshot names may only contain letters, digits, ".", "_" and "-"')
+        cache_bus.publish('memory', f'snapshot:{name}')
+
+    def _on_command(self, key, version):
+        if key is None:  # Bus reconnect, nothing to drop
+            return
+        command, _, arg = key.partition(':')
+        if command == 'start':
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(max(1, int(arg or DEFAULT_FRAMES)))
+                logger.info(f"tracemalloc started in worker {os.getpid()}")
+        elif command == 'stop':
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+                logger.info(f"tracemalloc stopped in worker {os.getpid()}")
+        elif command == 'snapshot' and tracemalloc.is_tracing():
+            self._dump_snapshot(arg)
+
+    def _dump_snapshot(self, name):
+        snapshot = tracemalloc.take_snapshot().filter_traces(_FILTERS)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            snapshot.dump(self._snapshot_path(os.getpid(), name))
+        except OSError as e:
+            logger.warning(f"Could not dump memory snapshot {name}: {e}")
+            return
+        mine = [s for s in self.snapshots() if s['pid'] == os.getpid()]
+        for stale in mine[:-MAX_SNAPSHOTS] if len(mine) > MAX_SNAPSHOTS else ():
+            try:
+                os.remove(self._snapshot_path(stale['pid'], stale['name']))
+            except OSError:
+                pass
+
+    def _snapshot_path(self, pid, name):
+        if not _SNAPSHOT_NAME.match(name or ''):
+            raise ValueError(f'Invalid snapshot name: {name!r}')
+        return os.path.join(self.directory, f'{int(pid)}-{name}.snapshot')
+
+    def snapshots(self):
+        """
+        Snapshots dumped by any worker, oldest first.
+
+        Returns:
+            list: Dicts with pid, name, size_bytes and taken_at
+        """
+        found = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return found
+        for filename in names:
+            pid, _, rest = filename.partition('-')
+            if not pid.isdigit() or not rest.endswith('.snapshot'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, filename))
+            except OSError:
+                continue
+            found.append({'pid': int(pid), 'name': rest[:-len('.snapshot')],
+                          'size_bytes': stat.st_size, 'taken_at': stat.st_mtime})
+        return sorted(found, key=lambda s: s['taken_at'])
+
+    def load_snapshot(self, pid, name):
+        """
+        Raises:
+            FileNotFoundError: If that worker has no snapshot by that name
+        """
+        return tracemalloc.Snapshot.load(self._snapshot_path(pid, name))
+
+    def top(self, pid, name, limit=25, key_type='lineno'):
+        """
+        Largest allocation sites in a snapshot.
+
+        Returns:
+            dict: Totals and the ``limit`` biggest sites
+        """
+        statistics = self.load_snapshot(pid, name).statistics(key_type)
+        return {
+            'pid': pid,
+            'snapshot': name,
+            'total_bytes': sum(stat.size for stat in statistics),
+            'total_blocks': sum(stat.count for stat in statistics),
+            'top': [{
+                'location': _location(stat.traceback),
+                'size_bytes': stat.size,
+                'count': stat.count,
+            } for stat in statistics[:limit]],
+        }
+
+    def diff(self, pid, older, newer, limit=25, key_type='lineno'):
+        """
+        Allocation sites that grew the most between two snapshots of one worker.
+
+        Returns:
+            dict: Net growth and the ``limit`` sites with the largest size change
+        """
+        differences = self.load_snapshot(pid, newer).compare_to(self.load_snapshot(pid, older), key_type)
+        return {
+            'pid': pid,
+            'from': older,
+            'to': newer,
+            'size_diff_bytes': sum(stat.size_diff for stat in differences),
+            'count_diff': sum(stat.count_diff for stat in differences),
+            'top': [{
+                'location': _location(stat.traceback),
+                'size_bytes': stat.size,
+                'size_diff_bytes': stat.size_diff,
+                'count': stat.count,
+                'count_diff': stat.count_diff,
+            } for stat in differences[:limit]],
+        }
+
+    # --- recycling ---
+
+    def _after_request(self, response):
+        self.requests += 1
+        now = time.monotonic()
+        if now - self._last_check < CHECK_INTERVAL or self.recycling:
+            return response
+        with self._lock:
+            if now - self._last_check < CHECK_INTERVAL:
+                return response
+            self._last_check = now
+        if self._pid != os.getpid():  # Forked after import
+            self._pid = os.getpid()
+            self.started_at = time.time()
+            self.requests = 1
+        report = self.report()
+        self._write_report(report)
+        try:
+            from app.utils import metrics
+            metrics.observe_rss(report['rss_bytes'])
+        except Exception:
+            pass
+        if self.recycle_rss_bytes and report['rss_bytes'] > self.recycle_rss_bytes:
+            self._recycle(report, request.environ.get('SERVER_SOFTWARE', ''))
+        return response
+
+    def _recycle(self, report, server_software):
+        rss_mb = report['rss_bytes'] / 1024 / 1024
+        if self.requests < RECYCLE_MIN_REQUESTS:
+            return
+        if not server_software.startswith('gunicorn'):
+            logger.warning(f"Worker {os.getpid()} RSS {rss_mb:.0f} MB is over the recycle limit, "
+                           f"but it is not running under gunicorn")
+            self.recycling = True
+            return
+        logger.warning(f"Recycling worker {os.getpid()}: RSS {rss_mb:.0f} MB over "
+                       f"{self.recycle_rss_bytes / 1024 / 1024:.0f} MB after {self.requests} requests")
+        self.recycling = True
+        os.kill(os.getpid(), signal.SIGTERM)  # Graceful: gunicorn finishes in-flight work first
+
+
+def _location(traceback):
+    frame = traceback[0]
+    return f'{frame.filename}:{frame.lineno}'
+
+
+memory_diagnostics = MemoryDiagnostics()
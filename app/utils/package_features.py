@@ -300,10 +300,10 @@ def get_features_for_client(client):
     """
     features = set()
     
-    # Get base features from package
-    if client.package and client.package.slug:
-        package_features = PACKAGE_FEATURES.get(client.package.slug, [])
-        features.update(package_features)
+    # Get base features from package (precompiled preset for the package slug)
+    if client.package_id:
+        from app.utils.entitlements import entitlements_for_package
+        features.update(entitlements_for_package(client.package_id).preset_keys())
     elif hasattr(client, 'status') and client.status:
         # Fallback to status-based features
         package_features = PACKAGE_FEATURES.get(client.status, [])
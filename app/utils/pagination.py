@@ -0,0 +1,122 @@
+"""
+Keyset (cursor) pagination helpers.
+
+A cursor is the sort key of the last row on a page, serialised as URL-safe
+base64 JSON. Clients pass it back verbatim to fetch the next page, which keeps
+every page an index range scan instead of an ever-growing OFFSET.
+"""
+import base64
+import json
+from datetime import datetime
+
+_DATETIME_TAG = '__dt__'
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {_DATETIME_TAG: value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and _DATETIME_TAG in value:
+        return datetime.fromisoformat(value[_DATETIME_TAG])
+    return value
+
+
+def encode_cursor(values):
+    """
+    Encode a row's sort key into an opaque cursor string.
+
+    Args:
+        values: Sequence of JSON-serialisable values or datetimes
+
+    Returns:
+        str: URL-safe cursor
+    """
+    raw = json.dumps([_encode_value(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, size=None):
+    """
+    Decode a cursor produced by :func:`encode_cursor`.
+
+    Args:
+        cursor: Cursor string from the client
+        size: Expected number of key values, if known
+
+    Returns:
+        list: Decoded sort key values
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or (size is not None and len(values) != size):
+        raise ValueError('Invalid cursor')
+    try:
+        return [_decode_value(v) for v in values]
+    except (TypeError, ValueError):
+        raise ValueError('Invalid cursor')
+
+
+def keyset_paginate(query, created_col, id_col, cursor=None, limit=20):
+    """
+    Fetch one page of ``query`` ordered newest first on ``(created_col, id_col)``.
+
+    Args:
+        query: SQLAlchemy query already filtered for the caller
+        created_col: Timestamp column used as the primary sort key
+        id_col: Primary key column used as the tie breaker
+        cursor: Cursor returned as ``next_cursor`` by the previous page
+        limit: Page size
+
+    Returns:
+        tuple: (items, next_cursor) where next_cursor is None on the last page
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    from sqlalchemy import and_, or_
+
+    if cursor:
+        last_created, last_id = decode_cursor(cursor, size=2)
+        if not isinstance(last_created, datetime) or not isinstance(last_id, int):
+            raise ValueError('Invalid cursor')
+        query = query.filter(or_(
+            created_col < last_created,
+            and_(created_col == last_created, id_col < last_id)
+        ))
+
+    limit = max(1, limit)
+    items = query.order_by(created_col.desc(), id_col.desc()).limit(limit + 1).all()
+    return _trim_page(items, created_col, id_col, limit)
+
+
+def offset_paginate(query, created_col, id_col, page=1, limit=20):
+    """
+    Fetch page number ``page`` with OFFSET, in the same order as :func:`keyset_paginate`.
+
+    Kept for clients that still send ``?page=N``; the returned cursor lets them
+    continue with keyset pagination from there.
+
+    Returns:
+        tuple: (items, next_cursor) where next_cursor is None on the last page
+    """
+    limit = max(1, limit)
+    items = query.order_by(created_col.desc(), id_col.desc()).offset((page - 1) * limit).limit(limit + 1).all()
+    return _trim_page(items, created_col, id_col, limit)
+
+
+def _trim_page(items, created_col, id_col, limit):
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        next_cursor = encode_cursor([getattr(last, created_col.key), getattr(last, id_col.key)])
+    return items, next_cursor
@@ -0,0 +1,339 @@
+"""
+Per-request SQL instrumentation, N+1 detection and query budgets.
+
+Every statement sent through an engine is counted and timed against the
+current scope: the request being served, or a block wrapped in
+``query_scope`` (report jobs, scheduled tasks). Statements are reduced to a
+fingerprint (literals, bind parameters and IN lists collapsed), so the same
+query issued once per row of a loop shows up as one fingerprint with a high
+count.
+
+Views declare what they are allowed to run with ``@query_budget(n)``. What
+happens when a request goes over its budget, or repeats a statement
+``QUERY_REPEAT_THRESHOLD`` times, depends on ``QUERY_BUDGET_MODE``:
+
+- ``raise``: fail the request with QueryBudgetExceeded (default in debug
+  and testing)
+- ``log``: log a warning and count the violation (default in production)
+- ``off``: no checks, counting only
+
+Per-endpoint totals are kept in ``query_stats`` and exported through the
+admin ``/queries/stats`` route; in debug a ``Server-Timing`` header carries
+each request's query count and SQL time.
+"""
+import contextvars
+import functools
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+REPEAT_THRESHOLD = int(os.getenv('QUERY_REPEAT_THRESHOLD', '5'))
+LOG_INTERVAL = float(os.getenv('QUERY_BUDGET_LOG_INTERVAL', '60'))
+TOP_STATEMENTS = 5  # Repeated fingerprints kept per endpoint
+MAX_FINGERPRINT_LENGTH = 500
+
+MODES = ('raise', 'log', 'off')
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_BIND_PARAM = re.compile(r"%\(\w+\)s|%s|\$\d+|(?<![:\w]):\w+|\?")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_VALUE_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+_current = contextvars.ContextVar('query_stats_scope', default=None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A view ran more queries than its declared budget, or an N+1 pattern"""
+
+
+def fingerprint(statement):
+    """
+    Normalize a SQL statement so executions differing only in parameters match.
+
+    Returns:
+        str: Statement with literals and bind parameters replaced by ``?``
+    """
+    statement = _STRING_LITERAL.sub('?', statement)
+    statement = _BIND_PARAM.sub('?', statement)
+    statement = _NUMBER.sub('?', statement)
+    statement = _VALUE_LIST.sub('(?)', statement)
+    return _WHITESPACE.sub(' ', statement).strip()[:MAX_FINGERPRINT_LENGTH]
+
+
+class QueryStats:
+    """Queries run in one scope (a request or a ``query_scope`` block)"""
+
+    __slots__ = ('name', 'count', 'sql_time', 'statements', 'budget', 'over_budget', 'parent')
+
+    def __init__(self, name, parent=None):
+        self.name = name
+        self.count = 0
+        self.sql_time = 0.0  # Seconds
+        self.statements = Counter()
+        self.budget = None
+        self.over_budget = False
+        self.parent = parent
+
+    def record(self, statement, elapsed):
+        scope = self
+        while scope is not None:
+            scope.count += 1
+            scope.sql_time += elapsed
+            scope.statements[statement] += 1
+            scope = scope.parent
+
+    def repeated(self, threshold=REPEAT_THRESHOLD):
+        """
+        Statements run at least ``threshold`` times, most frequent first.
+
+        Returns:
+            list: [(fingerprint, count)]
+        """
+        repeats = {}
+        for statement, count in self.statements.items():
+            key = fingerprint(statement)
+            repeats[key] = repeats.get(key, 0) + count
+        return sorted(((key, count) for key, count in repeats.items() if count >= threshold),
+                      key=lambda item: -item[1])
+
+
+def current_stats():
+    """QueryStats of the innermost active scope, or None"""
+    return _current.get()
+
+
+def _mode():
+    if not has_app_context():
+        return 'log'
+    mode = current_app.config.get('QUERY_BUDGET_MODE')
+    if mode in MODES:
+        return mode
+    return 'raise' if current_app.debug or current_app.testing else 'log'
+
+
+# --- engine instrumentation ---
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    started = conn.info.get('query_started')
+    if stats is None or not started:
+        return
+    stats.record(statement, time.perf_counter() - started.pop())
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context):
+    if context.connection is not None:
+        started = context.connection.info.get('query_started')
+        if started:
+            started.pop()
+
+
+# --- aggregation ---
+
+class QueryStatsRegistry:
+    """Per-endpoint query totals for this worker"""
+
+    def __init__(self):
+        self._endpoints = {}
+        self._logged_at = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stats, repeats=()):
+        with self._lock:
+            entry = self._endpoints.get(stats.name)
+            if entry is None:
+                entry = self._endpoints[stats.name] = {
+                    'requests': 0, 'queries': 0, 'max_queries': 0, 'sql_ms': 0.0,
+                    'over_budget': 0, 'n_plus_one': 0, 'budget': None, 'repeated': Counter(),
+                }
+            entry['requests'] += 1
+            entry['queries'] += stats.count
+            entry['max_queries'] = max(entry['max_queries'], stats.count)
+            entry['sql_ms'] += stats.sql_time * 1000
+            if stats.budget is not None:
+                entry['budget'] = stats.budget
+            if stats.over_budget:
+                entry['over_budget'] += 1
+            if repeats:
+                entry['n_plus_one'] += 1
+                for key, count in repeats:
+                    entry['repeated'][key] = max(entry['repeated'][key], count)
+                if len(entry['repeated']) > TOP_STATEMENTS:
+                    entry['repeated'] = Counter(dict(entry['repeated'].most_common(TOP_STATEMENTS)))
+
+    def should_log(self, name):
+        """Rate-limit warnings to one per endpoint per LOG_INTERVAL seconds"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._logged_at.get(name, float('-inf')) < LOG_INTERVAL:
+                return False
+            self._logged_at[name] = now
+            return True
+
+    def stats(self):
+        """
+        Totals per endpoint, busiest first.
+
+        Returns:
+            dict: endpoint -> counters, averages and the worst repeated statements
+        """
+        with self._lock:
+            items = [(name, dict(entry, repeated=entry['repeated'].most_common()))
+                     for name, entry in self._endpoints.items()]
+        result = {}
+        for name, entry in sorted(items, key=lambda item: -item[1]['queries']):
+            requests = entry['requests'] or 1
+            entry['avg_queries'] = round(entry['queries'] / requests, 2)
+            entry['avg_sql_ms'] = round(entry['sql_ms'] / requests, 2)
+            entry['sql_ms'] = round(entry['sql_ms'], 2)
+            entry['repeated'] = [{'statement': key, 'count': count} for key, count in entry['repeated']]
+            result[name] = entry
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._endpoints = {}
+
+
+query_stats = QueryStatsRegistry()
+
+
+def _finish(stats):
+    """Check a finished scope for N+1 patterns and add it to the totals"""
+    repeats = stats.repeated()
+    if (repeats or stats.over_budget) and query_stats.should_log(stats.name):
+        logger.warning(
+            f"{stats.name}: {stats.count} queries in {stats.sql_time * 1000:.1f}ms"
+            + (f" (budget {stats.budget})" if stats.over_budget else '')
+            + ''.join(f"; {count}x {key[:200]}" for key, count in repeats[:3])
+        )
+    query_stats.observe(stats, repeats)
+
+
+@contextmanager
+def query_scope(name, budget=None):
+    """
+    Count the queries run inside the block under ``name``.
+
+    Scopes nest: queries also count towards the enclosing request or scope.
+
+    Args:
+        name: Name the totals are reported under
+        budget: Optional maximum number of queries
+    """
+    stats = QueryStats(name, parent=_current.get())
+    token = _current.set(stats)
+    try:
+        yield stats
+        if budget is not None:
+            check_budget(stats, budget)
+    finally:
+        _current.reset(token)
+        _finish(stats)
+
+
+# --- budgets ---
+
+def check_budget(stats, max_queries, max_repeats=None):
+    """
+    Enforce a query budget on ``stats`` according to QUERY_BUDGET_MODE.
+
+    Args:
+        stats: QueryStats to check
+        max_queries: Maximum number of queries
+        max_repeats: Maximum executions of one statement (default QUERY_REPEAT_THRESHOLD - 1)
+
+    Raises:
+        QueryBudgetExceeded: In ``raise`` mode when the budget is exceeded
+    """
+    stats.budget = max_queries
+    mode = _mode()
+    if mode == 'off':
+        return
+    threshold = (max_repeats if max_repeats is not None else REPEAT_THRESHOLD - 1) + 1
+    repeats = stats.repeated(threshold)
+    if stats.count <= max_queries and not repeats:
+        return
+    stats.over_budget = True
+    if mode == 'raise':
+        details = ''.join(f"\n  {count}x {key}" for key, count in repeats)
+        raise QueryBudgetExceeded(
+            f"{stats.name} ran {stats.count} queries (budget {max_queries}){details}"
+        )
+
+
+def query_budget(max_queries, max_repeats=None):
+    """
+    Declare how many queries a view may run, counted over the whole request
+    up to the view's return (login, template rendering included).
+
+    Args:
+        max_queries: Maximum number of queries
+        max_repeats: Maximum executions of one statement
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            result = fn(*args, **kwargs)
+            stats = _current.get()
+            if stats is not None:
+                check_budget(stats, max_queries, max_repeats)
+            return result
+        wrapper.query_budget = max_queries
+        return wrapper
+    return decorator
+
+
+# --- request hooks ---
+
+def _start_request():
+    g._query_stats_token = _current.set(QueryStats(request.endpoint or request.path))
+
+
+def _server_timing(response):
+    stats = _current.get()
+    show = current_app.config.get('QUERY_STATS_HEADER')
+    if show is None:
+        show = current_app.debug or current_app.testing
+    if stats is not None and show:
+        response.headers.add(
+            'Server-Timing', f'db;dur={stats.sql_time * 1000:.1f};desc="{stats.count} queries"'
+        )
+    return response
+
+
+def _end_request(exc=None):
+    token = g.pop('_query_stats_token', None)
+    if token is None:
+        return
+    stats = _current.get()
+    _current.reset(token)
+    if stats is not None:
+        _finish(stats)
+
+
+def init_app(app):
+    """Start a query scope per request (QUERY_BUDGET_MODE defaults from debug/testing)"""
+    app.config.setdefault('QUERY_BUDGET_MODE', os.getenv('QUERY_BUDGET_MODE'))
+    app.before_request(_start_request)
+    app.after_request(_server_timing)
+    app.teardown_request(_end_request)
@@ -0,0 +1,189 @@
+"""
+Background report generation.
+
+Reports are queued as ``Report`` rows and built on a small thread pool so the
+admin request returns immediately. Results are written to disk as JSON or CSV
+artifacts; the UI polls the job status and downloads the file when it is done.
+
+Jobs live only in the worker that queued them, so a restart or recycle
+strands their rows. The scheduler calls :func:`recover_stale_reports`, which
+requeues reports still pending after ``REPORT_JOB_TIMEOUT_MINUTES`` and fails
+those processing for longer. Reports are claimed with a conditional update,
+so a requeued report never runs twice.
+"""
+import csv
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from app.extensions import db
+from app.models.report import Report, ReportStatus, ReportFormat
+from app.utils.query_stats import query_scope
+from app.utils.tracing import start_trace
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+JOB_TIMEOUT = timedelta(minutes=int(os.getenv('REPORT_JOB_TIMEOUT_MINUTES', '30')))
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        workers = int(os.getenv('REPORT_WORKERS', '2'))
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='report')
+    return _executor
+
+
+def get_artifact_dir(app=None):
+    """Directory where generated report files are stored"""
+    app = app or current_app
+    path = app.config.get('REPORT_ARTIFACT_DIR') or os.path.join(app.instance_path, 'reports')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def enqueue_report(name, report_type, filters=None, result_format=ReportFormat.JSON.value, description=None):
+    """
+    Create a pending report and schedule it on the worker pool.
+
+    Args:
+        name: Display name of the report
+        report_type: One of ``ReportType`` values
+        filters: Optional dict of filters (start_date, end_date)
+        result_format: 'json' or 'csv'
+        description: Optional description
+
+    Returns:
+        Report: The persisted report row (status ``pending``)
+    """
+    report = Report(
+        name=name,
+        description=description,
+        report_type=report_type,
+        filters=filters,
+        result_format=result_format
+    )
+    db.session.add(report)
+    db.session.commit()
+
+    app = current_app._get_current_object()
+    _get_executor().submit(run_report, app, report.id)
+    return report
+
+
+def run_report(app, report_id):
+    """Build a report and store its artifact. Runs inside a worker thread."""
+    with app.app_context():
+        # Claim the report; another worker may have picked up a requeued copy
+        claimed = Report.query.filter_by(id=report_id, status=ReportStatus.PENDING.value).update(
+            {'status': ReportStatus.PROCESSING.value, 'started_at': datetime.utcnow()},
+            synchronize_session=False
+        )
+        db.session.commit()
+        if not claimed:
+            db.session.remove()
+            return
+        report = db.session.get(Report, report_id)
+
+        try:
+            with start_trace(f'report:{report.report_type}'), query_scope(f'report:{report.report_type}'):
+                data = report.generate_report()
+            if data is None:
+                raise ValueError(f"Report type '{report.report_type}' needs different filters")
+
+            report.artifact_path = _write_artifact(app, report, data)
+            report.status = ReportStatus.COMPLETED.value
+            report.error_message = None
+        except Exception as e:
+            db.session.rollback()
+            logger.exception("Report %s failed", report_id)
+            report = db.session.get(Report, report_id)
+            report.status = ReportStatus.FAILED.value
+            report.error_message = str(e)[:1000]
+        finally:
+            report.completed_at = datetime.utcnow()
+            db.session.commit()
+            db.session.remove()
+
+
+def recover_stale_reports(now=None, timeout=JOB_TIMEOUT):
+    """
+    Requeue or fail reports stranded by a worker restart.
+
+    Pending reports older than ``timeout`` are queued again on this process's
+    pool; reports processing for longer than ``timeout`` are marked failed,
+    since their worker may be gone mid-run.
+
+    Returns:
+        dict: ``{'requeued': [...ids], 'failed': [...ids]}``
+    """
+    now = now or datetime.utcnow()
+    cutoff = now - timeout
+
+    stuck = Report.query.filter(
+        Report.status == ReportStatus.PROCESSING.value,
+        Report.started_at < cutoff
+    ).all()
+    for report in stuck:
+        report.status = ReportStatus.FAILED.value
+        report.error_message = 'Interrupted before completion (worker restarted); run the report again'
+        report.completed_at = now
+    db.session.commit()
+
+    pending = [report_id for (report_id,) in db.session.query(Report.id).filter(
+        Report.status == ReportStatus.PENDING.value,
+        Report.created_at < cutoff
+    )]
+    app = current_app._get_current_object()
+    for report_id in pending:
+        _get_executor().submit(run_report, app, report_id)
+
+    if stuck or pending:
+        logger.warning("Recovered stale reports: failed %s, requeued %s", [r.id for r in stuck], pending)
+    return {'requeued': pending, 'failed': [r.id for r in stuck]}
+
+
+def _write_artifact(app, report, data):
+    directory = get_artifact_dir(app)
+    ext = 'csv' if report.result_format == ReportFormat.CSV.value else 'json'
+    filename = f"report_{report.id}_{report.report_type}.{ext}"
+    final_path = os.path.join(directory, filename)
+    tmp_path = final_path + '.tmp'
+
+    with open(tmp_path, 'w', newline='', encoding='utf-8') as fh:
+        if ext == 'csv':
+            writer = csv.writer(fh)
+            writer.writerow(['section', 'key', 'value'])
+            for row in _flatten(data):
+                writer.writerow(row)
+        else:
+            json.dump(data, fh, default=str)
+
+    # Never expose a half-written file to a download request
+    os.replace(tmp_path, final_path)
+    return filename
+
+
+def _flatten(data, prefix=''):
+    """Flatten nested report dicts/lists into (section, key, value) rows"""
+    if isinstance(data, dict):
+        items = data.items()
+    elif isinstance(data, list):
+        items = enumerate(data)
+    else:
+        yield ('', prefix, data)
+        return
+
+    for key, value in items:
+        path = f"{prefix}.{key}" if prefix else str(key)
+        if isinstance(value, (dict, list)):
+            yield from _flatten(value, path)
+        else:
+            section, _, leaf = path.rpartition('.')
+            yield (section, leaf, value)
@@ -1,5 +1,7 @@
+import time
 from datetime import datetime, timedelta
 from apscheduler.schedulers.background import BackgroundScheduler
+from sqlalchemy import text
 
 from app.models import CommissionSnapshot
 from app.models.client import Client
@@ -9,57 +11,168 @@ from app.extensions import db
 # Initialize scheduler
 scheduler = BackgroundScheduler()
 
+# Application used by jobs that need an app context (set by start_scheduler)
+_app = None
+
+# Only the process holding this PostgreSQL advisory lock runs the jobs, however
+# many hosts start a scheduler
+SCHEDULER_LOCK_ID = 720241019
+LOCK_RETRY_SECONDS = 60
+
+def _app_context():
+    from flask import current_app
+    app = _app or current_app._get_current_object()
+    return app.app_context()
+
 @scheduler.scheduled_job('cron', day='1', hour='0')
 def create_monthly_commission_snapshots():
     """
     Create monthly commission snapshots for all clients on the first day of each month
     """
-    print("Creating monthly commission snapshots...")
+    with _app_context():
+        print("Creating monthly commission snapshots...")
     
-    try:
-        # Get all active clients
-        clients = Client.query.all()
+        try:
+            # Get all active clients
+            clients = Client.query.all()
         
-        for client in clients:
-            try:
-                # Calculate commissions
-                deposit_commission, withdrawal_commission, total_commission = FinanceCalculator().calculate_commission(client.id)
+            for client in clients:
+                try:
+                    # Calculate commissions
+                    deposit_commission, withdrawal_commission, total_commission = FinanceCalculator().calculate_commission(client.id)
                 
-                # Create snapshot for this client
-                now = datetime.utcnow()
-                first_day = now.replace(day=1)
-                last_month = first_day - timedelta(days=1)
-                start_of_month = last_month.replace(day=1)
+                    # Create snapshot for this client
+                    now = datetime.utcnow()
+                    first_day = now.replace(day=1)
+                    last_month = first_day - timedelta(days=1)
+                    start_of_month = last_month.replace(day=1)
                 
-                snapshot = CommissionSnapshot(
-                    client_id=client.id,
-                    period_start=start_of_month,
-                    period_end=last_month,
-                    deposit_commission=float(deposit_commission),
-                    withdrawal_commission=float(withdrawal_commission),
-                    total_commission=float(total_commission)
-                )
-                db.session.add(snapshot)
-                db.session.commit()
-                print(f"Created snapshot for client {client.id}: {total_commission} USDT")
-            except Exception as e:
-                print(f"Error creating snapshot for client {client.id}: {str(e)}")
+                    snapshot = CommissionSnapshot(
+                        client_id=client.id,
+                        period_start=start_of_month,
+                        period_end=last_month,
+                        deposit_commission=float(deposit_commission),
+                        withdrawal_commission=float(withdrawal_commission),
+                        total_commission=float(total_commission)
+                    )
+                    db.session.add(snapshot)
+                    db.session.commit()
+                    print(f"Created snapshot for client {client.id}: {total_commission} USDT")
+                except Exception as e:
+                    print(f"Error creating snapshot for client {client.id}: {str(e)}")
+
+            print("Commission snapshot creation completed.")
+        except Exception as e:
+            print(f"Error in create_monthly_commission_snapshots: {str(e)}")
+
+@scheduler.scheduled_job('cron', hour='1', minute='15')
+def maintain_audit_partitions():
+    """
+    Create upcoming monthly audit partitions and drop the ones past retention
+    """
+    from app.utils.audit_partitions import maintain_partitions
+
+    try:
+        with _app_context():
+            result = maintain_partitions()
+        print(f"Audit partition maintenance completed: {result}")
+    except Exception as e:
+        print(f"Error in maintain_audit_partitions: {str(e)}")
+
+@scheduler.scheduled_job('cron', minute='5')
+def compact_api_usage_logs():
+    """
+    Roll raw API usage rows up into hourly aggregates and prune compacted rows
+    """
+    from app.utils.usage_rollup import compact_usage_logs
+
+    try:
+        with _app_context():
+            result = compact_usage_logs()
+        print(f"API usage compaction completed: {result}")
+    except Exception as e:
+        print(f"Error in compact_api_usage_logs: {str(e)}")
+
+@scheduler.scheduled_job('interval', minutes=10)
+def recover_stale_reports():
+    """
+    Requeue or fail report jobs stranded by a web worker restart
+    """
+    from app.utils.report_jobs import recover_stale_reports as recover
 
-        print("Commission snapshot creation completed.")
+    try:
+        with _app_context():
+            result = recover()
+        print(f"Stale report recovery completed: {result}")
     except Exception as e:
-        print(f"Error in create_monthly_commission_snapshots: {str(e)}")
+        print(f"Error in recover_stale_reports: {str(e)}")
 
 # Start the scheduler
-def start_scheduler():
+def start_scheduler(app=None):
     """
     Start the background scheduler
     """
+    global _app
+    if app is not None:
+        _app = app
     try:
         scheduler.start()
         print("Scheduled tasks started successfully.")
     except Exception as e:
         print(f"Error starting scheduler: {str(e)}")
 
+def _acquire_lock(app):
+    """
+    Take the scheduler lock on a dedicated connection.
+
+    Returns:
+        Connection holding the lock, or None when another process has it
+    """
+    with app.app_context():
+        conn = db.engine.connect()
+    if conn.dialect.name != 'postgresql':
+        return conn  # Single-file development database: nothing to coordinate
+    acquired = conn.execute(text('SELECT pg_try_advisory_lock(:id)'), {'id': SCHEDULER_LOCK_ID}).scalar()
+    conn.commit()  # Session-level lock; don't sit idle in a transaction
+    if not acquired:
+        conn.close()
+        return None
+    return conn
+
+def run_scheduler(app):
+    """
+    Run the scheduled jobs until interrupted.
+
+    Waits until this process holds the scheduler lock, so standby schedulers on
+    other hosts take over when the leader exits. Exits with an error once the
+    lock connection is lost, leaving the restart to the process supervisor.
+    """
+    lock = _acquire_lock(app)
+    while lock is None:
+        time.sleep(LOCK_RETRY_SECONDS)
+        lock = _acquire_lock(app)
+    start_scheduler(app)
+    try:
+        while True:
+            time.sleep(LOCK_RETRY_SECONDS)
+            lock.execute(text('SELECT 1'))
+            lock.commit()
+    finally:
+        scheduler.shutdown(wait=False)
+        lock.close()
+
+def init_app(app):
+    """
+    Register ``flask run-scheduler``.
+
+    Jobs run only in that dedicated process (see deployment/supervisor), never in
+    web workers or other commands that build the app.
+    """
+    @app.cli.command('run-scheduler')
+    def run_scheduler_command():
+        """Run the scheduled jobs (partitions, usage compaction, report recovery, snapshots)."""
+        run_scheduler(app)
+
 # Create initial snapshots for existing clients
 def create_initial_snapshots():
     """
@@ -21,6 +21,8 @@ from functools import wraps
 from typing import Dict, List, Optional, Tuple
 import logging
 
+from app.utils.ip_matcher import ip_blocklist
+
 logger = logging.getLogger(__name__)
 
 # Redis connection for rate limiting (fallback to in-memory if Redis unavailable)
@@ -55,7 +57,8 @@ class RateLimiter:
         # Fall back to IP address
         return f"ip:{request.remote_addr}"
     
-    def is_allowed(self, endpoint: str, limit: int, window: int = 3600) -> Tuple[bool, Dict]:
+    def is_allowed(self, endpoint: str, limit: int, window: int = 3600,
+                   identifier: Optional[str] = None) -> Tuple[bool, Dict]:
         """
         Check if request is allowed under rate limit
         
@@ -63,11 +66,12 @@ class RateLimiter:
             endpoint: API endpoint name
             limit: Max requests allowed
             window: Time window in seconds (default 1 hour)
+            identifier: Subject to count against (default: current user or IP)
             
         Returns:
             (allowed, info_dict)
         """
-        identifier = self._get_client_identifier()
+        identifier = identifier or self._get_client_identifier()
         key = self._get_key(identifier, endpoint)
         current_time = int(time.time())
         window_start = current_time - window
@@ -108,6 +112,41 @@ class RateLimiter:
             logger.warning(f"Rate limit exceeded for {identifier} on {endpoint}: {current_count}/{limit}")
         
         return allowed, info
+    
+    def throttle(self, identifier: str, factor: float, until: float) -> None:
+        """
+        Limit ``identifier`` to ``factor`` of its usual rate limit until ``until``
+        
+        Stored in Redis when available so every worker applies it; the memory
+        fallback only covers this process (usage_anomaly broadcasts it to the others).
+        
+        Args:
+            identifier: Subject to throttle, e.g. ``api_key:12``
+            factor: Fraction of the normal limit still allowed
+            until: Expiry as a Unix timestamp
+        """
+        key = f"throttle:{identifier}"
+        ttl = int(until - time.time())
+        if ttl <= 0:
+            return
+        if self.redis:
+            self.redis.setex(key, ttl, json.dumps([until, factor]))
+        else:
+            _memory_store[key] = (until, factor)
+    
+    def get_throttle(self, identifier: str) -> Optional[Tuple[float, float]]:
+        """Return ``(until, factor)`` of an active throttle on ``identifier``, or None"""
+        key = f"throttle:{identifier}"
+        if self.redis:
+            value = self.redis.get(key)
+            return tuple(json.loads(value)) if value else None
+        entry = _memory_store.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            _memory_store.pop(key, None)
+            return None
+        return entry
 
 # Global rate limiter instance
 rate_limiter = RateLimiter()
@@ -177,6 +216,15 @@ def abuse_protection(endpoint: str, threshold: int, window: int = 3600):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
+            # Static blocklist (CIDR ranges from threat feeds)
+            if ip_blocklist.is_blocked(request.remote_addr):
+                response = jsonify({
+                    'error': 'Access denied',
+                    'message': 'Your IP address is blocked'
+                })
+                response.status_code = 403
+                return response
+            
             identifier = f"ip:{request.remote_addr}"
             key = f"abuse:{identifier}:{endpoint}"
             current_time = int(time.time())
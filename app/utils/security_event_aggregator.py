@@ -0,0 +1,170 @@
+"""
+In-memory aggregation of repetitive security events.
+
+Under attack the same event (rate limit hit, invalid signature, ...) fires
+thousands of times from one source. Instead of one row per event, identical
+events are counted per (event_type, severity, source, actor, window) and a
+single summary ``SecurityEvent`` row is written when the window closes, with
+the count, first/last timestamps and a small sample of details.
+
+Memory is bounded: once ``max_buckets`` distinct keys are open, further
+sources are folded into one overflow bucket per event type (source ``*``).
+Critical events bypass aggregation entirely (see ``log_security_event``).
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+from app.extensions import db
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_SOURCE = '*'
+
+
+class _Bucket:
+    __slots__ = ('first_seen', 'last_seen', 'count', 'sample', 'endpoint', 'method', 'user_agent')
+
+    def __init__(self, now, endpoint, method, user_agent):
+        self.first_seen = now
+        self.last_seen = now
+        self.count = 0
+        self.sample = []
+        self.endpoint = endpoint
+        self.method = method
+        self.user_agent = user_agent
+
+
+class SecurityEventAggregator:
+    """Counts identical security events per window and writes summary rows"""
+
+    def __init__(self, window_seconds=None, max_buckets=None, sample_size=3):
+        self.window_seconds = window_seconds or int(os.getenv('SECURITY_EVENT_WINDOW', '60'))
+        self.max_buckets = max_buckets or int(os.getenv('SECURITY_EVENT_MAX_BUCKETS', '5000'))
+        self.sample_size = sample_size
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._app = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _window_start(self, ts):
+        return int(ts // self.window_seconds) * self.window_seconds
+
+    def record(self, app, event_type, severity, ip_address=None, actor_type=None, actor_id=None,
+               endpoint=None, method=None, user_agent=None, details=None):
+        """
+        Count one event.
+
+        Returns:
+            bool: True if this event opened a new bucket (first in its window)
+        """
+        now = time.time()
+        window = self._window_start(now)
+        key = (event_type, severity, ip_address, actor_type, actor_id, window)
+
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None and len(self._buckets) >= self.max_buckets:
+                key = (event_type, severity, OVERFLOW_SOURCE, None, None, window)
+                bucket = self._buckets.get(key)
+            is_new = bucket is None
+            if is_new:
+                bucket = _Bucket(now, endpoint, method, user_agent)
+                self._buckets[key] = bucket
+            bucket.count += 1
+            bucket.last_seen = now
+            if details is not None and len(bucket.sample) < self.sample_size:
+                bucket.sample.append(details)
+
+        self._ensure_flusher(app)
+        return is_new
+
+    def _pop_closed(self, force=False):
+        current_window = self._window_start(time.time())
+        with self._lock:
+            closed = [k for k in self._buckets if force or k[-1] < current_window]
+            return [(k, self._buckets.pop(k)) for k in closed]
+
+    def flush(self, force=False):
+        """
+        Write summary rows for closed windows (all windows when ``force``).
+
+        Must run inside an application context.
+
+        Returns:
+            int: Number of summary rows written
+        """
+        from app.models.audit import SecurityEvent
+
+        items = self._pop_closed(force=force)
+        if not items:
+            return 0
+
+        rows = []
+        for (event_type, severity, ip_address, actor_type, actor_id, _), bucket in items:
+            first_seen = datetime.utcfromtimestamp(bucket.first_seen)
+            rows.append({
+                'created_at': first_seen,
+                'event_type': event_type,
+                'severity': severity,
+                'actor_type': actor_type,
+                'actor_id': actor_id,
+                'ip_address': ip_address,
+                'user_agent': bucket.user_agent,
+                'endpoint': bucket.endpoint,
+                'method': bucket.method,
+                'details': bucket.sample[0] if bucket.sample else None,
+                'event_count': bucket.count,
+                'first_seen_at': first_seen,
+                'last_seen_at': datetime.utcfromtimestamp(bucket.last_seen),
+                'sample': bucket.sample
+            })
+
+        try:
+            db.session.execute(SecurityEvent.__table__.insert(), rows)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Failed to write {len(rows)} aggregated security events: {e}")
+            return 0
+        return len(rows)
+
+    def _ensure_flusher(self, app):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._app = app
+            self._thread = threading.Thread(target=self._run, name='security-event-flush', daemon=True)
+            self._thread.start()
+            atexit.register(self.shutdown)
+
+    def _run(self):
+        while not self._stop.wait(self.window_seconds / 2):
+            try:
+                with self._app.app_context():
+                    self.flush()
+                    db.session.remove()
+            except Exception:
+                logger.exception("Security event flush failed")
+
+    def shutdown(self):
+        """Stop the flusher and write everything still buffered"""
+        self._stop.set()
+        if self._app is not None:
+            try:
+                with self._app.app_context():
+                    self.flush(force=True)
+            except Exception:
+                logger.exception("Final security event flush failed")
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+security_event_aggregator = SecurityEventAggregator()
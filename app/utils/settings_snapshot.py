@@ -0,0 +1,288 @@
+"""
+Immutable in-memory snapshot of platform and client settings.
+
+Each worker loads the whole ``settings`` table once into a frozen
+``SettingsSnapshot`` and swaps in a new one when the ``settings_version``
+counter moves. The counter is bumped in the same transaction as any change to
+Setting, ClientSetting or ``Client.settings``, and the change is also
+announced on the cache bus, so workers normally reload within milliseconds.
+The version row is re-read at most every ``SETTINGS_VERSION_CHECK_INTERVAL``
+seconds as a fallback.
+
+Per-client settings (ClientSetting rows plus the ``Client.settings`` JSON,
+e.g. webhook URL and secret) are cached per client id next to the snapshot
+and evicted per client through the bus; with the local-only bus transport
+they are dropped whenever the version moves.
+
+Reads are dictionary lookups; values are frozen (lists become tuples, dicts
+become read-only mappings), so callers cannot mutate shared state.
+"""
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+from types import MappingProxyType
+
+from sqlalchemy import event, inspect
+
+from app.extensions import db
+from app.utils.cache_bus import LocalCache, cache_bus
+
+logger = logging.getLogger(__name__)
+
+VERSION_CHECK_INTERVAL = float(os.getenv('SETTINGS_VERSION_CHECK_INTERVAL', '30'))
+CLIENT_CACHE_SIZE = int(os.getenv('CLIENT_SETTINGS_CACHE_SIZE', '10000'))
+
+TRUE_VALUES = ('1', 'true', 'yes', 'on')
+
+# Read-only stand-in for a Setting row, as returned by Setting.get_all_settings
+SettingValue = namedtuple('SettingValue', 'key value setting_type description')
+
+
+def freeze(value):
+    """Recursively make JSON values immutable"""
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+class _TypedAccessors:
+    """Typed getters over ``self.get(key, default)``"""
+
+    def get_str(self, key, default=None):
+        value = self.get(key)
+        return default if value is None else str(value)
+
+    def get_int(self, key, default=None):
+        try:
+            return int(self.get(key))
+        except (TypeError, ValueError):
+            return default
+
+    def get_float(self, key, default=None):
+        try:
+            return float(self.get(key))
+        except (TypeError, ValueError):
+            return default
+
+    def get_decimal(self, key, default=None):
+        value = self.get(key)
+        try:
+            return default if value is None else Decimal(str(value))
+        except InvalidOperation:
+            return default
+
+    def get_bool(self, key, default=False):
+        value = self.get(key)
+        if value is None:
+            return default
+        if isinstance(value, bool):
+            return value
+        return str(value).strip().lower() in TRUE_VALUES
+
+    def get_list(self, key, default=()):
+        value = self.get(key)
+        if value is None:
+            return default
+        if isinstance(value, tuple):
+            return value
+        if isinstance(value, str):
+            return tuple(v.strip() for v in value.split(',') if v.strip())
+        return (value,)
+
+
+class SettingsSnapshot(_TypedAccessors):
+    """Platform settings as of one settings version"""
+
+    __slots__ = ('version', 'loaded_at', '_values', '_entries')
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.loaded_at = time.time()
+        entries = tuple(SettingValue(key, freeze(value), setting_type, description)
+                        for key, value, setting_type, description in rows)
+        self._entries = entries
+        self._values = MappingProxyType({entry.key: entry.value for entry in entries})
+
+    def get(self, key, default=None):
+        value = self._values.get(key)
+        return default if value is None else value
+
+    def __contains__(self, key):
+        return key in self._values
+
+    def as_dict(self):
+        return self._values
+
+    def by_type(self):
+        """Entries grouped by setting_type, like the old Setting.get_all_settings"""
+        grouped = {}
+        for entry in self._entries:
+            grouped.setdefault(entry.setting_type, []).append(entry)
+        return grouped
+
+
+class ClientSettingsSnapshot(_TypedAccessors):
+    """
+    One client's settings: ClientSetting rows (``setting``) and the
+    ``Client.settings`` JSON column (``get``).
+    """
+
+    __slots__ = ('client_id', 'settings', 'public_keys', 'extra')
+
+    def __init__(self, client_id, rows, extra):
+        self.client_id = client_id
+        self.settings = MappingProxyType({key: value for key, value, _ in rows})
+        self.public_keys = frozenset(key for key, _, is_public in rows if is_public)
+        self.extra = freeze(extra or {})
+
+    def get(self, key, default=None):
+        """Value from ``Client.settings`` (webhook_url, webhook_secret, ...)"""
+        value = self.extra.get(key)
+        return default if value is None else value
+
+    def setting(self, key, default=None):
+        """Value of a ClientSetting row, keyed by ClientSettingKey value"""
+        value = self.settings.get(key)
+        return default if value is None else value
+
+
+class SettingsStore:
+    """Holds the current snapshot and the per-client settings cache"""
+
+    def __init__(self, check_interval=VERSION_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._checked_at = None
+        self._stale = False
+        self._lock = threading.Lock()
+        self.clients = LocalCache('client_settings', maxsize=CLIENT_CACHE_SIZE)
+        cache_bus.subscribe('settings', self._on_invalidated)
+
+    def _on_invalidated(self, key, version):
+        self._stale = True
+
+    def snapshot(self):
+        """
+        Current settings snapshot, reloading it if the version changed.
+
+        Returns:
+            SettingsSnapshot
+        """
+        snapshot = self._snapshot
+        if (snapshot is not None and not self._stale
+                and time.monotonic() - self._checked_at < self.check_interval):
+            return snapshot
+        return self.refresh()
+
+    def refresh(self, force=False):
+        """Re-read the version and load a new snapshot if it moved"""
+        from app.models.setting import Setting
+
+        with self._lock:
+            self._stale = False
+            self._checked_at = time.monotonic()
+            version = current_version()
+            if not force and self._snapshot is not None and self._snapshot.version == version:
+                return self._snapshot
+            load_started = LocalCache.version()
+            rows = db.session.query(Setting.key, Setting.value, Setting.setting_type, Setting.description).all()
+            previous = self._snapshot
+            self._snapshot = SettingsSnapshot(version, rows)
+            if previous is not None:
+                # Without a cross-process bus, other workers' client changes only show up here
+                if cache_bus.transport == 'local':
+                    self.clients.evict(None, load_started)
+                logger.info(f"Settings snapshot reloaded (version {previous.version} -> {version})")
+            return self._snapshot
+
+    def client(self, client_id):
+        """
+        Cached settings for one client.
+
+        Returns:
+            ClientSettingsSnapshot
+        """
+        self.snapshot()  # Version check also covers client settings
+        return self.clients.get_or_load(client_id, lambda: self._load_client(client_id))
+
+    @staticmethod
+    def _load_client(client_id):
+        from app.models.client import Client
+        from app.models.client_setting import ClientSetting
+
+        rows = db.session.query(ClientSetting.key, ClientSetting.value, ClientSetting.is_public).filter(
+            ClientSetting.client_id == client_id
+        ).all()
+        extra = db.session.query(Client.settings).filter(Client.id == client_id).scalar()
+        return ClientSettingsSnapshot(
+            client_id, [(key.value, value, is_public) for key, value, is_public in rows], extra
+        )
+
+
+def current_version():
+    """Value of the settings_version counter (0 before the first change)"""
+    from app.models.setting import SettingsVersion
+    return db.session.query(SettingsVersion.version).filter(SettingsVersion.id == 1).scalar() or 0
+
+
+settings_store = SettingsStore()
+
+
+def get_setting(key, default=None):
+    """Shortcut for ``settings_store.snapshot().get``"""
+    return settings_store.snapshot().get(key, default)
+
+
+def client_settings(client_id):
+    """Shortcut for ``settings_store.client``"""
+    return settings_store.client(client_id)
+
+
+# --- version bumps ---
+
+def _bump_version(connection):
+    from app.models.setting import SettingsVersion
+    table = SettingsVersion.__table__
+    result = connection.execute(table.update().where(table.c.id == 1).values(version=table.c.version + 1))
+    if result.rowcount == 0:
+        connection.execute(table.insert().values(id=1, version=1))
+
+
+def _setting_changed(mapper, connection, target):
+    _bump_version(connection)
+    cache_bus.publish_on_commit(inspect(target).session, 'settings')
+
+
+def _client_setting_changed(mapper, connection, target):
+    _bump_version(connection)
+    cache_bus.publish_on_commit(inspect(target).session, 'client_settings', target.client_id)
+
+
+def _client_updated(mapper, connection, target):
+    if inspect(target).attrs.settings.history.has_changes():
+        _bump_version(connection)
+        cache_bus.publish_on_commit(inspect(target).session, 'client_settings', target.id)
+
+
+def _client_deleted(mapper, connection, target):
+    cache_bus.publish_on_commit(inspect(target).session, 'client_settings', target.id)
+
+
+def _register_listeners():
+    from app.models.client import Client
+    from app.models.client_setting import ClientSetting
+    from app.models.setting import Setting
+
+    for name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(Setting, name, _setting_changed)
+        event.listen(ClientSetting, name, _client_setting_changed)
+    event.listen(Client, 'after_update', _client_updated)
+    event.listen(Client, 'after_delete', _client_deleted)
+
+
+_register_listeners()
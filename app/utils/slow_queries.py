@@ -0,0 +1,315 @@
+"""
+Slow query sampler with automatic EXPLAIN capture.
+
+Every statement taking longer than ``SLOW_QUERY_MS`` is reduced to its
+fingerprint (see ``query_stats.fingerprint``) and counted in memory with its
+duration in a LatencySketch. A background thread per worker merges the
+buffered aggregates into ``SlowQuery`` rows every ``SLOW_QUERY_FLUSH_INTERVAL``
+seconds, so the admin page shows count, p95 and max across all workers.
+
+A fraction (``SLOW_QUERY_EXPLAIN_RATE``) of slow SELECTs is re-run on a
+single background thread under ``EXPLAIN (ANALYZE, BUFFERS)`` on PostgreSQL
+(``EXPLAIN QUERY PLAN`` on SQLite), at most once per fingerprint every
+``SLOW_QUERY_EXPLAIN_INTERVAL`` seconds, inside a rolled-back transaction with
+a statement timeout. Statements that write or lock rows are never explained.
+"""
+import atexit
+import hashlib
+import logging
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask import has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+
+from app.extensions import db
+from app.utils.latency_sketch import LatencySketch
+from app.utils.query_stats import current_stats, fingerprint
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', '200'))
+EXPLAIN_RATE = float(os.getenv('SLOW_QUERY_EXPLAIN_RATE', '0.1'))
+EXPLAIN_INTERVAL = float(os.getenv('SLOW_QUERY_EXPLAIN_INTERVAL', '600'))
+EXPLAIN_TIMEOUT_MS = int(os.getenv('SLOW_QUERY_EXPLAIN_TIMEOUT_MS', '10000'))
+EXPLAIN_MAX_PENDING = 4
+FLUSH_INTERVAL = float(os.getenv('SLOW_QUERY_FLUSH_INTERVAL', '30'))
+MAX_BUFFERED = int(os.getenv('SLOW_QUERY_MAX_BUFFERED', '1000'))  # Fingerprints held between flushes
+
+_READ_ONLY = re.compile(r'^\s*(SELECT|WITH)\b', re.IGNORECASE)
+_WRITES = re.compile(r'\b(INSERT|UPDATE|DELETE|MERGE|FOR\s+(NO\s+KEY\s+)?UPDATE|FOR\s+(KEY\s+)?SHARE)\b', re.IGNORECASE)
+
+
+def fingerprint_hash(key):
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def is_explainable(statement):
+    """Whether re-running ``statement`` under EXPLAIN ANALYZE is side-effect free"""
+    return bool(_READ_ONLY.match(statement)) and not _WRITES.search(statement)
+
+
+class _Aggregate:
+    __slots__ = ('fingerprint', 'endpoint', 'count', 'total_ms', 'max_ms', 'sketch',
+                 'first_seen', 'last_seen')
+
+    def __init__(self, key, now):
+        self.fingerprint = key
+        self.endpoint = None
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.sketch = LatencySketch()
+        self.first_seen = now
+        self.last_seen = now
+
+    def add(self, elapsed_ms, endpoint, now):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.sketch.add(elapsed_ms)
+        self.last_seen = now
+        if endpoint:
+            self.endpoint = endpoint
+
+
+class SlowQuerySampler:
+    """Buffers slow statements per fingerprint and samples their plans"""
+
+    def __init__(self, threshold_ms=SLOW_QUERY_MS, explain_rate=EXPLAIN_RATE):
+        self.threshold_ms = threshold_ms
+        self.explain_rate = explain_rate
+        self._pending = {}  # fingerprint hash -> _Aggregate
+        self._plans = {}  # fingerprint hash -> (fingerprint, plan, plan_ms, captured_at)
+        self._explained_at = {}  # fingerprint hash -> monotonic time of the last capture
+        self._explaining = 0
+        self._lock = threading.Lock()
+        self._app = None
+        self._pid = None
+        self._executor = None
+        self._stop = threading.Event()
+        self.dropped = 0
+
+    def init_app(self, app):
+        self._app = app
+        self.threshold_ms = float(app.config.get('SLOW_QUERY_MS', self.threshold_ms))
+        self.explain_rate = float(app.config.get('SLOW_QUERY_EXPLAIN_RATE', self.explain_rate))
+
+    # --- recording ---
+
+    def record(self, conn, statement, parameters, executemany, elapsed_ms):
+        if self._app is None or statement.lstrip()[:7].upper() == 'EXPLAIN':
+            return
+        key = fingerprint(statement)
+        digest = fingerprint_hash(key)
+        now = datetime.utcnow()
+        if has_request_context():
+            endpoint = request.endpoint or request.path
+        else:
+            stats = current_stats()
+            endpoint = stats.name if stats is not None else None
+
+        with self._lock:
+            aggregate = self._pending.get(digest)
+            if aggregate is None:
+                if len(self._pending) >= MAX_BUFFERED:
+                    self.dropped += 1
+                    return
+                aggregate = self._pending[digest] = _Aggregate(key, now)
+            aggregate.add(elapsed_ms, endpoint, now)
+            explain = self._should_explain(digest, statement, executemany)
+            if explain:
+                self._explained_at[digest] = time.monotonic()
+                self._explaining += 1
+        self._ensure_worker()
+        if explain:
+            params = dict(parameters) if isinstance(parameters, dict) else parameters
+            try:
+                self._executor.submit(self._explain, conn.engine, digest, key, statement, params, elapsed_ms)
+            except RuntimeError:  # Interpreter shutting down
+                with self._lock:
+                    self._explaining -= 1
+
+    def _should_explain(self, digest, statement, executemany):
+        if executemany or self._explaining >= EXPLAIN_MAX_PENDING or random.random() >= self.explain_rate:
+            return False
+        last = self._explained_at.get(digest)
+        if last is not None and time.monotonic() - last < EXPLAIN_INTERVAL:
+            return False
+        return is_explainable(statement)
+
+    # --- EXPLAIN capture ---
+
+    def _explain(self, engine, digest, key, statement, parameters, elapsed_ms):
+        try:
+            plan = explain(engine, statement, parameters)
+            if plan:
+                with self._lock:
+                    self._plans[digest] = (key, plan, elapsed_ms, datetime.utcnow())
+        except Exception as e:
+            logger.warning(f"EXPLAIN failed for slow query {digest[:12]}: {e}")
+        finally:
+            with self._lock:
+                self._explaining -= 1
+
+    # --- flushing ---
+
+    def flush(self):
+        """
+        Merge buffered aggregates and captured plans into SlowQuery rows.
+
+        Must run inside an application context.
+
+        Returns:
+            int: Number of fingerprints written
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            plans, self._plans = self._plans, {}
+            if len(self._explained_at) > MAX_BUFFERED:
+                cutoff = time.monotonic() - EXPLAIN_INTERVAL
+                self._explained_at = {k: t for k, t in self._explained_at.items() if t >= cutoff}
+        if not pending and not plans:
+            return 0
+        for attempt in range(2):
+            try:
+                self._merge(pending, plans)
+                db.session.commit()
+                return len(set(pending) | set(plans))
+            except IntegrityError:
+                # Another worker inserted the same fingerprint; its row exists now
+                db.session.rollback()
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Failed to write {len(pending)} slow query aggregates: {e}")
+                return 0
+        return 0
+
+    @staticmethod
+    def _merge(pending, plans):
+        from app.models.slow_query import SlowQuery
+
+        digests = set(pending) | set(plans)
+        rows = {row.fingerprint_hash: row for row in SlowQuery.query.filter(
+            SlowQuery.fingerprint_hash.in_(digests)
+        ).with_for_update()}
+        for digest in digests:
+            aggregate = pending.get(digest)
+            row = rows.get(digest)
+            if row is None:
+                row = SlowQuery(
+                    fingerprint_hash=digest,
+                    fingerprint=aggregate.fingerprint if aggregate else plans[digest][0],
+                    call_count=0, total_ms=0.0, max_ms=0.0,
+                    first_seen_at=aggregate.first_seen if aggregate else datetime.utcnow(),
+                )
+                db.session.add(row)
+            if aggregate is not None:
+                sketch = aggregate.sketch
+                if row.latency_sketch:
+                    sketch = LatencySketch.from_dict(row.latency_sketch).merge(sketch)
+                row.call_count += aggregate.count
+                row.total_ms += aggregate.total_ms
+                row.max_ms = max(row.max_ms, aggregate.max_ms)
+                row.latency_sketch = sketch.to_dict()
+                row.p95_ms = sketch.quantile(0.95)
+                row.last_seen_at = aggregate.last_seen
+                row.endpoint = aggregate.endpoint or row.endpoint
+            if digest in plans:
+                _, row.plan, row.plan_ms, row.plan_captured_at = plans[digest]
+
+    def _ensure_worker(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='slow-query-explain')
+            threading.Thread(target=self._run, name='slow-query-flush', daemon=True).start()
+            atexit.register(self.shutdown)
+
+    def _run(self):
+        while not self._stop.wait(FLUSH_INTERVAL):
+            try:
+                with self._app.app_context():
+                    self.flush()
+                    db.session.remove()
+            except Exception:
+                logger.exception("Slow query flush failed")
+
+    def shutdown(self):
+        """Stop the flusher and write everything still buffered"""
+        self._stop.set()
+        if self._app is not None:
+            try:
+                with self._app.app_context():
+                    self.flush()
+            except Exception:
+                logger.exception("Final slow query flush failed")
+
+    def __len__(self):
+        return len(self._pending)
+
+
+slow_query_sampler = SlowQuerySampler()
+
+
+def explain(engine, statement, parameters=None):
+    """
+    Plan of ``statement`` on ``engine``, executed in a rolled-back transaction.
+
+    PostgreSQL runs ``EXPLAIN (ANALYZE, BUFFERS)``; SQLite ``EXPLAIN QUERY PLAN``.
+
+    Returns:
+        str or None: Plan text, None for other databases
+    """
+    dialect = engine.dialect.name
+    with engine.connect() as conn:
+        try:
+            if dialect == 'postgresql':
+                conn.exec_driver_sql(f'SET LOCAL statement_timeout = {EXPLAIN_TIMEOUT_MS}')
+                rows = conn.exec_driver_sql(f'EXPLAIN (ANALYZE, BUFFERS) {statement}', parameters or ())
+                return '\n'.join(row[0] for row in rows)
+            if dialect == 'sqlite':
+                rows = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters or ())
+                return '\n'.join(str(row[-1]) for row in rows)
+            return None
+        finally:
+            conn.rollback()
+
+
+# --- engine instrumentation ---
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('slow_query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('slow_query_started')
+    if not started:
+        return
+    elapsed_ms = (time.perf_counter() - started.pop()) * 1000
+    if elapsed_ms >= slow_query_sampler.threshold_ms:
+        try:
+            slow_query_sampler.record(conn, statement, parameters, executemany, elapsed_ms)
+        except Exception:
+            logger.exception("Failed to record slow query")
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context):
+    if context.connection is not None:
+        started = context.connection.info.get('slow_query_started')
+        if started:
+            started.pop()
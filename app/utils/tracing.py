@@ -0,0 +1,505 @@
+"""
+Lightweight request tracing.
+
+Each request gets a trace id (continued from an incoming W3C ``traceparent``
+header when present, returned as ``X-Trace-Id``) and a root span. Child spans
+are recorded for:
+
+- SQL statements (engine cursor events)
+- outbound ``requests`` calls (GoPlus, CoinGecko, merchant webhooks); only
+  calls to internal hosts listed in ``TRACE_PROPAGATE_HOSTS`` carry a
+  ``traceparent`` header downstream, so trace ids never leak to third parties
+- named sections wrapped in ``trace_span(name)`` or decorated with ``@traced``
+
+Spans are always collected in memory while the request runs; the finished
+trace is exported when the head sampling decision kept it
+(``TRACE_SAMPLE_RATE``), or regardless of sampling when the request took
+longer than ``TRACE_SLOW_MS`` or failed. Export happens on a background
+thread, either as JSON lines (``TRACE_EXPORTER=jsonl``, ``TRACE_JSONL_PATH``)
+or as OTLP/HTTP JSON to a collector (``TRACE_EXPORTER=otlp``,
+``OTEL_EXPORTER_OTLP_ENDPOINT``). With no exporter configured tracing is off.
+Background jobs can open their own trace with ``start_trace(name)``.
+"""
+import atexit
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+EXPORTER = os.getenv('TRACE_EXPORTER', '').lower()  # jsonl, otlp or empty
+JSONL_PATH = os.getenv('TRACE_JSONL_PATH', 'logs/traces.jsonl')
+OTLP_ENDPOINT = os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT', 'http://localhost:4318').rstrip('/')
+SERVICE_NAME = os.getenv('OTEL_SERVICE_NAME', 'paycrypt')
+SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0.01'))
+SLOW_MS = float(os.getenv('TRACE_SLOW_MS', '1000'))
+MAX_SPANS = int(os.getenv('TRACE_MAX_SPANS', '1000'))  # Per trace
+QUEUE_SIZE = int(os.getenv('TRACE_QUEUE_SIZE', '1000'))  # Traces waiting for export
+BATCH_SIZE = 100
+EXPORT_INTERVAL = 2.0
+MAX_STATEMENT_LENGTH = 1000
+# Hosts that receive traceparent; a leading dot matches any subdomain (".internal")
+PROPAGATE_HOSTS = frozenset(
+    h.strip().lower() for h in os.getenv('TRACE_PROPAGATE_HOSTS', 'localhost,127.0.0.1').split(',') if h.strip()
+)
+
+_TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+_trace = contextvars.ContextVar('trace', default=None)
+_span = contextvars.ContextVar('trace_span', default=None)
+
+# OTLP span kinds
+KIND_INTERNAL, KIND_SERVER, KIND_CLIENT = 1, 2, 3
+
+
+def _new_id(length):
+    return '%0*x' % (length, random.getrandbits(length * 4))
+
+
+class Span:
+    __slots__ = ('name', 'kind', 'span_id', 'parent_id', 'start_ns', 'end_ns', 'attributes', 'error')
+
+    def __init__(self, name, kind, parent_id, attributes=None):
+        self.name = name
+        self.kind = kind
+        self.span_id = _new_id(16)
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes or {}
+        self.error = None
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def finish(self, error=None):
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = str(error)[:500] or type(error).__name__
+
+    @property
+    def duration_ms(self):
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+
+class Trace:
+    """Spans of one request or job"""
+
+    __slots__ = ('trace_id', 'sampled', 'root', 'spans', 'dropped')
+
+    def __init__(self, name, trace_id=None, parent_id=None, sampled=None, kind=KIND_SERVER):
+        self.trace_id = trace_id or _new_id(32)
+        self.sampled = random.random() < SAMPLE_RATE if sampled is None else sampled
+        self.root = Span(name, kind, parent_id)
+        self.spans = [self.root]
+        self.dropped = 0
+
+    def start_span(self, name, kind=KIND_INTERNAL, attributes=None, parent=None):
+        """Child span of ``parent`` (default the current span), or None once MAX_SPANS is reached"""
+        if len(self.spans) >= MAX_SPANS:
+            self.dropped += 1
+            return None
+        parent = parent or _span.get() or self.root
+        span = Span(name, kind, parent.span_id, attributes)
+        self.spans.append(span)
+        return span
+
+    @property
+    def error(self):
+        return any(span.error for span in self.spans)
+
+    def should_export(self):
+        """Head-sampled, slow or failed"""
+        return self.sampled or self.error or self.root.duration_ms >= SLOW_MS
+
+    def traceparent(self, span=None):
+        span = span or _span.get() or self.root
+        return f'00-{self.trace_id}-{span.span_id}-{"01" if self.sampled else "00"}'
+
+
+def current_trace():
+    return _trace.get()
+
+
+def current_trace_id():
+    trace = _trace.get()
+    return trace.trace_id if trace is not None else None
+
+
+def parse_traceparent(header):
+    """
+    Parse a W3C traceparent header.
+
+    Returns:
+        tuple: (trace_id, parent_span_id, sampled), or None when absent or malformed
+    """
+    match = _TRACEPARENT.match((header or '').strip().lower())
+    if not match or match.group(1) == '0' * 32:
+        return None
+    return match.group(1), match.group(2), bool(int(match.group(3), 16) & 1)
+
+
+# --- named sections ---
+
+@contextmanager
+def trace_span(name, kind=KIND_INTERNAL, **attributes):
+    """
+    Record the block as a span of the current trace (no-op outside one).
+
+    Yields:
+        Span or None
+    """
+    trace = _trace.get()
+    span = trace.start_span(name, kind, attributes) if trace is not None else None
+    if span is None:
+        yield None
+        return
+    token = _span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.finish(e)
+        raise
+    else:
+        span.finish()
+    finally:
+        _span.reset(token)
+
+
+def traced(name=None):
+    """Decorator recording each call as a span named ``name`` (default module.function)"""
+    def decorator(fn):
+        span_name = name or f'{fn.__module__}.{fn.__qualname__}'
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _trace.get() is None:
+                return fn(*args, **kwargs)
+            with trace_span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _begin(name, traceparent=None, kind=KIND_SERVER):
+    parent = parse_traceparent(traceparent)
+    if parent is not None:
+        trace_id, parent_id, sampled = parent
+        trace = Trace(name, trace_id, parent_id, sampled or None, kind)
+    else:
+        trace = Trace(name, kind=kind)
+    return trace, _trace.set(trace), _span.set(trace.root)
+
+
+def _end(trace, tokens, error=None):
+    _span.reset(tokens[1])
+    _trace.reset(tokens[0])
+    if trace.root.end_ns is None:
+        trace.root.finish(error)
+    if trace.should_export():
+        exporter.submit(trace)
+
+
+@contextmanager
+def start_trace(name, traceparent=None):
+    """
+    Trace a background job or script section as its own trace.
+
+    Yields:
+        Trace or None when tracing is disabled
+    """
+    if not exporter.enabled:
+        yield None
+        return
+    trace, *tokens = _begin(name, traceparent, KIND_INTERNAL)
+    try:
+        yield trace
+    except BaseException as e:
+        _end(trace, tokens, e)
+        raise
+    _end(trace, tokens)
+
+
+# --- SQL spans ---
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    trace = _trace.get()
+    if trace is None:
+        return
+    span = trace.start_span('sql', attributes={
+        'db.system': conn.dialect.name,
+        'db.statement': statement[:MAX_STATEMENT_LENGTH],
+    })
+    conn.info.setdefault('trace_spans', []).append(span)
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _trace.get() is None:
+        return
+    spans = conn.info.get('trace_spans')
+    span = spans.pop() if spans else None
+    if span is not None:
+        span.finish()
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context):
+    if _trace.get() is None or context.connection is None:
+        return
+    spans = context.connection.info.get('trace_spans')
+    span = spans.pop() if spans else None
+    if span is not None:
+        span.finish(context.original_exception)
+
+
+# --- outbound HTTP spans ---
+
+def _propagates_to(hostname):
+    hostname = (hostname or '').lower()
+    if hostname in PROPAGATE_HOSTS:
+        return True
+    return any(h.startswith('.') and hostname.endswith(h) for h in PROPAGATE_HOSTS)
+
+
+def instrument_requests():
+    """Wrap ``requests.Session.send`` so outbound calls become client spans"""
+    try:
+        import requests
+    except ImportError:
+        return
+    send = requests.Session.send
+    if getattr(send, '_traced', False):
+        return
+
+    @functools.wraps(send)
+    def traced_send(self, prepared, **kwargs):
+        trace = _trace.get()
+        span = trace.start_span(f'HTTP {prepared.method}', KIND_CLIENT) if trace is not None else None
+        if span is None:
+            return send(self, prepared, **kwargs)
+        # Query strings may carry API keys; keep scheme, host and path only
+        url = urlsplit(prepared.url)
+        span.set('http.method', prepared.method)
+        span.set('http.url', f'{url.scheme}://{url.netloc}{url.path}')
+        span.set('net.peer.name', url.hostname)
+        if _propagates_to(url.hostname):
+            prepared.headers['traceparent'] = trace.traceparent(span)
+        try:
+            response = send(self, prepared, **kwargs)
+        except Exception as e:
+            span.finish(e)
+            raise
+        span.set('http.status_code', response.status_code)
+        span.finish(f'HTTP {response.status_code}' if response.status_code >= 500 else None)
+        return response
+
+    traced_send._traced = True
+    requests.Session.send = traced_send
+
+
+# --- export ---
+
+def _span_dict(trace, span):
+    data = {
+        'trace_id': trace.trace_id,
+        'span_id': span.span_id,
+        'parent_id': span.parent_id,
+        'name': span.name,
+        'kind': span.kind,
+        'start_ns': span.start_ns,
+        'duration_ms': round(span.duration_ms, 3),
+        'attributes': span.attributes,
+    }
+    if span.error:
+        data['error'] = span.error
+    return data
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def _otlp_span(trace, span):
+    data = {
+        'traceId': trace.trace_id,
+        'spanId': span.span_id,
+        'name': span.name,
+        'kind': span.kind,
+        'startTimeUnixNano': str(span.start_ns),
+        'endTimeUnixNano': str(span.end_ns or span.start_ns),
+        'attributes': [{'key': k, 'value': _otlp_value(v)} for k, v in span.attributes.items()],
+        'status': {'code': 2, 'message': span.error} if span.error else {'code': 0},
+    }
+    if span.parent_id:
+        data['parentSpanId'] = span.parent_id
+    return data
+
+
+class SpanExporter:
+    """Bounded queue of finished traces drained by a background thread"""
+
+    def __init__(self, kind=EXPORTER):
+        self.kind = kind if kind in ('jsonl', 'otlp') else None
+        self.jsonl_path = JSONL_PATH
+        self.otlp_url = f'{OTLP_ENDPOINT}/v1/traces'
+        self._queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self._pid = None
+        self._lock = threading.Lock()
+        self._session = None
+        self.stats = {'exported_traces': 0, 'exported_spans': 0, 'dropped_traces': 0, 'errors': 0}
+
+    @property
+    def enabled(self):
+        return self.kind is not None
+
+    def configure(self, kind=None, jsonl_path=None, otlp_endpoint=None):
+        if kind is not None:
+            self.kind = kind if kind in ('jsonl', 'otlp') else None
+        if jsonl_path:
+            self.jsonl_path = jsonl_path
+        if otlp_endpoint:
+            self.otlp_url = f"{otlp_endpoint.rstrip('/')}/v1/traces"
+
+    def submit(self, trace):
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.stats['dropped_traces'] += 1
+
+    def _ensure_thread(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name='trace-exporter', daemon=True).start()
+            atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + EXPORT_INTERVAL
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            self._export(batch)
+
+    def flush(self):
+        """Export whatever is queued (called at exit)"""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self._export(batch)
+
+    def _export(self, traces):
+        try:
+            if self.kind == 'jsonl':
+                self._write_jsonl(traces)
+            elif self.kind == 'otlp':
+                self._post_otlp(traces)
+            else:
+                return
+            self.stats['exported_traces'] += len(traces)
+            self.stats['exported_spans'] += sum(len(trace.spans) for trace in traces)
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.error(f"Failed to export {len(traces)} traces ({self.kind}): {e}")
+
+    def _write_jsonl(self, traces):
+        directory = os.path.dirname(self.jsonl_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.jsonl_path, 'a', encoding='utf-8') as f:
+            for trace in traces:
+                for span in trace.spans:
+                    f.write(json.dumps(_span_dict(trace, span), default=str) + '\n')
+
+    def _post_otlp(self, traces):
+        import requests
+        if self._session is None:
+            self._session = requests.Session()
+        payload = {'resourceSpans': [{
+            'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': SERVICE_NAME}}]},
+            'scopeSpans': [{
+                'scope': {'name': __name__},
+                'spans': [_otlp_span(trace, span) for trace in traces for span in trace.spans],
+            }],
+        }]}
+        response = self._session.post(self.otlp_url, data=json.dumps(payload, default=str),
+                                      headers={'Content-Type': 'application/json'}, timeout=5)
+        response.raise_for_status()
+
+
+exporter = SpanExporter()
+
+
+# --- request hooks ---
+
+def _start_request():
+    name = f'{request.method} {request.url_rule.rule}' if request.url_rule else f'{request.method} {request.path}'
+    g._trace = _begin(name, request.headers.get('traceparent'))
+
+
+def _after_request(response):
+    state = g.get('_trace')
+    if state is not None:
+        trace = state[0]
+        trace.root.set('http.status_code', response.status_code)
+        if response.status_code >= 500:
+            trace.root.error = f'HTTP {response.status_code}'
+        response.headers['X-Trace-Id'] = trace.trace_id
+    return response
+
+
+def _teardown_request(error=None):
+    state = g.pop('_trace', None)
+    if state is None:
+        return
+    trace, *tokens = state
+    trace.root.set('http.method', request.method)
+    if request.url_rule is not None:
+        trace.root.set('http.route', request.url_rule.rule)
+        trace.root.set('endpoint', request.endpoint)
+    _end(trace, tokens, error)
+
+
+def init_app(app):
+    """Trace requests when an exporter is configured (TRACE_EXPORTER)"""
+    exporter.configure(app.config.get('TRACE_EXPORTER'), app.config.get('TRACE_JSONL_PATH'),
+                       app.config.get('OTEL_EXPORTER_OTLP_ENDPOINT'))
+    if not exporter.enabled:
+        return
+    instrument_requests()
+    app.before_request(_start_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    logger.info(f"Request tracing enabled ({exporter.kind}, sample rate {SAMPLE_RATE})")
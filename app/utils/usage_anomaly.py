@@ -0,0 +1,341 @@
+"""
+Streaming anomaly detection over API key usage.
+
+Every authenticated API request updates a fixed-size state per key:
+exponentially decayed request counts over a short (``TAU_SHORT``) and a long
+(``TAU_LONG``) horizon, the same for errors, and per endpoint group. The
+short/long ratio of the decayed rates is a burst detector. A key calling
+``/withdrawals`` at 50x its usual rate shows a ratio far above
+``RATE_RATIO_THRESHOLD`` within a minute, while steady traffic stays near 1.
+Each update touches a constant number of fields, so the per-request cost is
+O(1).
+
+Flagged keys are throttled to a fraction of their rate limit for
+``THROTTLE_SECONDS`` through the rate limiter's shared store (Redis), or, on
+the in-memory fallback, announced on the cache bus so every worker applies
+it; a security event is logged. State is checkpointed to
+``api_key_usage_baselines`` so restarts keep their baselines.
+"""
+import atexit
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from app.extensions import db
+from app.utils.cache_bus import cache_bus
+from app.utils.security import rate_limiter
+
+logger = logging.getLogger(__name__)
+
+TAU_SHORT = float(os.getenv('USAGE_ANOMALY_TAU_SHORT', '60'))
+TAU_LONG = float(os.getenv('USAGE_ANOMALY_TAU_LONG', '3600'))
+WARMUP_SECONDS = float(os.getenv('USAGE_ANOMALY_WARMUP', str(TAU_LONG)))
+RATE_RATIO_THRESHOLD = float(os.getenv('USAGE_ANOMALY_RATE_RATIO', '10'))
+MIN_EVENTS = float(os.getenv('USAGE_ANOMALY_MIN_EVENTS', '20'))
+MIN_BASELINE_RATE = 1 / 600.0  # requests/second floor for quiet keys
+ERROR_RATIO_THRESHOLD = 0.5
+THROTTLE_SECONDS = int(os.getenv('USAGE_ANOMALY_THROTTLE_SECONDS', '900'))
+THROTTLE_FACTOR = float(os.getenv('USAGE_ANOMALY_THROTTLE_FACTOR', '0.1'))
+CHECKPOINT_INTERVAL = int(os.getenv('USAGE_ANOMALY_CHECKPOINT_INTERVAL', '300'))
+MAX_KEYS = int(os.getenv('USAGE_ANOMALY_MAX_KEYS', '100000'))
+THROTTLE_NAMESPACE = 'api_key_throttle'
+
+ENDPOINT_GROUPS = ('payments', 'withdrawals', 'export', 'balance', 'status', 'other')
+_GROUP_INDEX = {name: i for i, name in enumerate(ENDPOINT_GROUPS)}
+
+
+def endpoint_group(path):
+    """Map a request path to an index into ``ENDPOINT_GROUPS``"""
+    if '/export' in path:
+        return _GROUP_INDEX['export']
+    parts = path.strip('/').split('/')
+    segment = parts[2] if len(parts) > 2 and parts[0] == 'api' else (parts[0] if parts else '')
+    if segment == 'payment_sessions':
+        segment = 'payments'
+    return _GROUP_INDEX.get(segment, _GROUP_INDEX['other'])
+
+
+class KeyUsageState:
+    """Decayed usage counters for one API key"""
+
+    __slots__ = ('first_seen', 'last_seen', 'short_total', 'long_total', 'short_errors',
+                 'long_errors', 'short_groups', 'long_groups', 'dirty')
+
+    def __init__(self, now):
+        self.first_seen = now
+        self.last_seen = now
+        self.short_total = 0.0
+        self.long_total = 0.0
+        self.short_errors = 0.0
+        self.long_errors = 0.0
+        self.short_groups = [0.0] * len(ENDPOINT_GROUPS)
+        self.long_groups = [0.0] * len(ENDPOINT_GROUPS)
+        self.dirty = True
+
+    def update(self, now, group, is_error):
+        elapsed = max(0.0, now - self.last_seen)
+        short_decay = math.exp(-elapsed / TAU_SHORT)
+        long_decay = math.exp(-elapsed / TAU_LONG)
+        self.short_total = self.short_total * short_decay + 1
+        self.long_total = self.long_total * long_decay + 1
+        self.short_errors = self.short_errors * short_decay + is_error
+        self.long_errors = self.long_errors * long_decay + is_error
+        short_groups, long_groups = self.short_groups, self.long_groups
+        for i in range(len(short_groups)):
+            short_groups[i] *= short_decay
+            long_groups[i] *= long_decay
+        short_groups[group] += 1
+        long_groups[group] += 1
+        self.last_seen = now
+        self.dirty = True
+
+    def to_dict(self):
+        return {
+            'first_seen': self.first_seen, 'last_seen': self.last_seen,
+            'short_total': self.short_total, 'long_total': self.long_total,
+            'short_errors': self.short_errors, 'long_errors': self.long_errors,
+            'short_groups': self.short_groups, 'long_groups': self.long_groups,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        state = cls(data['first_seen'])
+        for field in ('last_seen', 'short_total', 'long_total', 'short_errors', 'long_errors'):
+            setattr(state, field, float(data.get(field) or 0))
+        for field in ('short_groups', 'long_groups'):
+            values = list(data.get(field) or [])[:len(ENDPOINT_GROUPS)]
+            setattr(state, field, values + [0.0] * (len(ENDPOINT_GROUPS) - len(values)))
+        state.dirty = False
+        return state
+
+
+def throttle_identifier(api_key_id):
+    """Rate limiter identifier of an API key (shared with the throttle check in api_v1)"""
+    return f'api_key:{api_key_id}'
+
+
+def _burst_ratio(short_count, long_count):
+    return (short_count / TAU_SHORT) / max(long_count / TAU_LONG, MIN_BASELINE_RATE)
+
+
+class UsageAnomalyDetector:
+    """Per-key streaming state, anomaly checks and throttles"""
+
+    def __init__(self, max_keys=MAX_KEYS):
+        self.max_keys = max_keys
+        self._states = OrderedDict()
+        self._reasons = OrderedDict()  # key id -> (until, anomalies) flagged by this worker
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._app = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def _check(self, state, now, group):
+        """Return a list of anomaly dicts for the state just updated"""
+        if now - state.first_seen < WARMUP_SECONDS:
+            return []
+        anomalies = []
+        if state.short_groups[group] >= MIN_EVENTS:
+            ratio = _burst_ratio(state.short_groups[group], state.long_groups[group])
+            if ratio >= RATE_RATIO_THRESHOLD:
+                anomalies.append({'type': 'endpoint_rate', 'endpoint_group': ENDPOINT_GROUPS[group],
+                                  'ratio': round(ratio, 1)})
+        if state.short_total >= MIN_EVENTS:
+            ratio = _burst_ratio(state.short_total, state.long_total)
+            if ratio >= RATE_RATIO_THRESHOLD and not anomalies:
+                anomalies.append({'type': 'request_rate', 'ratio': round(ratio, 1)})
+            short_error_ratio = state.short_errors / state.short_total
+            long_error_ratio = state.long_errors / state.long_total
+            if short_error_ratio >= ERROR_RATIO_THRESHOLD and short_error_ratio > 3 * long_error_ratio + 0.05:
+                anomalies.append({'type': 'error_ratio', 'error_ratio': round(short_error_ratio, 2),
+                                  'baseline_error_ratio': round(long_error_ratio, 2)})
+        return anomalies
+
+    def observe(self, api_key_id, path, status_code, now=None):
+        """
+        Feed one request into the key's state.
+
+        Returns:
+            list: Anomalies newly detected for this key (empty in the common case)
+        """
+        now = now or time.time()
+        self._ensure_loaded()
+        group = endpoint_group(path or '')
+        is_error = 1 if status_code is not None and status_code >= 400 else 0
+
+        with self._lock:
+            state = self._states.get(api_key_id)
+            if state is None:
+                state = self._states[api_key_id] = KeyUsageState(now)
+                if len(self._states) > self.max_keys:
+                    self._states.popitem(last=False)
+            else:
+                self._states.move_to_end(api_key_id)
+            state.update(now, group, is_error)
+            anomalies = self._check(state, now, group)
+        if not anomalies:
+            return []
+        if rate_limiter.get_throttle(throttle_identifier(api_key_id)):
+            return []  # Already throttled (possibly by another worker); don't re-alert
+
+        until = now + THROTTLE_SECONDS
+        with self._lock:
+            self._reasons[api_key_id] = (until, anomalies)
+            while self._reasons and next(iter(self._reasons.values()))[0] <= now:
+                self._reasons.popitem(last=False)
+        self._throttle(api_key_id, until)
+        self._report(api_key_id, path, anomalies)
+        return anomalies
+
+    def _throttle(self, api_key_id, until):
+        rate_limiter.throttle(throttle_identifier(api_key_id), THROTTLE_FACTOR, until)
+        if rate_limiter.redis is None:
+            cache_bus.publish(THROTTLE_NAMESPACE, f'{api_key_id}:{until}:{THROTTLE_FACTOR}')
+
+    @staticmethod
+    def _on_throttle(key, version):
+        """Apply a throttle announced by another worker to this one's rate limiter"""
+        if key is None:
+            return
+        api_key_id, until, factor = key.split(':')
+        rate_limiter.throttle(throttle_identifier(int(api_key_id)), float(factor), float(until))
+
+    def _report(self, api_key_id, path, anomalies):
+        from app.utils.audit import log_security_event
+        logger.warning(f"API usage anomaly for key {api_key_id}: {anomalies}")
+        try:
+            log_security_event(
+                event_type='api_usage_anomaly',
+                details={'api_key_id': api_key_id, 'path': path, 'anomalies': anomalies,
+                         'throttle_seconds': THROTTLE_SECONDS, 'throttle_factor': THROTTLE_FACTOR},
+                user_id=api_key_id,
+                severity='high',
+                actor_type='api_key'
+            )
+        except Exception as e:
+            logger.error(f"Failed to log API usage anomaly: {e}")
+
+    def throttle_factor(self, api_key_id):
+        """Fraction of its rate limit a flagged key may use, or None when not throttled"""
+        entry = rate_limiter.get_throttle(throttle_identifier(api_key_id))
+        return entry[1] if entry else None
+
+    def snapshot(self, api_key_id, now=None):
+        """Current rates and throttle status for one key (for analysis views)"""
+        now = now or time.time()
+        state = self._states.get(api_key_id)
+        throttle = rate_limiter.get_throttle(throttle_identifier(api_key_id))
+        result = {'api_key_id': api_key_id, 'tracked': state is not None,
+                  'throttled_until': None, 'throttle_reason': None}
+        if throttle:
+            result['throttled_until'] = datetime.utcfromtimestamp(throttle[0]).isoformat()
+            reason = self._reasons.get(api_key_id)
+            result['throttle_reason'] = reason[1] if reason and reason[0] > now else None
+        if state is not None:
+            result['short_rate_per_min'] = round(state.short_total / TAU_SHORT * 60, 2)
+            result['baseline_rate_per_min'] = round(state.long_total / TAU_LONG * 60, 2)
+            result['endpoint_mix'] = {name: round(state.long_groups[i] / max(state.long_total, 1e-9), 3)
+                                      for i, name in enumerate(ENDPOINT_GROUPS)}
+        return result
+
+    # --- checkpointing ---
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+        try:
+            from flask import current_app
+            self._app = current_app._get_current_object()
+            self.load()
+        except Exception as e:
+            logger.error(f"Failed to load API usage baselines: {e}")
+        self._start_checkpointer()
+
+    def load(self):
+        """Seed state from the last checkpoint (keys already tracked are kept)"""
+        from app.models.api_usage import ApiKeyUsageBaseline
+        rows = db.session.query(ApiKeyUsageBaseline.api_key_id, ApiKeyUsageBaseline.state).all()
+        with self._lock:
+            for api_key_id, data in rows:
+                if api_key_id not in self._states and data:
+                    self._states[api_key_id] = KeyUsageState.from_dict(data)
+        return len(rows)
+
+    def checkpoint(self):
+        """
+        Persist states changed since the last checkpoint.
+
+        Returns:
+            int: Number of keys written
+        """
+        from app.models.api_usage import ApiKeyUsageBaseline
+
+        with self._lock:
+            dirty = {key_id: state.to_dict() for key_id, state in self._states.items() if state.dirty}
+            for key_id in dirty:
+                self._states[key_id].dirty = False
+        if not dirty:
+            return 0
+
+        now = datetime.utcnow()
+        try:
+            existing = {key_id for (key_id,) in db.session.query(ApiKeyUsageBaseline.api_key_id).filter(
+                ApiKeyUsageBaseline.api_key_id.in_(list(dirty)))}
+            updates = [{'api_key_id': k, 'state': v, 'updated_at': now} for k, v in dirty.items() if k in existing]
+            inserts = [{'api_key_id': k, 'state': v, 'updated_at': now} for k, v in dirty.items() if k not in existing]
+            if updates:
+                db.session.execute(db.update(ApiKeyUsageBaseline), updates)
+            if inserts:
+                db.session.execute(db.insert(ApiKeyUsageBaseline), inserts)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            with self._lock:
+                for key_id in dirty:
+                    if key_id in self._states:
+                        self._states[key_id].dirty = True
+            logger.error(f"API usage baseline checkpoint failed: {e}")
+            return 0
+        return len(dirty)
+
+    def _start_checkpointer(self):
+        if self._thread is not None or self._app is None:
+            return
+        self._thread = threading.Thread(target=self._run, name='usage-anomaly-checkpoint', daemon=True)
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    def _run(self):
+        while not self._stop.wait(CHECKPOINT_INTERVAL):
+            try:
+                with self._app.app_context():
+                    self.checkpoint()
+                    db.session.remove()
+            except Exception:
+                logger.exception("API usage baseline checkpoint failed")
+
+    def shutdown(self):
+        """Stop the checkpoint thread and write a final checkpoint"""
+        self._stop.set()
+        if self._app is not None:
+            try:
+                with self._app.app_context():
+                    self.checkpoint()
+            except Exception:
+                logger.exception("Final API usage baseline checkpoint failed")
+
+    def __len__(self):
+        return len(self._states)
+
+
+usage_anomaly_detector = UsageAnomalyDetector()
+cache_bus.subscribe(THROTTLE_NAMESPACE, usage_anomaly_detector._on_throttle)
@@ -0,0 +1,299 @@
+"""
+Hourly compaction of raw API usage logs.
+
+Raw rows from ``api_key_usage_logs``, ``api_usage`` and ``api_usage_events``
+are folded into ``ApiUsageHourly`` rows per (hour, client, key, endpoint,
+method) with request/error counts, bytes and a mergeable latency sketch.
+Sources are walked one hour of timestamps at a time. Progress is tracked per
+source as ``UsageRollupState.compacted_until``, committed together with the
+rollups, so a crashed run never double counts. Rows are stamped before their
+transaction commits, so nothing newer than ``USAGE_ROLLUP_LAG_MINUTES`` is
+compacted. The state row is locked while an hour is folded in, so concurrent
+runs never add the same hour twice. Compacted raw rows (stamped before
+``compacted_until``) are then deleted in small chunks to keep locks short.
+"""
+import hashlib
+import logging
+import os
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, text
+
+from app.extensions import db
+from app.models.api_key import ApiKeyUsageLog, ClientApiKey
+from app.models.api_usage import ApiUsage, ApiUsageHourly, UsageRollupState
+from app.models.audit import ApiUsageEvent
+from app.utils.latency_sketch import LatencySketch
+
+logger = logging.getLogger(__name__)
+
+RAW_RETENTION_HOURS = int(os.getenv('USAGE_RAW_RETENTION_HOURS', '2'))
+ROLLUP_LAG_MINUTES = int(os.getenv('USAGE_ROLLUP_LAG_MINUTES', '5'))  # Longest expected write transaction
+DELETE_CHUNK_SIZE = int(os.getenv('USAGE_DELETE_CHUNK_SIZE', '5000'))
+
+RawRow = namedtuple('RawRow', 'timestamp client_id api_key_id api_key_hash endpoint method '
+                              'status_code latency_ms bytes_in bytes_out')
+
+RollupKey = namedtuple('RollupKey', 'bucket_start client_id api_key_id api_key_hash endpoint method')
+
+
+def _hash_key(api_key):
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16] if api_key else None
+
+
+def _hour(dt):
+    return dt.replace(minute=0, second=0, microsecond=0)
+
+
+def _api_key_log_rows(start, end):
+    query = db.session.query(
+        ApiKeyUsageLog.created_at, ClientApiKey.client_id, ApiKeyUsageLog.api_key_id,
+        ApiKeyUsageLog.endpoint, ApiKeyUsageLog.method, ApiKeyUsageLog.status_code,
+        ApiKeyUsageLog.response_time_ms
+    ).outerjoin(ClientApiKey, ClientApiKey.id == ApiKeyUsageLog.api_key_id).filter(
+        ApiKeyUsageLog.created_at >= start, ApiKeyUsageLog.created_at < end
+    )
+    for ts, client_id, key_id, endpoint, method, status, latency in query.yield_per(5000):
+        yield RawRow(ts, client_id, key_id, None, endpoint, method, status, latency, 0, 0)
+
+
+def _api_usage_rows(start, end):
+    query = db.session.query(
+        ApiUsage.timestamp, ApiUsage.client_id, ApiUsage.api_key, ApiUsage.endpoint,
+        ApiUsage.method, ApiUsage.status_code, ApiUsage.response_time,
+        ApiUsage.request_size, ApiUsage.response_size
+    ).filter(ApiUsage.timestamp >= start, ApiUsage.timestamp < end)
+    for ts, client_id, api_key, endpoint, method, status, latency, size_in, size_out in query.yield_per(5000):
+        yield RawRow(ts, client_id, None, _hash_key(api_key), endpoint, method, status, latency,
+                     size_in or 0, size_out or 0)
+
+
+def _api_usage_event_rows(start, end):
+    query = db.session.query(
+        ApiUsageEvent.created_at, ApiUsageEvent.api_key_hash, ApiUsageEvent.endpoint,
+        ApiUsageEvent.method, ApiUsageEvent.status_code, ApiUsageEvent.response_time_ms
+    ).filter(ApiUsageEvent.created_at >= start, ApiUsageEvent.created_at < end)
+    for ts, key_hash, endpoint, method, status, latency in query.yield_per(5000):
+        yield RawRow(ts, None, None, key_hash, endpoint, method, status, latency, 0, 0)
+
+
+# source name -> (model, timestamp column, row reader)
+SOURCES = {
+    ApiKeyUsageLog.__tablename__: (ApiKeyUsageLog, ApiKeyUsageLog.created_at, _api_key_log_rows),
+    ApiUsage.__tablename__: (ApiUsage, ApiUsage.timestamp, _api_usage_rows),
+    ApiUsageEvent.__tablename__: (ApiUsageEvent, ApiUsageEvent.created_at, _api_usage_event_rows),
+}
+
+
+class _Aggregate:
+    __slots__ = ('request_count', 'error_count', 'throttled_count', 'bytes_in', 'bytes_out', 'sketch')
+
+    def __init__(self):
+        self.request_count = 0
+        self.error_count = 0
+        self.throttled_count = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.sketch = LatencySketch()
+
+    def add(self, row):
+        self.request_count += 1
+        if row.status_code is not None and row.status_code >= 400:
+            self.error_count += 1
+        if row.status_code == 429:
+            self.throttled_count += 1
+        self.bytes_in += row.bytes_in
+        self.bytes_out += row.bytes_out
+        self.sketch.add(row.latency_ms)
+
+
+def _aggregate(rows):
+    aggregates = {}
+    for row in rows:
+        if row.timestamp is None:
+            continue
+        key = RollupKey(
+            _hour(row.timestamp),
+            row.client_id, row.api_key_id, row.api_key_hash,
+            (row.endpoint or '')[:255], (row.method or '')[:10]
+        )
+        aggregate = aggregates.get(key)
+        if aggregate is None:
+            aggregate = aggregates[key] = _Aggregate()
+        aggregate.add(row)
+    return aggregates
+
+
+def _merge_into_rollups(source, aggregates):
+    """Add batch aggregates to existing hourly rows, creating missing ones"""
+    hours = {key.bucket_start for key in aggregates}
+    existing = {}
+    for rollup in ApiUsageHourly.query.filter(
+        ApiUsageHourly.source == source,
+        ApiUsageHourly.bucket_start.in_(hours)
+    ):
+        existing[RollupKey(rollup.bucket_start, rollup.client_id, rollup.api_key_id,
+                           rollup.api_key_hash, rollup.endpoint, rollup.method)] = rollup
+
+    for key, aggregate in aggregates.items():
+        rollup = existing.get(key)
+        if rollup is None:
+            rollup = ApiUsageHourly(source=source, request_count=0, error_count=0,
+                                    throttled_count=0, bytes_in=0, bytes_out=0, **key._asdict())
+            db.session.add(rollup)
+            sketch = aggregate.sketch
+        else:
+            sketch = LatencySketch.from_dict(rollup.latency_sketch).merge(aggregate.sketch)
+
+        rollup.request_count += aggregate.request_count
+        rollup.error_count += aggregate.error_count
+        rollup.throttled_count += aggregate.throttled_count
+        rollup.bytes_in += aggregate.bytes_in
+        rollup.bytes_out += aggregate.bytes_out
+        rollup.latency_sketch = sketch.to_dict()
+        rollup.p50_ms = sketch.quantile(0.5)
+        rollup.p95_ms = sketch.quantile(0.95)
+
+
+def _delete_compacted(model, time_col, until, chunk_size=DELETE_CHUNK_SIZE):
+    """Delete raw rows stamped before ``until`` in short transactions"""
+    table = model.__tablename__
+    total = 0
+    while True:
+        deleted = db.session.execute(text(
+            f"DELETE FROM {table} WHERE id IN "
+            f"(SELECT id FROM {table} WHERE {time_col.name} < :until LIMIT :chunk)"
+        ), {'until': until, 'chunk': chunk_size}).rowcount or 0
+        db.session.commit()
+        total += deleted
+        if deleted < chunk_size:
+            return total
+
+
+def _locked_state(source):
+    """Load (or create) the source's rollup state with a row lock held until commit"""
+    state = db.session.get(UsageRollupState, source, with_for_update=True, populate_existing=True)
+    if state is None:
+        state = UsageRollupState(source=source)
+        db.session.add(state)
+        db.session.flush()
+    return state
+
+
+def compact_source(source, cutoff, delete_raw=True):
+    """
+    Roll up raw rows of one source stamped before ``cutoff``.
+
+    Returns:
+        dict: ``{'rolled_up': rows folded in, 'deleted': raw rows removed}``
+    """
+    model, time_col, read_rows = SOURCES[source]
+
+    rolled_up = 0
+    while True:
+        # The state row stays locked until this hour commits: a concurrent run
+        # waits, then resumes after the hour instead of adding it a second time
+        state = _locked_state(source)
+        start = state.compacted_until
+        if start is not None and start >= cutoff:
+            break
+        # Skip empty stretches straight to the next hour holding rows
+        query = db.session.query(func.min(time_col)).filter(time_col < cutoff)
+        if start is not None:
+            query = query.filter(time_col >= start)
+        first = query.scalar()
+        if first is None:
+            state.compacted_until = cutoff
+            db.session.commit()
+            break
+        start = _hour(first) if start is None else max(start, _hour(first))
+        end = min(start + timedelta(hours=1), cutoff)
+        aggregates = _aggregate(read_rows(start, end))
+        if aggregates:
+            _merge_into_rollups(source, aggregates)
+            rolled_up += sum(a.request_count for a in aggregates.values())
+        # Rollups and the new high-water mark commit together
+        state.compacted_until = end
+        db.session.commit()
+
+    db.session.commit()
+    deleted = _delete_compacted(model, time_col, state.compacted_until) if delete_raw else 0
+    return {'rolled_up': rolled_up, 'deleted': deleted}
+
+
+def compact_usage_logs(now=None, retention_hours=RAW_RETENTION_HOURS, delete_raw=True):
+    """
+    Compact every usage source, leaving the last ``retention_hours`` of raw rows.
+
+    Returns:
+        dict: source -> result of :func:`compact_source`
+    """
+    now = now or datetime.utcnow()
+    cutoff = min(_hour(now - timedelta(hours=retention_hours)), now - timedelta(minutes=ROLLUP_LAG_MINUTES))
+    results = {}
+    for source in SOURCES:
+        try:
+            results[source] = compact_source(source, cutoff, delete_raw=delete_raw)
+        except Exception:
+            db.session.rollback()
+            logger.exception("Usage rollup failed for %s", source)
+            results[source] = None
+    return results
+
+
+def get_key_usage_summary(api_key_ids, since=None):
+    """
+    Usage per API key from rollups plus raw rows not compacted yet.
+
+    Args:
+        api_key_ids: ClientApiKey ids
+        since: Only count usage from this time on (default: all time)
+
+    Returns:
+        dict: key id -> {'total_usage', 'error_count', 'rate_limit_hits', 'p50_ms', 'p95_ms'}
+    """
+    api_key_ids = list(api_key_ids)
+    summary = {key_id: {'total_usage': 0, 'error_count': 0, 'rate_limit_hits': 0,
+                        'p50_ms': None, 'p95_ms': None} for key_id in api_key_ids}
+    if not api_key_ids:
+        return summary
+
+    sketches = {key_id: LatencySketch() for key_id in api_key_ids}
+    rollups = db.session.query(
+        ApiUsageHourly.api_key_id, ApiUsageHourly.request_count, ApiUsageHourly.error_count,
+        ApiUsageHourly.throttled_count, ApiUsageHourly.latency_sketch
+    ).filter(
+        ApiUsageHourly.source == ApiKeyUsageLog.__tablename__,
+        ApiUsageHourly.api_key_id.in_(api_key_ids)
+    )
+    if since is not None:
+        rollups = rollups.filter(ApiUsageHourly.bucket_start >= since)
+    for key_id, requests, errors, throttled, sketch in rollups:
+        stats = summary[key_id]
+        stats['total_usage'] += requests
+        stats['error_count'] += errors
+        stats['rate_limit_hits'] += throttled
+        sketches[key_id].merge(LatencySketch.from_dict(sketch))
+
+    raw = db.session.query(
+        ApiKeyUsageLog.api_key_id, ApiKeyUsageLog.status_code, ApiKeyUsageLog.response_time_ms
+    ).filter(ApiKeyUsageLog.api_key_id.in_(api_key_ids))
+    compacted_until = UsageRollupState.compacted_until_for(ApiKeyUsageLog.__tablename__)
+    if compacted_until is not None:
+        raw = raw.filter(ApiKeyUsageLog.created_at >= compacted_until)
+    if since is not None:
+        raw = raw.filter(ApiKeyUsageLog.created_at >= since)
+    for key_id, status, latency in raw.yield_per(5000):
+        stats = summary[key_id]
+        stats['total_usage'] += 1
+        if status is not None and status >= 400:
+            stats['error_count'] += 1
+        if status == 429:
+            stats['rate_limit_hits'] += 1
+        sketches[key_id].add(latency)
+
+    for key_id, sketch in sketches.items():
+        summary[key_id]['p50_ms'] = sketch.quantile(0.5)
+        summary[key_id]['p95_ms'] = sketch.quantile(0.95)
+    return summary
@@ -15,6 +15,7 @@ from functools import wraps
 
 from app.utils.security import WebhookSecurity, rate_limit
 from app.utils.audit import log_security_event, log_api_usage
+from app.utils.settings_snapshot import client_settings
 from app.models.client import Client
 from app.extensions import db
 
@@ -78,10 +79,7 @@ class WebhookHandler:
     
     def _get_webhook_secret(self, client: Client) -> Optional[str]:
         """Get webhook secret for client"""
-        # This could be stored in client settings or a separate webhook config table
-        # For now, we'll use a simple approach
-        settings = client.settings or {}
-        return settings.get('webhook_secret')
+        return client_settings(client.id).get('webhook_secret')
     
     def process_webhook_payload(self, client: Client, payload_data: Dict) -> Dict:
         """
@@ -340,7 +338,8 @@ def setup_webhook_security(client: Client, webhook_url: str, events: list) -> Di
         webhook_secret = secrets.token_urlsafe(32)
         
         # Update client settings
-        settings = client.settings or {}
+        # Copy so the JSON column sees a new value and the change is flushed
+        settings = dict(client.settings or {})
         settings.update({
             'webhook_url': webhook_url,
             'webhook_secret': webhook_secret,
@@ -390,7 +389,7 @@ def send_webhook(client: Client, event_type: str, data: Dict) -> bool:
     try:
         import requests
         
-        settings = client.settings or {}
+        settings = client_settings(client.id)
         webhook_url = settings.get('webhook_url')
         webhook_secret = settings.get('webhook_secret')
         
@@ -140,7 +140,7 @@ echo -e "${BLUE}🚀 Starting services...${NC}"
 systemctl reload supervisor
 supervisorctl reread
 supervisorctl update
-supervisorctl start paycrypt
+supervisorctl start paycrypt paycrypt-scheduler
 systemctl reload nginx
 
 # Set up automatic SSL renewal
@@ -221,7 +221,7 @@ git pull origin main
 source venv/bin/activate
 pip install -r requirements.txt
 flask db upgrade
-supervisorctl restart paycrypt
+supervisorctl restart paycrypt paycrypt-scheduler
 systemctl reload nginx
 echo "Application updated successfully!"
 EOF
@@ -232,7 +232,7 @@ chown $APP_USER:$APP_USER /home/$APP_USER/update.sh
 # Final status check
 echo -e "${BLUE}🔍 Checking service status...${NC}"
 systemctl status nginx --no-pager -l
-supervisorctl status paycrypt
+supervisorctl status paycrypt paycrypt-scheduler
 
 echo -e "${GREEN}✅ Deployment completed successfully!${NC}"
 echo -e "${BLUE}📋 Next steps:${NC}"
@@ -1,45 +1,87 @@
-#!/bin/bash
+#!/usr/bin/env python3
+"""
+Probe a running Paycrypt instance for monitoring and container health checks.
 
-# Health check endpoint for monitoring
-# Add this to your Flask app
+Calls the application's ``/health`` endpoint (which checks the database) and,
+with ``--metrics-url``, the internal Prometheus exporter. Exits 0 when
+everything answers, 1 otherwise, printing one line per check.
 
-from flask import Blueprint, jsonify
-from app.extensions import db
+Usage:
+    python deployment/health_check.py
+    python deployment/health_check.py --url http://127.0.0.1:8000/health --metrics-url http://127.0.0.1:9102/metrics
+"""
+import argparse
+import json
 import os
+import sys
+import urllib.error
+import urllib.request
 
-health_bp = Blueprint('health', __name__)
+DEFAULT_URL = os.getenv('HEALTH_CHECK_URL', 'http://127.0.0.1:8000/health')
+DEFAULT_TIMEOUT = float(os.getenv('HEALTH_CHECK_TIMEOUT', '5'))
 
-@health_bp.route('/health')
-def health_check():
-    """Health check endpoint for load balancers and monitoring"""
+
+def _get(url, timeout):
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def check_app(url, timeout):
+    """
+    Check the application's health endpoint.
+
+    Returns:
+        tuple: (ok, message)
+    """
+    try:
+        status, body = _get(url, timeout)
+    except (urllib.error.URLError, OSError) as e:
+        return False, f"app: unreachable ({e})"
     try:
-        # Check database connection
-        db.session.execute('SELECT 1')
-        
-        # Check if we can write to disk
-        test_file = '/tmp/health_check.txt'
-        with open(test_file, 'w') as f:
-            f.write('OK')
-        os.remove(test_file)
-        
-        return jsonify({
-            'status': 'healthy',
-            'database': 'connected',
-            'filesystem': 'writable'
-        }), 200
-        
-    except Exception as e:
-        return jsonify({
-            'status': 'unhealthy',
-            'error': str(e)
-        }), 503
-
-@health_bp.route('/ready')
-def readiness_check():
-    """Readiness check for Kubernetes/Docker deployments"""
-    return jsonify({'status': 'ready'}), 200
-
-@health_bp.route('/live')
-def liveness_check():
-    """Liveness check for Kubernetes/Docker deployments"""
-    return jsonify({'status': 'alive'}), 200
+        data = json.loads(body)
+    except ValueError:
+        data = {}
+    if status != 200 or data.get('status') != 'ok':
+        return False, f"app: HTTP {status} {data.get('message', '')}".rstrip()
+    return True, f"app: ok (database {data.get('database_ms', '?')}ms)"
+
+
+def check_metrics(url, timeout):
+    """
+    Check that the metrics exporter answers with request metrics.
+
+    Returns:
+        tuple: (ok, message)
+    """
+    try:
+        status, body = _get(url, timeout)
+    except (urllib.error.URLError, OSError) as e:
+        return False, f"metrics: unreachable ({e})"
+    if status != 200:
+        return False, f"metrics: HTTP {status}"
+    if b'paycrypt_http_requests_total' not in body:
+        return False, "metrics: no request metrics exported"
+    return True, "metrics: ok"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', default=DEFAULT_URL, help='Application health URL')
+    parser.add_argument('--metrics-url', default=os.getenv('HEALTH_CHECK_METRICS_URL'),
+                        help='Prometheus exporter URL (optional)')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT)
+    args = parser.parse_args(argv)
+
+    results = [check_app(args.url, args.timeout)]
+    if args.metrics_url:
+        results.append(check_metrics(args.metrics_url, args.timeout))
+    for _, message in results:
+        print(message)
+    return 0 if all(ok for ok, _ in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,50 @@
+"""
+Gunicorn hooks for the Prometheus exporter.
+
+Picked up automatically when gunicorn starts from the project directory
+(Procfile, Dockerfile, supervisor). When ``METRICS_PORT`` is set and
+prometheus_client is installed, workers write their metrics to
+``PROMETHEUS_MULTIPROC_DIR`` and the master serves the aggregate of all
+workers on ``METRICS_ADDR:METRICS_PORT`` (127.0.0.1 by default, keep it
+internal). Command-line options still take precedence over this file.
+"""
+import os
+import shutil
+
+METRICS_PORT = os.getenv('METRICS_PORT')
+METRICS_ADDR = os.getenv('METRICS_ADDR', '127.0.0.1')
+
+try:
+    import prometheus_client  # noqa: F401
+except ImportError:
+    METRICS_PORT = None
+
+if METRICS_PORT:
+    # Must be set before workers import prometheus_client
+    os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/paycrypt-metrics')
+
+
+def on_starting(server):
+    if not METRICS_PORT:
+        return
+    # Values left by a previous master would be summed with the new workers'
+    path = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+def when_ready(server):
+    if not METRICS_PORT:
+        return
+    from prometheus_client import CollectorRegistry, multiprocess, start_http_server
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    start_http_server(int(METRICS_PORT), addr=METRICS_ADDR, registry=registry)
+    server.log.info(f"Serving metrics on {METRICS_ADDR}:{METRICS_PORT}")
+
+
+def child_exit(server, worker):
+    if METRICS_PORT:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
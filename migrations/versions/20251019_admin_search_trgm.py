@@ -0,0 +1,52 @@
+"""add pg_trgm GIN indexes for admin search
+
+Revision ID: 20251019_admin_search_trgm
+Revises: 20251019_dashboard_kpi_indexes
+Create Date: 2025-10-19
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '20251019_admin_search_trgm'
+down_revision = '20251019_dashboard_kpi_indexes'
+branch_labels = None
+depends_on = None
+
+# (table, column) pairs searched by app/utils/admin_search.py
+TRGM_COLUMNS = [
+    ('clients', 'company_name'),
+    ('clients', 'email'),
+    ('clients', 'name'),
+    ('clients', 'username'),
+    ('payments', 'transaction_id'),
+    ('payments', 'description'),
+    ('payment_sessions', 'public_id'),
+    ('payment_sessions', 'order_id'),
+    ('payment_sessions', 'customer_email'),
+    ('withdrawal_requests', 'crypto_address'),
+    ('withdrawal_requests', 'user_wallet_address'),
+]
+
+
+def _index_name(table, column):
+    return f'ix_{table}_{column}_trgm'
+
+
+def upgrade():
+    # Trigram indexes only exist on PostgreSQL; SQLite falls back to table scans
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table, column in TRGM_COLUMNS:
+        op.create_index(
+            _index_name(table, column), table, [column],
+            postgresql_using='gin',
+            postgresql_ops={column: 'gin_trgm_ops'}
+        )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table, column in reversed(TRGM_COLUMNS):
+        op.drop_index(_index_name(table, column), table_name=table)
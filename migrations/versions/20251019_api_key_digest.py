@@ -0,0 +1,61 @@
+"""store API keys as indexed SHA-256 digests
+
+Revision ID: 20251019_api_key_digest
+Revises: 20251019_api_usage_hourly_rollups
+Create Date: 2025-10-19
+"""
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20251019_api_key_digest'
+down_revision = '20251019_api_usage_hourly_rollups'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+
+def upgrade():
+    bind = op.get_bind()
+    keys = sa.table(
+        'client_api_keys',
+        sa.column('id', sa.Integer),
+        sa.column('key', sa.String),
+        sa.column('key_hash', sa.String),
+    )
+
+    # Existing rows hold werkzeug password hashes (or, for keys created from the
+    # client portal, already a SHA-256 digest); recompute all from the key.
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(keys.c.id, keys.c.key)
+            .where(keys.c.id > last_id)
+            .order_by(keys.c.id)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        for key_id, key in rows:
+            if key:
+                bind.execute(
+                    keys.update().where(keys.c.id == key_id)
+                    .values(key_hash=hashlib.sha256(key.encode('utf-8')).hexdigest())
+                )
+        last_id = rows[-1][0]
+
+    op.create_index('ix_client_api_keys_key_hash', 'client_api_keys', ['key_hash'], unique=True)
+
+    # Only the digest and prefix are kept; drop the plaintext keys
+    with op.batch_alter_table('client_api_keys') as batch_op:
+        batch_op.alter_column('key', existing_type=sa.String(length=64), nullable=True)
+    bind.execute(keys.update().values(key=None))
+
+
+def downgrade():
+    # Plaintext keys cannot be restored: keys created before this revision must be
+    # reissued if it is rolled back.
+    op.drop_index('ix_client_api_keys_key_hash', table_name='client_api_keys')
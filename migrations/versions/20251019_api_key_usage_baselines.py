@@ -0,0 +1,27 @@
+"""add checkpointed API key usage baselines
+
+Revision ID: 20251019_api_key_usage_baselines
+Revises: 20251019_withdrawal_request_ip
+Create Date: 2025-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20251019_api_key_usage_baselines'
+down_revision = '20251019_withdrawal_request_ip'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'api_key_usage_baselines',
+        sa.Column('api_key_id', sa.Integer(), primary_key=True),
+        sa.Column('state', sa.JSON(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+    )
+
+
+def downgrade():
+    op.drop_table('api_key_usage_baselines')
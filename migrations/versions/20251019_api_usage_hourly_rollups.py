@@ -0,0 +1,60 @@
+"""add hourly API usage rollups
+
+Revision ID: 20251019_api_usage_hourly_rollups
+Revises: 20251019_security_event_aggregation
+Create Date: 2025-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20251019_api_usage_hourly_rollups'
+down_revision = '20251019_security_event_aggregation'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'api_usage_hourly',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('bucket_start', sa.DateTime(), nullable=False),
+        sa.Column('source', sa.String(length=32), nullable=False),
+        sa.Column('client_id', sa.Integer(), nullable=True),
+        sa.Column('api_key_id', sa.Integer(), nullable=True),
+        sa.Column('api_key_hash', sa.String(length=16), nullable=True),
+        sa.Column('endpoint', sa.String(length=255), nullable=False),
+        sa.Column('method', sa.String(length=10), nullable=False),
+        sa.Column('request_count', sa.Integer(), nullable=False),
+        sa.Column('error_count', sa.Integer(), nullable=False),
+        sa.Column('throttled_count', sa.Integer(), nullable=False),
+        sa.Column('bytes_in', sa.BigInteger(), nullable=False),
+        sa.Column('bytes_out', sa.BigInteger(), nullable=False),
+        sa.Column('latency_sketch', sa.JSON(), nullable=True),
+        sa.Column('p50_ms', sa.Float(), nullable=True),
+        sa.Column('p95_ms', sa.Float(), nullable=True),
+    )
+    op.create_index('ix_api_usage_hourly_client_bucket', 'api_usage_hourly', ['client_id', 'bucket_start'], unique=False)
+    op.create_index('ix_api_usage_hourly_key_bucket', 'api_usage_hourly', ['api_key_id', 'bucket_start'], unique=False)
+    op.create_index('ix_api_usage_hourly_bucket_source', 'api_usage_hourly', ['bucket_start', 'source'], unique=False)
+
+    op.create_table(
+        'usage_rollup_state',
+        sa.Column('source', sa.String(length=32), primary_key=True),
+        sa.Column('compacted_until', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+    )
+
+    # Compaction walks the raw tables by timestamp
+    op.create_index('ix_api_key_usage_logs_created_at', 'api_key_usage_logs', ['created_at'], unique=False)
+    op.create_index('ix_api_usage_timestamp', 'api_usage', ['timestamp'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_api_usage_timestamp', table_name='api_usage')
+    op.drop_index('ix_api_key_usage_logs_created_at', table_name='api_key_usage_logs')
+    op.drop_table('usage_rollup_state')
+    op.drop_index('ix_api_usage_hourly_bucket_source', table_name='api_usage_hourly')
+    op.drop_index('ix_api_usage_hourly_key_bucket', table_name='api_usage_hourly')
+    op.drop_index('ix_api_usage_hourly_client_bucket', table_name='api_usage_hourly')
+    op.drop_table('api_usage_hourly')
@@ -0,0 +1,25 @@
+"""add indexes backing admin dashboard KPIs
+
+Revision ID: 20251019_dashboard_kpi_indexes
+Revises: 20251019_report_jobs
+Create Date: 2025-10-19
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '20251019_dashboard_kpi_indexes'
+down_revision = '20251019_report_jobs'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_payments_created_at', 'payments', ['created_at'], unique=False)
+    op.create_index('ix_payments_status_created_at', 'payments', ['status', 'created_at'], unique=False)
+    op.create_index('ix_withdrawal_requests_status', 'withdrawal_requests', ['status'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_withdrawal_requests_status', table_name='withdrawal_requests')
+    op.drop_index('ix_payments_status_created_at', table_name='payments')
+    op.drop_index('ix_payments_created_at', table_name='payments')
@@ -0,0 +1,41 @@
+"""add linked-entity tables
+
+Revision ID: 20251019_entity_links
+Revises: 20251019_api_key_digest
+Create Date: 2025-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20251019_entity_links'
+down_revision = '20251019_api_key_digest'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'entity_links',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('entity_a', sa.String(length=160), nullable=False),
+        sa.Column('entity_b', sa.String(length=160), nullable=False),
+        sa.Column('source', sa.String(length=50), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.UniqueConstraint('entity_a', 'entity_b', name='uq_entity_links_pair'),
+    )
+    op.create_index('ix_entity_links_entity_b', 'entity_links', ['entity_b'], unique=False)
+    op.create_index('ix_entity_links_created_at', 'entity_links', ['created_at'], unique=False)
+    op.create_table(
+        'entity_risk_flags',
+        sa.Column('entity', sa.String(length=160), primary_key=True),
+        sa.Column('reason', sa.String(length=100), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_table('entity_risk_flags')
+    op.drop_index('ix_entity_links_created_at', table_name='entity_links')
+    op.drop_index('ix_entity_links_entity_b', table_name='entity_links')
+    op.drop_table('entity_links')
@@ -0,0 +1,31 @@
+"""add composite indexes for API keyset pagination
+
+Revision ID: 20251019_keyset_pagination_indexes
+Revises: 20251019_admin_search_trgm
+Create Date: 2025-10-19
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '20251019_keyset_pagination_indexes'
+down_revision = '20251019_admin_search_trgm'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_payments_client_status_created_id', 'payments',
+                    ['client_id', 'status', 'created_at', 'id'], unique=False)
+    op.create_index('ix_payments_client_created_id', 'payments',
+                    ['client_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_withdrawal_requests_client_status_created_id', 'withdrawal_requests',
+                    ['client_id', 'status', 'created_at', 'id'], unique=False)
+    op.create_index('ix_withdrawal_requests_client_created_id', 'withdrawal_requests',
+                    ['client_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_withdrawal_requests_client_created_id', table_name='withdrawal_requests')
+    op.drop_index('ix_withdrawal_requests_client_status_created_id', table_name='withdrawal_requests')
+    op.drop_index('ix_payments_client_created_id', table_name='payments')
+    op.drop_index('ix_payments_client_status_created_id', table_name='payments')
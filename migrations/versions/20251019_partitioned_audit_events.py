@@ -0,0 +1,168 @@
+"""split security and API usage events into partitioned tables
+
+Revision ID: 20251019_partitioned_audit_events
+Revises: 20251019_keyset_pagination_indexes
+Create Date: 2025-10-19
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20251019_partitioned_audit_events'
+down_revision = '20251019_keyset_pagination_indexes'
+branch_labels = None
+depends_on = None
+
+# Months of partitions created up front; app/utils/audit_partitions.py keeps them rolling
+INITIAL_MONTHS_BACK = 1
+INITIAL_MONTHS_AHEAD = 2
+
+SECURITY_EVENTS_PG = """
+CREATE TABLE security_events (
+    id BIGSERIAL NOT NULL,
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT (now() at time zone 'utc'),
+    event_type VARCHAR(64) NOT NULL,
+    severity VARCHAR(16) NOT NULL DEFAULT 'medium',
+    actor_type VARCHAR(20),
+    actor_id INTEGER,
+    ip_address VARCHAR(45),
+    user_agent VARCHAR(255),
+    endpoint VARCHAR(100),
+    method VARCHAR(10),
+    details JSON,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at)
+"""
+
+API_USAGE_EVENTS_PG = """
+CREATE TABLE api_usage_events (
+    id BIGSERIAL NOT NULL,
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT (now() at time zone 'utc'),
+    api_key_hash VARCHAR(16) NOT NULL,
+    endpoint VARCHAR(100) NOT NULL,
+    method VARCHAR(10) NOT NULL,
+    status_code INTEGER,
+    response_time_ms DOUBLE PRECISION,
+    ip_address VARCHAR(45),
+    user_agent VARCHAR(255),
+    error_message VARCHAR(255),
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at)
+"""
+
+# Move security events that used to be stored in audit_trail
+COPY_SECURITY_EVENTS_PG = """
+INSERT INTO security_events (created_at, event_type, severity, actor_type, actor_id,
+                             ip_address, user_agent, endpoint, method, details)
+SELECT created_at,
+       substring(action_type from 10),
+       coalesce(new_value->>'severity', 'medium'),
+       'user', user_id, ip_address, user_agent,
+       new_value->>'endpoint', new_value->>'method', new_value
+FROM audit_trail
+WHERE action_type LIKE 'security_%' AND created_at IS NOT NULL
+"""
+
+# Move API usage rows, whose fields used to live in audit_trail.new_value
+COPY_API_USAGE_EVENTS_PG = """
+INSERT INTO api_usage_events (created_at, api_key_hash, endpoint, method, status_code,
+                              response_time_ms, ip_address, user_agent, error_message)
+SELECT created_at,
+       left(coalesce(new_value->>'api_key_hash', ''), 16),
+       left(coalesce(new_value->>'endpoint', ''), 100),
+       left(coalesce(new_value->>'method', ''), 10),
+       (new_value->>'response_code')::integer,
+       (new_value->>'response_time_ms')::double precision,
+       left(coalesce(new_value->>'ip_address', ip_address), 45),
+       left(coalesce(new_value->>'user_agent', user_agent), 255),
+       left(new_value->>'error_message', 255)
+FROM audit_trail
+WHERE action_type = 'api_usage' AND created_at IS NOT NULL
+"""
+
+MOVED_ROWS = "action_type LIKE 'security_%' OR action_type = 'api_usage'"
+
+
+def _month_start(year, month):
+    year += (month - 1) // 12
+    month = (month - 1) % 12 + 1
+    return datetime(year, month, 1)
+
+
+def _create_indexes():
+    op.create_index('ix_security_events_created_at', 'security_events', ['created_at'], unique=False)
+    op.create_index('ix_security_events_severity_created_at', 'security_events', ['severity', 'created_at'], unique=False)
+    op.create_index('ix_security_events_event_type_created_at', 'security_events', ['event_type', 'created_at'], unique=False)
+    op.create_index('ix_security_events_actor_created_at', 'security_events', ['actor_type', 'actor_id', 'created_at'], unique=False)
+    op.create_index('ix_api_usage_events_created_at', 'api_usage_events', ['created_at'], unique=False)
+    op.create_index('ix_api_usage_events_key_created_at', 'api_usage_events', ['api_key_hash', 'created_at'], unique=False)
+
+
+def upgrade():
+    bind = op.get_bind()
+
+    if bind.dialect.name != 'postgresql':
+        op.create_table(
+            'security_events',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.Column('event_type', sa.String(length=64), nullable=False),
+            sa.Column('severity', sa.String(length=16), nullable=False),
+            sa.Column('actor_type', sa.String(length=20), nullable=True),
+            sa.Column('actor_id', sa.Integer(), nullable=True),
+            sa.Column('ip_address', sa.String(length=45), nullable=True),
+            sa.Column('user_agent', sa.String(length=255), nullable=True),
+            sa.Column('endpoint', sa.String(length=100), nullable=True),
+            sa.Column('method', sa.String(length=10), nullable=True),
+            sa.Column('details', sa.JSON(), nullable=True),
+        )
+        op.create_table(
+            'api_usage_events',
+            sa.Column('id', sa.Integer(), primary_key=True),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.Column('api_key_hash', sa.String(length=16), nullable=False),
+            sa.Column('endpoint', sa.String(length=100), nullable=False),
+            sa.Column('method', sa.String(length=10), nullable=False),
+            sa.Column('status_code', sa.Integer(), nullable=True),
+            sa.Column('response_time_ms', sa.Float(), nullable=True),
+            sa.Column('ip_address', sa.String(length=45), nullable=True),
+            sa.Column('user_agent', sa.String(length=255), nullable=True),
+            sa.Column('error_message', sa.String(length=255), nullable=True),
+        )
+        _create_indexes()
+        return
+
+    op.execute(SECURITY_EVENTS_PG)
+    op.execute(API_USAGE_EVENTS_PG)
+
+    # Give every month of copied history its own partition, so retention can drop it
+    now = datetime.utcnow()
+    months_back = INITIAL_MONTHS_BACK
+    oldest = bind.execute(sa.text(f"SELECT min(created_at) FROM audit_trail WHERE {MOVED_ROWS}")).scalar()
+    if oldest is not None:
+        months_back = max(months_back, (now.year - oldest.year) * 12 + now.month - oldest.month)
+    for table in ('security_events', 'api_usage_events'):
+        for offset in range(-months_back, INITIAL_MONTHS_AHEAD + 1):
+            start = _month_start(now.year, now.month + offset)
+            end = _month_start(now.year, now.month + offset + 1)
+            op.execute(
+                f"CREATE TABLE {table}_p{start:%Y%m} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+            )
+        # Safety net for rows outside the pre-created months (e.g. imported history)
+        op.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+
+    # Indexes on a partitioned parent cascade to every partition
+    _create_indexes()
+
+    op.execute(COPY_SECURITY_EVENTS_PG)
+    op.execute(COPY_API_USAGE_EVENTS_PG)
+    op.execute(f"DELETE FROM audit_trail WHERE {MOVED_ROWS}")
+
+
+def downgrade():
+    # Dropping a partitioned parent drops all of its partitions
+    op.drop_table('api_usage_events')
+    op.drop_table('security_events')
@@ -0,0 +1,34 @@
+"""add report job tracking columns
+
+Revision ID: 20251019_report_jobs
+Revises: 20250814_add_payment_sessions
+Create Date: 2025-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20251019_report_jobs'
+down_revision = '20250814_add_payment_sessions'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('report', sa.Column('status', sa.String(length=20), nullable=False, server_default='pending'))
+    op.add_column('report', sa.Column('result_format', sa.String(length=10), nullable=False, server_default='json'))
+    op.add_column('report', sa.Column('artifact_path', sa.String(length=255), nullable=True))
+    op.add_column('report', sa.Column('error_message', sa.Text(), nullable=True))
+    op.add_column('report', sa.Column('started_at', sa.DateTime(), nullable=True))
+    op.add_column('report', sa.Column('completed_at', sa.DateTime(), nullable=True))
+    op.create_index('ix_report_status', 'report', ['status'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_report_status', table_name='report')
+    op.drop_column('report', 'completed_at')
+    op.drop_column('report', 'started_at')
+    op.drop_column('report', 'error_message')
+    op.drop_column('report', 'artifact_path')
+    op.drop_column('report', 'result_format')
+    op.drop_column('report', 'status')
@@ -0,0 +1,29 @@
+"""add aggregation columns to security events
+
+Revision ID: 20251019_security_event_aggregation
+Revises: 20251019_partitioned_audit_events
+Create Date: 2025-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20251019_security_event_aggregation'
+down_revision = '20251019_partitioned_audit_events'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # On PostgreSQL, columns added to the partitioned parent propagate to every partition
+    op.add_column('security_events', sa.Column('event_count', sa.Integer(), nullable=False, server_default='1'))
+    op.add_column('security_events', sa.Column('first_seen_at', sa.DateTime(), nullable=True))
+    op.add_column('security_events', sa.Column('last_seen_at', sa.DateTime(), nullable=True))
+    op.add_column('security_events', sa.Column('sample', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('security_events', 'sample')
+    op.drop_column('security_events', 'last_seen_at')
+    op.drop_column('security_events', 'first_seen_at')
+    op.drop_column('security_events', 'event_count')
@@ -0,0 +1,27 @@
+"""add settings version counter
+
+Revision ID: 20251019_settings_version
+Revises: 20251019_api_key_usage_baselines
+Create Date: 2025-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20251019_settings_version'
+down_revision = '20251019_api_key_usage_baselines'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    settings_version = op.create_table(
+        'settings_version',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('version', sa.BigInteger(), nullable=False, server_default='0'),
+    )
+    op.bulk_insert(settings_version, [{'id': 1, 'version': 1}])
+
+
+def downgrade():
+    op.drop_table('settings_version')
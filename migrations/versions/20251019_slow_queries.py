@@ -0,0 +1,39 @@
+"""add slow query aggregates
+
+Revision ID: 20251019_slow_queries
+Revises: 20251019_settings_version
+Create Date: 2025-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20251019_slow_queries'
+down_revision = '20251019_settings_version'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'slow_queries',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('fingerprint_hash', sa.String(length=40), nullable=False),
+        sa.Column('fingerprint', sa.Text(), nullable=False),
+        sa.Column('endpoint', sa.String(length=255), nullable=True),
+        sa.Column('call_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('total_ms', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('max_ms', sa.Float(), nullable=False, server_default='0'),
+        sa.Column('p95_ms', sa.Float(), nullable=True),
+        sa.Column('latency_sketch', sa.JSON(), nullable=True),
+        sa.Column('first_seen_at', sa.DateTime(), nullable=True),
+        sa.Column('last_seen_at', sa.DateTime(), nullable=True),
+        sa.Column('plan', sa.Text(), nullable=True),
+        sa.Column('plan_ms', sa.Float(), nullable=True),
+        sa.Column('plan_captured_at', sa.DateTime(), nullable=True),
+        sa.UniqueConstraint('fingerprint_hash', name='uq_slow_queries_fingerprint_hash'),
+    )
+
+
+def downgrade():
+    op.drop_table('slow_queries')
@@ -0,0 +1,22 @@
+"""add memo to withdrawal requests
+
+Revision ID: 20251019_withdrawal_memo
+Revises: 20251019_slow_queries
+Create Date: 2025-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20251019_withdrawal_memo'
+down_revision = '20251019_slow_queries'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('withdrawal_requests', sa.Column('memo', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    op.drop_column('withdrawal_requests', 'memo')
@@ -0,0 +1,22 @@
+"""add request_ip to withdrawal requests
+
+Revision ID: 20251019_withdrawal_request_ip
+Revises: 20251019_entity_links
+Create Date: 2025-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '20251019_withdrawal_request_ip'
+down_revision = '20251019_entity_links'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('withdrawal_requests', sa.Column('request_ip', sa.String(length=45), nullable=True))
+
+
+def downgrade():
+    op.drop_column('withdrawal_requests', 'request_ip')
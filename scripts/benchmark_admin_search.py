@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Benchmark admin search latency.
+
+Seeds clients, payments, payment sessions and withdrawal requests, then times
+admin_search() for exact identifiers, partial matches and misses. Point
+DATABASE_URL at a PostgreSQL database with the trigram migration applied to
+measure the indexed path; the default is a throwaway SQLite file.
+
+Usage:
+    python scripts/benchmark_admin_search.py [--rows 2000000] [--runs 20]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite:////tmp/paycrypt_search_bench.db')
+
+from app import create_app, db
+from app.models.client import Client
+from app.models.payment import Payment
+from app.models.payment_session import PaymentSession
+from app.models.withdrawal import WithdrawalRequest
+from app.models.enums import PaymentStatus, WithdrawalStatus
+from app.utils.admin_search import admin_search
+
+BATCH_SIZE = 50000
+
+
+def _insert(model, rows):
+    db.session.execute(db.insert(model), rows)
+    db.session.commit()
+
+
+def seed(num_rows, num_clients):
+    rng = random.Random(7)
+    now = datetime.utcnow()
+    print(f"Seeding {num_clients} clients and {num_rows:,} rows per table...")
+    _insert(Client, [
+        {'company_name': f'Company {uuid.uuid4().hex[:10]}', 'email': f'ops{i}@client{i}.example.com'}
+        for i in range(num_clients)
+    ])
+    client_ids = [cid for (cid,) in db.session.query(Client.id)]
+
+    start = time.perf_counter()
+    for offset in range(0, num_rows, BATCH_SIZE):
+        size = min(BATCH_SIZE, num_rows - offset)
+        payments, sessions, withdrawals = [], [], []
+        for _ in range(size):
+            client_id = rng.choice(client_ids)
+            created = now - timedelta(minutes=rng.randint(0, 525600))
+            payments.append({
+                'client_id': client_id, 'amount': rng.uniform(1, 1000), 'currency': 'BTC',
+                '_status': PaymentStatus.COMPLETED, 'payment_method': 'crypto',
+                'transaction_id': uuid.uuid4().hex, 'created_at': created
+            })
+            sessions.append({
+                'public_id': 'ps_' + uuid.uuid4().hex[:12], 'client_id': client_id,
+                'order_id': f'ORD-{uuid.uuid4().hex[:16]}', 'amount': 10, 'currency': 'USD',
+                'status': 'created', 'expires_at': created, 'success_url': 'https://example.com/ok',
+                'cancel_url': 'https://example.com/cancel', 'created_at': created
+            })
+            withdrawals.append({
+                'client_id': client_id, 'amount': 1.0, 'currency': 'BTC',
+                'crypto_address': 'bc1q' + uuid.uuid4().hex + uuid.uuid4().hex[:6],
+                'status': WithdrawalStatus.PENDING, 'created_at': created
+            })
+        _insert(Payment, payments)
+        _insert(PaymentSession, sessions)
+        _insert(WithdrawalRequest, withdrawals)
+    print(f"  seeded in {time.perf_counter() - start:.1f}s")
+
+
+def timed(label, term, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        admin_search(term)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    p95 = samples[int(len(samples) * 0.95) - 1] if len(samples) > 1 else samples[0]
+    print(f"  {label:<28} median {statistics.median(samples):8.1f}ms  p95 {p95:8.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=2000000)
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--skip-seed', action='store_true', help='Reuse already seeded data')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        if not args.skip_seed:
+            db.drop_all()
+            db.create_all()
+            seed(args.rows, args.clients)
+
+        print(f"Dialect: {db.engine.dialect.name}")
+        tx_id = db.session.query(Payment.transaction_id).order_by(Payment.id.desc()).limit(1).scalar()
+        order_id = db.session.query(PaymentSession.order_id).limit(1).scalar()
+        address = db.session.query(WithdrawalRequest.crypto_address).limit(1).scalar()
+
+        timed('exact transaction_id', tx_id, args.runs)
+        timed('exact order_id', order_id, args.runs)
+        timed('partial crypto address', address[4:16], args.runs)
+        timed('client email fragment', 'client42', args.runs)
+        timed('no match', 'zzzz-not-there', args.runs)
+
+
+if __name__ == '__main__':
+    main()
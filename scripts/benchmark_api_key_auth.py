@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark API key authentication cost as the key table grows.
+
+Seeds API keys in steps (default up to 100k) and, at each size, times
+ClientApiKey.find_by_key() for valid and unknown keys. With the indexed
+digest lookup the per-request cost should stay flat as the table grows.
+
+Usage:
+    python scripts/benchmark_api_key_auth.py [--keys 100000] [--runs 200]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite:////tmp/paycrypt_api_key_bench.db')
+
+from app import create_app, db
+from app.models.api_key import ClientApiKey
+from app.models.client import Client
+
+BATCH_SIZE = 10000
+
+
+def seed(client_id, start, count):
+    """Insert ``count`` keys numbered from ``start``; returns the plaintext keys"""
+    plain = []
+    for offset in range(0, count, BATCH_SIZE):
+        rows = []
+        for i in range(start + offset, start + min(offset + BATCH_SIZE, count)):
+            key = ClientApiKey.generate_key()
+            plain.append(key)
+            rows.append({
+                'client_id': client_id, 'name': f'bench-{i}', 'key': key,
+                'key_prefix': ClientApiKey.generate_key_prefix(key),
+                'key_hash': ClientApiKey.hash_key(key), 'permissions': [], 'is_active': True
+            })
+        db.session.execute(db.insert(ClientApiKey), rows)
+        db.session.commit()
+    return plain
+
+
+def timed(label, keys, runs):
+    samples = []
+    for i in range(runs):
+        key = keys[i % len(keys)]
+        start = time.perf_counter()
+        ClientApiKey.find_by_key(key)
+        samples.append((time.perf_counter() - start) * 1000)
+        db.session.rollback()
+    samples.sort()
+    p95 = samples[int(len(samples) * 0.95) - 1] if len(samples) > 1 else samples[0]
+    print(f"    {label:<14} median {statistics.median(samples):7.3f}ms  p95 {p95:7.3f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--keys', type=int, default=100000)
+    parser.add_argument('--steps', type=int, default=4, help='Number of table sizes to measure')
+    parser.add_argument('--runs', type=int, default=200)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        client = Client(company_name='Benchmark Co', email='bench@example.com')
+        db.session.add(client)
+        db.session.commit()
+
+        print(f"Dialect: {db.engine.dialect.name}")
+        keys = []
+        step = max(1, args.keys // args.steps)
+        while len(keys) < args.keys:
+            keys.extend(seed(client.id, len(keys), min(step, args.keys - len(keys))))
+            print(f"  {len(keys):,} keys")
+            timed('valid key', keys, args.runs)
+            timed('unknown key', [ClientApiKey.generate_key() for _ in range(50)], args.runs)
+
+
+if __name__ == '__main__':
+    main()
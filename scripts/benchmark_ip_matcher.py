@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Benchmark IP blocklist loading and lookup.
+
+Writes a synthetic threat-feed file of random IPv4/IPv6 networks (default
+100k entries), then times IPMatcher.from_file() and lookups for listed and
+unlisted addresses.
+
+Usage:
+    python scripts/benchmark_ip_matcher.py [--entries 100000] [--lookups 100000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.ip_matcher import IPMatcher
+
+
+def write_feed(path, count, rng):
+    with open(path, 'w') as fh:
+        fh.write('# synthetic blocklist\n')
+        for _ in range(count):
+            if rng.random() < 0.9:
+                prefix = rng.choice((16, 20, 24, 24, 28, 32))
+                addr = '.'.join(str(rng.randint(1, 254)) for _ in range(4))
+            else:
+                prefix = rng.choice((32, 48, 64, 128))
+                addr = '2001:db8:' + ':'.join(f'{rng.randint(0, 0xffff):x}' for _ in range(6))
+            fh.write(f'{addr}/{prefix}\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--entries', type=int, default=100000)
+    parser.add_argument('--lookups', type=int, default=100000)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    fd, path = tempfile.mkstemp(suffix='.txt')
+    os.close(fd)
+    try:
+        write_feed(path, args.entries, rng)
+        start = time.perf_counter()
+        matcher = IPMatcher.from_file(path)
+        print(f"Loaded {len(matcher):,} entries in {time.perf_counter() - start:.3f}s")
+
+        addresses = ['.'.join(str(rng.randint(1, 254)) for _ in range(4)) for _ in range(args.lookups)]
+        start = time.perf_counter()
+        hits = sum(1 for address in addresses if matcher.match(address))
+        elapsed = time.perf_counter() - start
+        print(f"IPv4 lookups: {elapsed / len(addresses) * 1e6:.2f}us each ({hits:,} hits)")
+
+        addresses = ['2001:db8::' + f'{rng.randint(0, 0xffff):x}' for _ in range(args.lookups)]
+        start = time.perf_counter()
+        for address in addresses:
+            matcher.match(address)
+        elapsed = time.perf_counter() - start
+        print(f"IPv6 lookups: {elapsed / len(addresses) * 1e6:.2f}us each")
+    finally:
+        os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark report generation against a large payments table.
+
+Seeds N payments (default 1,000,000) into the configured database and times
+each report generator. Uses a throwaway SQLite file unless DATABASE_URL is set.
+
+Usage:
+    python scripts/benchmark_reports.py [--payments 1000000] [--clients 500] [--days 365]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite:////tmp/paycrypt_report_bench.db')
+
+from app import create_app, db
+from app.models.client import Client
+from app.models.payment import Payment
+from app.models.enums import PaymentStatus
+from app.models.report import Report, ReportType
+
+BATCH_SIZE = 50000
+
+
+def seed(num_payments, num_clients, days):
+    """Bulk insert clients and payments with Core inserts"""
+    print(f"Seeding {num_clients} clients and {num_payments:,} payments...")
+    db.session.execute(db.insert(Client), [
+        {'company_name': f'Bench Co {i}', 'email': f'bench{i}@example.com', 'is_active': i % 5 != 0}
+        for i in range(num_clients)
+    ])
+    db.session.commit()
+    client_ids = [cid for (cid,) in db.session.query(Client.id)]
+
+    statuses = list(PaymentStatus)
+    methods = ['crypto', 'card', 'bank_transfer']
+    currencies = ['BTC', 'ETH', 'USDT']
+    now = datetime.utcnow()
+    rng = random.Random(42)
+
+    start = time.perf_counter()
+    for offset in range(0, num_payments, BATCH_SIZE):
+        rows = []
+        for _ in range(min(BATCH_SIZE, num_payments - offset)):
+            created = now - timedelta(seconds=rng.randint(0, days * 86400))
+            rows.append({
+                'client_id': rng.choice(client_ids),
+                'amount': round(rng.uniform(1, 5000), 2),
+                'currency': rng.choice(currencies),
+                '_status': rng.choice(statuses),
+                'payment_method': rng.choice(methods),
+                'created_at': created,
+                'updated_at': created,
+                'expires_at': created + timedelta(hours=1)
+            })
+        db.session.execute(db.insert(Payment), rows)
+        db.session.commit()
+    print(f"  seeded in {time.perf_counter() - start:.1f}s")
+
+
+def run(days):
+    end = datetime.utcnow().date()
+    filters = {
+        'start_date': (end - timedelta(days=days)).strftime('%Y-%m-%d'),
+        'end_date': end.strftime('%Y-%m-%d')
+    }
+    for report_type in ReportType:
+        report = Report(name='bench', description=None, report_type=report_type.value, filters=filters)
+        start = time.perf_counter()
+        report.generate_report()
+        print(f"  {report_type.value:<20} {time.perf_counter() - start:8.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--payments', type=int, default=1000000)
+    parser.add_argument('--clients', type=int, default=500)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--skip-seed', action='store_true', help='Reuse already seeded data')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        if not args.skip_seed:
+            db.drop_all()
+            db.create_all()
+            seed(args.payments, args.clients, args.days)
+        print("Generating reports...")
+        run(args.days)
+
+
+if __name__ == '__main__':
+    main()
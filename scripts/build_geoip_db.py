@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Build the local GeoIP/ASN database used for fraud scoring.
+
+Input is an ip2asn-style TSV (e.g. ip2asn-combined.tsv), one range per line:
+
+    range_start  range_end  AS_number  country_code  AS_description
+
+Ranges of hosting/datacenter networks are flagged using --hosting-asns (one
+AS number per line) plus keyword matches on the AS description.
+
+Usage:
+    python scripts/build_geoip_db.py ip2asn-combined.tsv [--output instance/geoip.bin]
+        [--hosting-asns hosting_asns.txt]
+    python scripts/build_geoip_db.py --benchmark
+"""
+
+import argparse
+import ipaddress
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.geoip import FLAG_HOSTING, GeoIPDatabase, write_database
+
+HOSTING_KEYWORDS = (
+    'hosting', 'cloud', 'data center', 'datacenter', 'server', 'vps', 'colo',
+    'amazon', 'aws', 'google', 'microsoft', 'azure', 'digitalocean', 'linode',
+    'akamai', 'ovh', 'hetzner', 'vultr', 'leaseweb', 'contabo', 'scaleway', 'alibaba',
+)
+
+
+def read_hosting_asns(path):
+    if not path:
+        return set()
+    with open(path) as fh:
+        return {int(line.strip().upper().lstrip('AS')) for line in fh if line.strip() and not line.startswith('#')}
+
+
+def read_ranges(path, hosting_asns):
+    v4, v6 = [], []
+    with open(path, encoding='utf-8', errors='replace') as fh:
+        for line in fh:
+            parts = line.rstrip('\n').split('\t')
+            if len(parts) < 4 or line.startswith('#'):
+                continue
+            start, end, asn, country = parts[:4]
+            description = parts[4].lower() if len(parts) > 4 else ''
+            asn = int(asn or 0)
+            if asn == 0 or country in ('None', ''):
+                continue  # Unrouted space
+            start, end = ipaddress.ip_address(start), ipaddress.ip_address(end)
+            hosting = asn in hosting_asns or any(k in description for k in HOSTING_KEYWORDS)
+            row = (int(start), int(end), asn, country[:2].upper(), FLAG_HOSTING if hosting else 0)
+            (v4 if start.version == 4 else v6).append(row)
+    v4.sort()
+    v6.sort()
+    return v4, v6
+
+
+def benchmark():
+    rng = random.Random(7)
+    v4, start = [], 1 << 24
+    while start < (223 << 24):
+        size = rng.choice((256, 1024, 4096, 65536))
+        v4.append((start, start + size - 1, rng.randint(1, 400000), rng.choice(('US', 'DE', 'TR', 'NG', 'BR')),
+                   FLAG_HOSTING if rng.random() < 0.1 else 0))
+        start += size + rng.choice((0, 0, 256))
+    v6 = [((0x2001 << 112) + (i << 96), (0x2001 << 112) + ((i + 1) << 96) - 1, 64500 + i % 100, 'US', 0)
+          for i in range(50000)]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'geoip.bin')
+        write_database(path, v4, v6)
+        database = GeoIPDatabase(path)
+        print(f"{len(v4):,} IPv4 and {len(v6):,} IPv6 ranges ({os.path.getsize(path) / 1e6:.1f} MB)")
+
+        addresses = [str(ipaddress.ip_address(rng.randint(1 << 24, 223 << 24))) for _ in range(100000)]
+        start_time = time.perf_counter()
+        for address in addresses:
+            database._lookup(address)
+        print(f"IPv4 uncached: {(time.perf_counter() - start_time) / len(addresses) * 1e6:.2f}us")
+        repeated = addresses[:1000] * 100
+        for address in repeated[:1000]:
+            database.lookup(address)
+        start_time = time.perf_counter()
+        for address in repeated:
+            database.lookup(address)
+        print(f"IPv4 cached:   {(time.perf_counter() - start_time) / len(repeated) * 1e6:.2f}us")
+
+        addresses = [f'2001:{rng.randint(0, 0xc350):x}::{rng.randint(1, 0xffff):x}' for _ in range(100000)]
+        start_time = time.perf_counter()
+        for address in addresses:
+            database._lookup(address)
+        print(f"IPv6 uncached: {(time.perf_counter() - start_time) / len(addresses) * 1e6:.2f}us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('source', nargs='?', help='ip2asn TSV file')
+    parser.add_argument('--output', default=os.getenv('GEOIP_DB_PATH', os.path.join('instance', 'geoip.bin')))
+    parser.add_argument('--hosting-asns', help='File with datacenter AS numbers, one per line')
+    parser.add_argument('--benchmark', action='store_true', help='Time lookups on a synthetic database')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark()
+        return
+    if not args.source:
+        parser.error('source is required')
+
+    start = time.perf_counter()
+    v4, v6 = read_ranges(args.source, read_hosting_asns(args.hosting_asns))
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    write_database(args.output, v4, v6)
+    print(f"Wrote {len(v4):,} IPv4 and {len(v6):,} IPv6 ranges to {args.output} "
+          f"in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
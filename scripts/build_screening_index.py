@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Compile an address list into a screening index.
+
+Reads one address per line (blank lines and ``#`` comments are skipped; for
+CSV feeds the first column is used) and writes ``<name>.idx`` into the
+screening directory, atomically replacing the previous version. Running
+workers pick the new file up within SCREENING_RELOAD_INTERVAL seconds.
+
+Usage:
+    python scripts/build_screening_index.py sanctions.txt --name ofac_sdn \\
+        [--output-dir instance/screening] [--fp-rate 0.001]
+    python scripts/build_screening_index.py --benchmark 5000000
+"""
+
+import argparse
+import os
+import secrets
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils.address_screening import INDEX_SUFFIX, ScreeningIndex, build_index
+
+
+def read_addresses(path):
+    with open(path, encoding='utf-8', errors='replace') as fh:
+        for line in fh:
+            entry = line.split('#', 1)[0].strip()
+            if entry:
+                yield entry.split(',', 1)[0].strip().strip('"')
+
+
+def benchmark(count, fp_rate):
+    listed = ['0x' + secrets.token_hex(20) for _ in range(count)]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench' + INDEX_SUFFIX)
+        start = time.perf_counter()
+        build_index(listed, path, fp_rate)
+        print(f"Built {count:,} entries in {time.perf_counter() - start:.1f}s "
+              f"({os.path.getsize(path) / 1e6:.1f} MB)")
+
+        index = ScreeningIndex(path)
+        probes = ['0x' + secrets.token_hex(20) for _ in range(100000)]
+        start = time.perf_counter()
+        false_hits = sum(1 for address in probes if address in index)
+        elapsed = time.perf_counter() - start
+        print(f"Clean lookups: {elapsed / len(probes) * 1e6:.2f}us each ({false_hits} false positives)")
+
+        probes = listed[:100000]
+        start = time.perf_counter()
+        hits = sum(1 for address in probes if address in index)
+        elapsed = time.perf_counter() - start
+        print(f"Listed lookups: {elapsed / len(probes) * 1e6:.2f}us each ({hits:,} hits)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('source', nargs='?', help='Address list file')
+    parser.add_argument('--name', help='List name (defaults to the source file name)')
+    parser.add_argument('--output-dir', default=os.getenv('SCREENING_INDEX_DIR', os.path.join('instance', 'screening')))
+    parser.add_argument('--fp-rate', type=float, default=0.001, help='Bloom filter false positive rate')
+    parser.add_argument('--benchmark', type=int, metavar='N', help='Build and probe N random addresses instead')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.benchmark, args.fp_rate)
+        return
+    if not args.source:
+        parser.error('source is required')
+
+    name = args.name or os.path.splitext(os.path.basename(args.source))[0]
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, name + INDEX_SUFFIX)
+    start = time.perf_counter()
+    count = build_index(read_addresses(args.source), path, args.fp_rate)
+    print(f"Wrote {count:,} addresses to {path} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()